@@ -0,0 +1,9 @@
+"""Benchmarks for pkmodel.
+
+The benchmark classes follow the conventions of airspeed velocity (asv): ``setup`` prepares the inputs,
+and every ``time_*`` method is timed, for each combination of ``params`` if given. They can be run
+offline, without asv, with
+
+    python -m benchmarks.run [filter] [--output results.json] [--compare baseline.json]
+
+"""
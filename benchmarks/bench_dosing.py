@@ -0,0 +1,48 @@
+# Benchmarks of dosing functions
+
+import numpy as np
+
+from pkmodel import dose_steady, DoseWindows, PKModel
+from pkmodel.dosing import DosingSchedule
+
+
+class DoseSteady:
+    """Time one evaluation of dose_steady with a growing number of windows."""
+
+    params = [[1, 10, 100, 1000]]
+    param_names = ["windows"]
+
+    def setup(self, windows):
+        self.times = [[i, i + 0.5] for i in range(windows)]
+        self.windows = DoseWindows(self.times)
+        self.t = windows / 2 + 0.7
+
+    def time_dose_steady_list(self, windows):
+        dose_steady(self.t, None, 1, self.times)
+
+    def time_dose_steady_windows(self, windows):
+        dose_steady(self.t, None, 1, self.windows)
+
+    def time_dose_steady_vectorized(self, windows):
+        dose_steady(np.linspace(0, windows, 1000), None, 1, self.windows)
+
+
+class Regimen:
+    """Time solving a two-compartment model with a growing number of repeated doses."""
+
+    params = [[10, 100, 500], ["bolus", "infusion"]]
+    param_names = ["doses", "kind"]
+
+    def setup(self, doses, kind):
+        self.model = PKModel()
+        self.model.create_model("main", 1, dosing_time_constant=0)
+        self.model.add_sibling("main", "peripheral", 0.5, connection_time_constant=0.5)
+        duration = 0 if kind == "bolus" else 0.1
+        self.schedule = DosingSchedule().add_regimen("main", 1, 0, 1, doses, duration=duration)
+        self.t_eval = np.linspace(0, doses, 10 * doses)
+
+    def time_solve(self, doses, kind):
+        self.model.solve(self.t_eval, np.zeros(2), schedule=self.schedule)
+
+    def time_solve_analytic(self, doses, kind):
+        self.model.solve(self.t_eval, np.zeros(2), schedule=self.schedule, engine="analytic")
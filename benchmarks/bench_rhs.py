@@ -0,0 +1,54 @@
+# Benchmarks of single evaluations of the right hand side of the model ODEs
+
+import numpy as np
+
+from .models import TUTORIAL_MODELS, TOPOLOGIES
+
+
+class TutorialRHS:
+    """Time one evaluation of dq/dt for the TUTORIAL.py models."""
+
+    params = [list(TUTORIAL_MODELS)]
+    param_names = ["model"]
+
+    def setup(self, model):
+        self.model = TUTORIAL_MODELS[model]()
+        self.compiled = self.model.compile()
+        self.q = np.linspace(0.1, 1, len(self.model.get_compartment_names))
+
+    def time_differential_eq(self, model):
+        self.model.differential_eq(0.5, self.q)
+
+    def time_compiled_differential_eq(self, model):
+        self.compiled.differential_eq(0.5, self.q)
+
+
+class ScalingRHS:
+    """Time one evaluation of dq/dt with a growing number of compartments."""
+
+    params = [list(TOPOLOGIES), [5, 20, 80]]
+    param_names = ["topology", "n"]
+
+    def setup(self, topology, n):
+        self.model = TOPOLOGIES[topology](n)
+        self.compiled = self.model.compile()
+        self.q = np.linspace(0.1, 1, n)
+
+    def time_differential_eq(self, topology, n):
+        self.model.differential_eq(0.5, self.q)
+
+    def time_compiled_differential_eq(self, topology, n):
+        self.compiled.differential_eq(0.5, self.q)
+
+
+class Construction:
+    """Time building and compiling models with a growing number of compartments."""
+
+    params = [list(TOPOLOGIES), [5, 20, 80]]
+    param_names = ["topology", "n"]
+
+    def time_build(self, topology, n):
+        TOPOLOGIES[topology](n)
+
+    def time_build_and_compile(self, topology, n):
+        TOPOLOGIES[topology](n).compile()
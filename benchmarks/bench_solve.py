@@ -0,0 +1,53 @@
+# Benchmarks of complete solves
+
+import numpy as np
+
+from .models import TUTORIAL_MODELS, TOPOLOGIES
+
+
+class TutorialSolve:
+    """Time solving the TUTORIAL.py models over 1000 time points."""
+
+    params = [list(TUTORIAL_MODELS), ["RK45", "BDF"]]
+    param_names = ["model", "method"]
+
+    def setup(self, model, method):
+        self.model = TUTORIAL_MODELS[model]()
+        self.t_eval = np.linspace(0, 10, 1000)
+        self.q0 = np.zeros(len(self.model.get_compartment_names))
+
+    def time_solve(self, model, method):
+        self.model.solve(self.t_eval, self.q0, method=method)
+
+
+class TutorialSolveAnalytic:
+    """Time solving the linear TUTORIAL.py models exactly over 10000 time points."""
+
+    params = [["two_compartments", "three_compartments", "multiple_injections"]]
+    param_names = ["model"]
+
+    def setup(self, model):
+        self.model = TUTORIAL_MODELS[model]()
+        self.t_eval = np.linspace(0, 10, 10000)
+        self.q0 = np.zeros(len(self.model.get_compartment_names))
+
+    def time_solve_analytic(self, model):
+        self.model.solve(self.t_eval, self.q0, engine="analytic")
+
+
+class ScalingSolve:
+    """Time solving models with a growing number of compartments."""
+
+    params = [list(TOPOLOGIES), [5, 20, 80]]
+    param_names = ["topology", "n"]
+
+    def setup(self, topology, n):
+        self.model = TOPOLOGIES[topology](n)
+        self.t_eval = np.linspace(0, 5, 100)
+        self.q0 = np.zeros(n)
+
+    def time_solve(self, topology, n):
+        self.model.solve(self.t_eval, self.q0)
+
+    def time_solve_bdf(self, topology, n):
+        self.model.solve(self.t_eval, self.q0, method="BDF")
@@ -0,0 +1,136 @@
+# This holds the model topologies used throughout the benchmarks
+
+import numpy as np
+
+from pkmodel import PKModel, dose_steady, first_order
+from pkmodel.rates import FirstOrderRate
+
+
+def two_compartments():
+    """Main compartment in equilibrium with a peripheral compartment, as in TUTORIAL.py."""
+    model = PKModel()
+    model.create_model("main", 1, dosing_time_constant=1, elimination_time_constant=1)
+    model.add_sibling("main", "peripheral", 0.5, connection_time_constant=0.5)
+    return model
+
+
+def three_compartments():
+    """Two compartments with a subcutaneous pre-compartment, as in TUTORIAL.py."""
+    model = two_compartments()
+    model.add_parent("main", "subcutaneous", 0.05, connection_time_constant=0.1)
+    return model
+
+
+def multiple_injections():
+    """Three compartments dosed within three time windows, as in TUTORIAL.py."""
+    model = PKModel()
+    model.create_model(
+        "main",
+        1,
+        dosing_func=dose_steady,
+        dosing_time_constant=1,
+        dosing_time_windows=[(0, 0.1), (1, 1.1), (2, 2.2)],
+        elimination_time_constant=1,
+    )
+    model.add_sibling("main", "peripheral", 0.5, connection_time_constant=0.5)
+    model.add_parent("main", "subcutaneous", 0.05, connection_time_constant=0.1)
+    return model
+
+
+def _sin_dosing(t, q):
+    return 1 - np.cos(2 * np.pi * t)
+
+
+def sin_two_compartments():
+    """Two compartments with a user-defined, cos-shaped dosing protocol, as in TUTORIAL.py."""
+    model = PKModel()
+    model.create_model("main", 1, dosing_func=_sin_dosing)
+    model.add_sibling("main", "peripheral", 0.5, connection_time_constant=0.5)
+    return model
+
+
+def _main_loss(t, q):
+    return 0.1 * q[0] ** 2
+
+
+def _peripheral_loss(t, q):
+    return first_order(t, q, 0.2, 1)
+
+
+def double_loss():
+    """Two compartments with a user-defined second-order loss, as in TUTORIAL.py."""
+    model = PKModel()
+    model.create_model(
+        "main", 1, dosing_func=dose_steady, dosing_time_windows=[(0, 0.1)], dosing_time_constant=10, elimination_func=_main_loss
+    )
+    model.add_sibling("main", "peripheral", 0.5, connection_time_constant=0.2)
+    model.add_output("peripheral", _peripheral_loss, label="per. loss")
+    return model
+
+
+def _periodic_injections(t, q):
+    return 1 if np.mod(t, 1) < 0.1 and t < 8 else 0
+
+
+def _rhenal_clearance(t, q):
+    return 0.1 * q[3]
+
+
+def _metabolism(t, q):
+    return 0.3 * q[4]
+
+
+def complex_system():
+    """Five compartments with user-defined dosing and clearance, as in TUTORIAL.py."""
+    model = PKModel()
+    model.create_model("main", 1, dosing_func=_periodic_injections, elimination_time_constant=0.2)
+    model.add_sibling("main", "peripheral", 0.5, connection_time_constant=0.5)
+    model.add_parent("main", "subcutaneous", 0.05, connection_time_constant=0.1)
+    model.add_sibling("main", "kidney", 3, connection_time_constant=0.2)
+    model.add_sibling("main", "liver", 1.2, connection_time_constant=0.3)
+    model.add_output("kidney", _rhenal_clearance, label="rh. clear.")
+    model.add_output("liver", _metabolism, label="metab.")
+    return model
+
+
+TUTORIAL_MODELS = {
+    "two_compartments": two_compartments,
+    "three_compartments": three_compartments,
+    "multiple_injections": multiple_injections,
+    "sin_two_compartments": sin_two_compartments,
+    "double_loss": double_loss,
+    "complex_system": complex_system,
+}
+
+
+def chain(n: int):
+    """Transit chain of n compartments, built by repeatedly adding children to the last compartment."""
+    model = PKModel()
+    model.create_model("c0", 1)
+    for i in range(1, n):
+        model.add_child("c%d" % (i - 1), "c%d" % i, 1, connection_time_constant=0.5)
+    return model
+
+
+def star(n: int):
+    """Main compartment with n - 1 sibling compartments in equilibrium with it."""
+    model = PKModel()
+    model.create_model("main", 1)
+    for i in range(1, n):
+        model.add_sibling("main", "s%d" % i, 1 + 0.1 * i, connection_time_constant=0.5)
+    return model
+
+
+def fully_connected(n: int):
+    """Star of siblings, in which additionally every pair of siblings exchanges drug by first-order processes."""
+    model = star(n)
+    for i in range(1, n):
+        for j in range(1, n):
+            if i != j:
+                exchange = FirstOrderRate(0.1, i)
+                model.add_output("s%d" % i, exchange, label="s%d" % j)
+                model.add_input("s%d" % j, exchange, label="s%d" % i)
+    return model
+
+
+TOPOLOGIES = {"chain": chain, "star": star, "fully_connected": fully_connected}
@@ -0,0 +1,104 @@
+# This holds an offline runner for the asv-style benchmark classes, which needs nothing beyond the standard library
+
+import argparse
+import importlib
+import inspect
+import itertools
+import json
+import pkgutil
+import sys
+import timeit
+
+import benchmarks
+
+
+def discover(pattern: str = "") -> list:
+    """Collect all benchmarks of the bench_* modules of this package.
+
+    :param pattern: (optional) Only keep benchmarks whose name contains this string. Default: ""
+    :returns:       list of (name, class, method name, parameter tuple) of each benchmark.
+    """
+    found = []
+    for module_info in pkgutil.iter_modules(benchmarks.__path__):
+        if not module_info.name.startswith("bench_"):
+            continue
+        module = importlib.import_module("benchmarks." + module_info.name)
+        for class_name, cls in inspect.getmembers(module, inspect.isclass):
+            if cls.__module__ != module.__name__:
+                continue
+            params = list(itertools.product(*cls.params)) if hasattr(cls, "params") else [()]
+            for method_name in sorted(m for m in vars(cls) if m.startswith("time_")):
+                for param in params:
+                    name = "%s.%s.%s" % (module_info.name, class_name, method_name)
+                    if param:
+                        name += "(%s)" % ", ".join(str(p) for p in param)
+                    if pattern in name:
+                        found.append((name, cls, method_name, param))
+    return found
+
+
+def measure(cls, method_name: str, param: tuple, repeat: int = 5) -> float:
+    """Time a single benchmark, like asv does: setup once, then the best of several repeats of as many calls
+    as fit into about 0.2 seconds.
+
+    :param cls:         Benchmark class.
+    :param method_name: Name of the time_* method.
+    :param param:       Tuple of parameters passed to setup and the method.
+    :param repeat:      (optional) Number of repeats. Default: 5
+    :returns:           Best time per call, in seconds.
+    """
+    instance = cls()
+    if hasattr(instance, "setup"):
+        instance.setup(*param)
+    method = getattr(instance, method_name)
+    timer = timeit.Timer(lambda: method(*param))
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def _format(seconds: float) -> str:
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return "%8.3f %-2s" % (seconds / scale, unit)
+    return "%8.3f ns" % (seconds / 1e-9)
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="Run the pkmodel benchmarks offline.")
+    parser.add_argument("pattern", nargs="?", default="", help="only run benchmarks whose name contains this")
+    parser.add_argument("--repeat", type=int, default=5, help="number of repeats per benchmark (default: 5)")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="compare against the results in this JSON file")
+    parser.add_argument(
+        "--threshold", type=float, default=1.2, help="slowdown ratio reported as a regression (default: 1.2)"
+    )
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+
+    results = {}
+    regressions = []
+    for name, cls, method_name, param in discover(args.pattern):
+        results[name] = measure(cls, method_name, param, args.repeat)
+        line = "%-90s %s" % (name, _format(results[name]))
+        if name in baseline:
+            ratio = results[name] / baseline[name]
+            line += "  x%.2f" % ratio
+            if ratio > args.threshold:
+                line += "  REGRESSION"
+                regressions.append(name)
+        print(line, flush=True)
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+    if regressions:
+        print("%d benchmark(s) slower than x%.2f of the baseline" % (len(regressions), args.threshold))
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -15,5 +15,14 @@ from .version_info import VERSION_INT, VERSION  # noqa
 
 from .pk_model import PKModel
 from .compartment import Compartment
-from .functions import zeroth_order, first_order, dose_constant, dose_steady
-from .pkanalysis import plot_solution
+from .graph import CompartmentGraph
+from .compiled import CompiledModel
+from .functions import zeroth_order, first_order, dose_constant, dose_steady, DoseWindows, vectorized, is_vectorized
+from .rates import ZerothOrderRate, FirstOrderRate, DoseConstantRate, DoseSteadyRate, ShiftedRate
+from .dosing import DosingSchedule
+from .profiling import SolverProfile
+from .streaming import RunningSummary
+from .adaptive import DenseSolution
+from .store import save_solution, SolutionWriter, StoredSolution
+from .cache import SolveCache
+from .pkanalysis import plot_solution, metrics
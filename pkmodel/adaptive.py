@@ -0,0 +1,138 @@
+# This holds the adaptive output sampling behind PKModel.solve_adaptive, and the interpolant of its solutions
+
+import numpy as np
+
+# Points within an interval at which the straight line between its ends is checked against the dense output
+_PROBES = np.array([0.25, 0.5, 0.75])
+
+
+class DenseSolution:
+    """Continuous solution of a model over a time span, made up of the dense output of the solver on each
+    segment in between breakpoints, so that it can be evaluated at any later time point without solving again.
+    As for PKModel.solve, the value at the time of a bolus is the one after the bolus.
+
+    Fields:
+        -   edges:      Array of the start times of all segments, followed by the end of the time span.
+        -   segments:   List of the scipy OdeSolution of each segment.
+        -   final_jump: Boluses applied at the end of the time span.
+
+    Methods:
+        -   __init__:   Set up the solution from its segments.
+        -   __call__:   Evaluate the solution.
+    """
+
+    def __init__(self, edges: np.ndarray, segments: list, final_jump: np.ndarray) -> None:
+        self.edges = np.asarray(edges, dtype=float)
+        self.segments = segments
+        self.final_jump = final_jump
+
+    def __call__(self, t) -> np.ndarray:
+        """Evaluate the solution.
+
+        :param t:   Time point, or array of time points, within the time span.
+        :returns:   Array of the drug mass in each compartment, of shape (n, points) for an array t.
+        """
+        times = np.atleast_1d(np.asarray(t, dtype=float))
+        if np.any(times < self.edges[0]) or np.any(times > self.edges[-1]):
+            raise ValueError("The solution can only be evaluated within its time span.")
+        index = np.minimum(np.searchsorted(self.edges, times, side="right") - 1, len(self.segments) - 1)
+        y = np.empty((len(self.final_jump), len(times)))
+        for i in np.unique(index):
+            y[:, index == i] = self.segments[i](times[index == i])
+        y[:, times == self.edges[-1]] += self.final_jump[:, None]
+        return y[:, 0] if np.ndim(t) == 0 else y
+
+
+def sample(sol, times: np.ndarray, rtol: float, atol: float) -> np.ndarray:
+    """Choose output points from the dense output of a solver, such that the straight lines in between them follow the
+    solution within the tolerances. Starting from the steps of the solver, every interval which is not followed closely
+    enough at a few points in between is bisected, until it is, so that points end up where the solution curves.
+
+    :param sol:     Dense output, ie a function of an array of time points returning an array of shape (n, points).
+    :param times:   Sorted array of initial time points, including both ends of the interval of sol.
+    :param rtol:    Relative tolerance of the linear interpolation.
+    :param atol:    Absolute tolerance of the linear interpolation.
+    :returns:       Sorted array of the output time points.
+    """
+    min_width = 1e-9 * (times[-1] - times[0])
+    accepted = [times]
+    lower, upper = times[:-1], times[1:]
+    while len(lower):
+        probes = lower[:, None] + (upper - lower)[:, None] * _PROBES
+        y_lower, y_upper = sol(lower), sol(upper)
+        y_probes = sol(probes.ravel()).reshape(-1, len(lower), len(_PROBES))
+        chords = y_lower[:, :, None] + (y_upper - y_lower)[:, :, None] * _PROBES
+        within = np.abs(y_probes - chords) <= atol + rtol * np.abs(y_probes)
+        refine = ~within.all(axis=(0, 2)) & (upper - lower > min_width)
+        middle = 0.5 * (lower[refine] + upper[refine])
+        accepted.append(middle)
+        lower, upper = np.concatenate([lower[refine], middle]), np.concatenate([middle, upper[refine]])
+    return np.unique(np.concatenate(accepted))
+
+
+def integrate_adaptive(compiled, t_span: tuple, q0: np.ndarray, method: str, options: dict, rtol: float, atol: float):
+    """Integrate a compiled model over a time span with dense output, and sample the output points adaptively.
+    The span is split at the breakpoints of the compiled model, which are always output points, as are both the values
+    before and after any bolus.
+
+    :param compiled:    CompiledModel to integrate.
+    :param t_span:      Tuple (t0, tf) of the start and end of the integration.
+    :param q0:          Initial conditions of mass distribution in compartments.
+    :param method:      Integration method passed to scipy.integrate.solve_ivp.
+    :param options:     Further keyword arguments of scipy.integrate.solve_ivp, eg the Jacobian.
+    :param rtol:        Relative tolerance of the linear interpolation of the output, the solver using a tenth of it.
+    :param atol:        Absolute tolerance of the linear interpolation of the output, the solver using a tenth of it.
+    :returns:           Result object with fields t and y of the output points, and the DenseSolution as field 'sol'.
+    """
+    import scipy.integrate
+    import scipy.optimize
+
+    t0, tf = float(t_span[0]), float(t_span[1])
+    edges = np.concatenate([[t0], compiled.breakpoints(t0, tf), [tf]])
+    q = np.asarray(q0, dtype=float) + compiled.jump(t0)
+    t_out, y_out, segments = [np.empty(0)], [np.empty((len(q), 0))], []
+    counts = {"nfev": 0, "njev": 0, "nlu": 0}
+    status, message = 0, "The solver successfully reached the end of the integration interval."
+
+    for a, b in zip(edges[:-1], edges[1:]):
+        forcing = compiled.forcing(0.5 * (a + b))
+        segment = scipy.integrate.solve_ivp(
+            fun=lambda t, q: compiled.differential_eq(t, q, forcing),
+            t_span=[a, b],
+            y0=q,
+            method=method,
+            dense_output=True,
+            rtol=rtol / 10,
+            atol=atol / 10,
+            **options,
+        )
+        for key in counts:
+            counts[key] += segment[key]
+        if not segment.success:
+            status, message = segment.status, segment.message
+            break
+        segments.append(segment.sol)
+        t_segment = sample(segment.sol, segment.t, rtol, atol)
+        t_out.append(t_segment)
+        y_out.append(segment.sol(t_segment))
+        # The next segment starts after the bolus, at the same time point as the end of this one
+        q = segment.y[:, -1] + compiled.jump(b)
+        if b != tf and not np.any(compiled.jump(b)):
+            t_out[-1], y_out[-1] = t_out[-1][:-1], y_out[-1][:, :-1]
+
+    t, y = np.concatenate(t_out), np.concatenate(y_out, axis=1)
+    sol = None
+    if status == 0:
+        y[:, -1] += compiled.jump(tf)
+        sol = DenseSolution(edges, segments, compiled.jump(tf))
+    return scipy.optimize.OptimizeResult(
+        t=t,
+        y=y,
+        sol=sol,
+        t_events=None,
+        y_events=None,
+        status=status,
+        message=message,
+        success=status >= 0,
+        **counts,
+    )
@@ -0,0 +1,175 @@
+# This holds the SolveCache class, an opt-in cache of PKModel.solve results
+
+import collections
+import hashlib
+import json
+import os
+
+import numpy as np
+
+_FIELDS = ("status", "message", "success", "nfev", "njev", "nlu")
+
+
+def _schedule_description(schedule) -> dict:
+    """Describe a dosing schedule as plain data.
+
+    :param schedule:    DosingSchedule, or None.
+    :returns:           Dictionary of the sorted boluses and infusions, or None.
+    """
+    if schedule is None:
+        return None
+    return {"boluses": sorted(schedule.boluses), "infusions": sorted(schedule.infusions)}
+
+
+def _copy(result):
+    """Copy a cached result, so that callers cannot change the cache by changing the result.
+
+    :param result:  Result object with fields t and y.
+    :returns:       New result object with copies of t and y.
+    """
+    import scipy.optimize
+
+    fields = {field: result[field] for field in _FIELDS if field in result}
+    return scipy.optimize.OptimizeResult(
+        t=np.array(result.t), y=np.array(result.y), sol=None, t_events=None, y_events=None, **fields
+    )
+
+
+class SolveCache:
+    """Class to cache the results of PKModel.solve, see its cache argument. Results are kept in memory up to maxsize
+    entries, evicting the least recently used one, and optionally on disk in a directory of .npz files bounded by
+    max_bytes. The key is a hash of a canonical description of the model, ie its specification (see PKModel.to_spec)
+    and parameter values, together with q0, t_eval and the solver options. Models built from lambdas or nested
+    functions have no specification and are solved without caching. User-defined functions are described by their
+    module and name, so the cache needs to be cleared if such a function is changed.
+
+    Fields:
+        -   maxsize:    Maximum number of results held in memory.
+        -   directory:  Directory of the on-disk cache, or None.
+        -   max_bytes:  Maximum total size of the on-disk cache, or None for no bound.
+        -   hits:       Number of results found in the cache.
+        -   misses:     Number of results which had to be computed.
+
+    Methods:
+        -   __init__:   Set up an empty cache.
+        -   key:        Canonical hash of a solve.
+        -   get:        Look up a result.
+        -   put:        Add a result.
+        -   clear:      Remove all results, in memory and on disk.
+    """
+
+    def __init__(self, maxsize: int = 128, directory: str = None, max_bytes: int = None) -> None:
+        """Set up an empty cache.
+
+        :param maxsize:     (optional) Maximum number of results held in memory. Default: 128
+        :param directory:   (optional) Directory to also keep results in on disk, which is created if needed. Default: None
+        :param max_bytes:   (optional) Maximum total size of the .npz files in the directory. Default: None, ie no bound
+        """
+        self.maxsize = maxsize
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._memory = collections.OrderedDict()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(model, t_eval: np.ndarray, q0: np.ndarray, options: dict, schedule=None) -> str:
+        """Hash a canonical description of a solve.
+
+        :param model:       PKModel
+        :param t_eval:      Array of time-points of interest.
+        :param q0:          Initial conditions of mass distribution in compartments.
+        :param options:     Dictionary of json-serializable solver options, eg method, sparse and engine.
+        :param schedule:    (optional) DosingSchedule. Default: None
+        :returns:           Hexadecimal sha256 hash, or None if the model cannot be described, ie holds lambdas.
+        """
+        try:
+            model_spec = model.to_spec()
+        except TypeError:
+            return None
+        description = json.dumps(
+            {
+                "spec": model_spec,
+                "parameters": model.parameters,
+                "options": options,
+                "schedule": _schedule_description(schedule),
+            },
+            sort_keys=True,
+            default=str,
+        )
+        digest = hashlib.sha256(description.encode())
+        for array in (t_eval, q0):
+            array = np.ascontiguousarray(array, dtype=float)
+            digest.update(str(array.shape).encode())
+            digest.update(array.tobytes())
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ".npz")
+
+    def get(self, key: str):
+        """Look up a result, first in memory, then on disk.
+
+        :param key:     Hash, as returned by SolveCache.key.
+        :returns:       Copy of the result, or None if it is not cached.
+        """
+        import scipy.optimize
+
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return _copy(self._memory[key])
+        if self.directory is not None and os.path.exists(self._path(key)):
+            with np.load(self._path(key)) as file:
+                result = scipy.optimize.OptimizeResult(t=file["t"], y=file["y"], **json.loads(str(file["fields"])))
+            # Touch the file, so that the on-disk cache is evicted in least recently used order as well
+            os.utime(self._path(key))
+            self._remember(key, result)
+            self.hits += 1
+            return _copy(result)
+        self.misses += 1
+        return None
+
+    def put(self, key: str, result) -> None:
+        """Add a result to the cache, evicting the least recently used results beyond the bounds.
+
+        :param key:     Hash, as returned by SolveCache.key.
+        :param result:  Result object with fields t and y, as returned by PKModel.solve.
+        """
+        result = _copy(result)
+        self._remember(key, result)
+        if self.directory is not None:
+            fields = json.dumps({field: result[field] for field in _FIELDS if field in result}, default=str)
+            np.savez(self._path(key), t=result.t, y=result.y, fields=fields)
+            self._evict_files()
+
+    def _remember(self, key: str, result) -> None:
+        self._memory[key] = result
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.maxsize:
+            self._memory.popitem(last=False)
+
+    def _evict_files(self) -> None:
+        """Delete the least recently used files of the on-disk cache until it fits into max_bytes."""
+        if self.max_bytes is None:
+            return
+        paths = [os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith(".npz")]
+        paths.sort(key=os.path.getmtime)
+        total = sum(os.path.getsize(path) for path in paths)
+        while paths and total > self.max_bytes:
+            path = paths.pop(0)
+            total -= os.path.getsize(path)
+            os.remove(path)
+
+    def clear(self) -> None:
+        """Remove all results, in memory and on disk."""
+        self._memory.clear()
+        if self.directory is not None:
+            for name in os.listdir(self.directory):
+                if name.endswith(".npz"):
+                    os.remove(os.path.join(self.directory, name))
+
+    def __len__(self) -> int:
+        return len(self._memory)
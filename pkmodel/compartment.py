@@ -1,39 +1,71 @@
 # This holds the Compartment class
 
+from .functions import is_vectorized
+from .graph import CompartmentGraph
+
 
 class Compartment:
     """Class to represent a pharmacological compartment, to be used in generating
     a graph of compartments in the PKModel class. Functionality is to sum
     up the appropriate partial differential equation for this compartment.
 
+    A Compartment is a lightweight view of one compartment of a CompartmentGraph, which holds the volume and
+    the in/output functions. A Compartment created on its own is the view of a graph of its own.
+
     Fields:
         -   index:          Index of this Compartment within the PKModel
-        -   volume:         Volume of this Compartment
-        -   input_funcs:    List of all input functions leading into this compartment
-        -   output_funcs:   List of all output function leading from this compartment
 
     Methods:
         -   __init__:           Initialise all fields of the class
         -   differential_eq:    Sum of inputs and outputs to arrive at RHS of dq_i/dt
+    Properties:
+        -   volume:             Volume of this Compartment
+        -   input_funcs:        Tuple of all input functions leading into this compartment
+        -   output_funcs:       Tuple of all output function leading from this compartment
+        -   vectorized:         Whether all in/output functions support evaluation at many points at once
     """
 
-    def __init__(self, index: float, volume: float, in_func, out_func) -> None:
-        """Method to initialise a new Compartment with some baseline functionality.
+    __slots__ = ("index", "_graph", "_row")
+
+    def __init__(self, index: int, volume: float = None, in_func=None, out_func=None, graph: CompartmentGraph = None) -> None:
+        """Method to initialise a new Compartment with some baseline functionality, or a view of a compartment of a graph.
 
-        :param index: Index of the Compartment within the PKModel
-        :param volume: Volume of the Compartment to be used for PK modelling functionality.
-        :param in_func: First input function the Compartment is set up with, eg. dosing function.
-        :param out_func: First output function the Compartment is set up with, eg. circulation elimination.
+        :param index:       Index of the Compartment within the PKModel
+        :param volume:      Volume of the Compartment to be used for PK modelling functionality. Ignored for views.
+        :param in_func:     First input function the Compartment is set up with, eg. dosing function. Ignored for views.
+        :param out_func:    First output function the Compartment is set up with, eg. circulation elimination. Ignored for views.
+        :param graph:       (optional) CompartmentGraph holding the compartment at the index, to create a view of. Default: None
         """
-        self.input_funcs = [in_func] if in_func is not None else []
-        self.output_funcs = [out_func] if out_func is not None else []
         self.index = index
-        self.volume = volume
+        if graph is not None:
+            self._graph, self._row = graph, index
+            return
+        self._graph, self._row = CompartmentGraph(), 0
+        self._graph.add_compartment(str(index), volume)
+        if in_func is not None:
+            self._graph.add_flow(in_func, target=0)
+        if out_func is not None:
+            self._graph.add_flow(out_func, source=0)
+
+    @property
+    def volume(self) -> float:
+        return self._graph.volumes[self._row]
+
+    @property
+    def input_funcs(self) -> tuple:
+        return tuple(self._graph.funcs[flow] for flow in self._graph.inputs(self._row))
+
+    @property
+    def output_funcs(self) -> tuple:
+        return tuple(self._graph.funcs[flow] for flow in self._graph.outputs(self._row))
 
     def differential_eq(self, t: float, q: list) -> float:
         """Method to return the overall RHS of the
         differential equation dq_i / dt = differential_eq(t,q) for this Compartment.
 
+        If all functions are vectorized (see the vectorized property), t may also be an array of time points
+        and q a 2d array of shape (compartments, points), in which case the RHS is returned for each point.
+
         :param t: Time point
         :param q: Vector (list) of drug mass in all compartments.
         :returns: Value of the RHS of the compartment differential equation.
@@ -44,3 +76,11 @@ class Compartment:
             )
         except TypeError:
             raise TypeError("All inputs and outputs must be functions which take 2 arguments: time t and mass distribution vector q.")
+
+    @property
+    def vectorized(self) -> bool:
+        """Check whether all in/output functions were declared as vectorized, see functions.vectorized.
+
+        :returns: True if differential_eq supports array-valued t and 2d q.
+        """
+        return all(is_vectorized(func) for func in self.input_funcs + self.output_funcs)
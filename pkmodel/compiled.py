@@ -0,0 +1,577 @@
+# This holds the CompiledModel class
+
+import numpy as np
+import scipy.sparse
+
+from .functions import DoseWindows, is_vectorized
+from .rates import (
+    ZerothOrderRate,
+    FirstOrderRate,
+    DoseConstantRate,
+    DoseSteadyRate,
+    ShiftedRate,
+)
+
+
+class _Coefficient:
+    """Value of a lowered coefficient, together with its dependence on the named model parameters:
+    value = constant * parameters[parameter] * product of parameters[name] ** exponent over all exponents.
+
+    Fields:
+        -   value:      Numerical value of the coefficient.
+        -   constant:   Constant prefactor.
+        -   parameter:  Name of the parameter the coefficient is proportional to, or None.
+        -   exponents:  Dictionary of volume parameter names and the power they enter with.
+
+    Methods:
+        -   scaled:     Scale the coefficient.
+        -   evaluate:   Value for a different set of parameter values.
+        -   derivative: Derivative with respect to a named parameter.
+        -   depends_on: Whether the coefficient depends on any of some named parameters.
+    """
+
+    def __init__(self, value: float, parameter: str = None, volume: str = None) -> None:
+        self.value = value
+        if parameter is None:
+            self.constant, self.parameter, self.exponents = value, None, dict()
+        else:
+            self.constant, self.parameter = 1, parameter
+            self.exponents = {volume: -1} if volume is not None else dict()
+
+    def scaled(self, scale: float, volumes: list = None):
+        """Scale the coefficient, either by a constant, or by a product of ratios of volume parameters.
+
+        :param scale:   Numerical value of the scale.
+        :param volumes: (optional) List of the (numerator, denominator) names of the volume parameters of the scale.
+        :returns:       New scaled _Coefficient.
+        """
+        scaled = _Coefficient(self.value * scale)
+        scaled.parameter = self.parameter
+        scaled.exponents = dict(self.exponents)
+        if volumes is None:
+            scaled.constant = self.constant * scale
+        else:
+            scaled.constant = self.constant
+            for ratio in volumes:
+                for name, exponent in zip(ratio, (1, -1)):
+                    scaled.exponents[name] = scaled.exponents.get(name, 0) + exponent
+            scaled.exponents = {name: e for name, e in scaled.exponents.items() if e != 0}
+        return scaled
+
+    def evaluate(self, values: dict):
+        """Evaluate the coefficient for a different set of parameter values.
+
+        :param values:  Dictionary of parameter names and values (scalars or arrays).
+        :returns:       Value of the coefficient, of the shape of the parameter values.
+        """
+        result = self.constant
+        if self.parameter is not None:
+            result = result * values[self.parameter]
+        for name, exponent in self.exponents.items():
+            result = result * values[name] ** exponent
+        return result
+
+    def derivative(self, name: str, values: dict) -> float:
+        """Differentiate the coefficient with respect to a named parameter.
+
+        :param name:    Name of the parameter.
+        :param values:  Dictionary of parameter names and values.
+        :returns:       Value of the derivative.
+        """
+        power = (self.parameter == name) + self.exponents.get(name, 0)
+        if power == 0:
+            return 0.0
+        result = self.constant * power * values[name] ** (power - 1)
+        if self.parameter is not None and self.parameter != name:
+            result = result * values[self.parameter]
+        for volume, exponent in self.exponents.items():
+            if volume != name:
+                result = result * values[volume] ** exponent
+        return result
+
+    def depends_on(self, names: set) -> bool:
+        """Check whether the coefficient depends on any of some named parameters.
+
+        :param names:   Set of parameter names.
+        :returns:       True if the value changes with any of the parameters.
+        """
+        return self.parameter in names or not names.isdisjoint(self.exponents)
+
+
+def _lower(func):
+    """Lower a rate function into its linear parts, if its structure is known.
+
+    :param func:    Rate function taking time t and mass distribution vector q.
+    :returns:       Tuple (linear, constant, windows), where linear is a list of (q_index, coefficient) pairs,
+                    constant a list of coefficients, and windows a list of (times, coefficient) steady dosing terms.
+                    None if the function is user-defined and cannot be lowered.
+    """
+    if isinstance(func, FirstOrderRate):
+        return [(func.q_index, _Coefficient(func.k, func.parameter, func.volume))], [], []
+    if isinstance(func, ZerothOrderRate):
+        return [], [_Coefficient(func.k, func.parameter)], []
+    if isinstance(func, DoseConstantRate):
+        return [], [_Coefficient(func.X, func.parameter)], []
+    if isinstance(func, DoseSteadyRate):
+        return [], [], [(func._windows, _Coefficient(func.X, func.parameter))]
+    if isinstance(func, ShiftedRate):
+        inner = _lower(func.func)
+        if inner is None:
+            return None
+        linear, constant, windows = inner
+        # q_index j of the inner function reads the entry q[index_map[j]]
+        index_map = dict(func.index_map)
+        return (
+            [(index_map.get(j, j), k.scaled(func.scale, func.volumes)) for j, k in linear],
+            [k.scaled(func.scale, func.volumes) for k in constant],
+            [(times, k.scaled(func.scale, func.volumes)) for times, k in windows],
+        )
+    return None
+
+
+def _assemble(terms: list, values: list, n: int, m: int, n_patients: int = 1) -> tuple:
+    """Assemble K, b and W of a (block-diagonal) model from its lowered terms. The state of patient p
+    occupies entries p * n to (p + 1) * n - 1, and steady dosing windows are shared by all patients.
+
+    :param terms:       List of (kind, row, column, sign, coefficient) lowered terms.
+    :param values:      List of arrays of length n_patients, holding the signed value of each term for each patient.
+    :param n / m:       Number of compartments / steady dosing terms of one patient.
+    :param n_patients:  (optional) Number of patients. Default: 1
+    :returns:           Tuple (K, b, W).
+    """
+    offsets = np.arange(n_patients) * n
+    entries = {"K": ([], [], []), "W": ([], [], [])}
+    b = np.zeros((n_patients, n))
+    for (kind, row, col, _, _), value in zip(terms, values):
+        if kind == "b":
+            b[:, row] += value
+            continue
+        rows, cols, data = entries[kind]
+        rows.append(offsets + row)
+        cols.append(offsets + col if kind == "K" else np.full(n_patients, col))
+        data.append(value)
+
+    shapes = {"K": (n * n_patients, n * n_patients), "W": (n * n_patients, m)}
+    K, W = [
+        # Duplicate entries are summed on conversion to CSR
+        scipy.sparse.csr_matrix(
+            (
+                np.concatenate(entries[kind][2] + [[]]),
+                (
+                    np.concatenate(entries[kind][0] + [[]]).astype(int),
+                    np.concatenate(entries[kind][1] + [[]]).astype(int),
+                ),
+            ),
+            shape=shapes[kind],
+        )
+        for kind in "KW"
+    ]
+    return K, b.ravel(), W
+
+
+def _sorted_times(t_eval) -> np.ndarray:
+    """Check that time points of interest are in increasing order, as both engines step through them forward in time.
+
+    :param t_eval:  Array of time-points of interest.
+    :returns:       t_eval as a float array.
+    """
+    t_eval = np.asarray(t_eval, dtype=float)
+    if np.any(np.diff(t_eval) < 0):
+        raise ValueError("t_eval needs to be sorted in increasing order.")
+    return t_eval
+
+
+def _rescaled(func, values: dict, patient: int = 0):
+    """Re-evaluate the scale of a residual shifted function from its volume parameters, as rates.reparametrize does,
+    on a copy, so that the function of the model itself is left unchanged.
+
+    :param func:    Residual rate function.
+    :param values:  Dictionary of all parameter names and their values, as scalars or arrays over patients.
+    :param patient: (optional) Index of the patient, for array-valued parameters. Default: 0
+    :returns:       Copy of a ShiftedRate with its volume ratios evaluated, or func itself if it has none.
+    """
+    if not isinstance(func, ShiftedRate) or func.volumes is None:
+        return func
+    ratios = [np.ravel(np.asarray(values[a], dtype=float) / np.asarray(values[b], dtype=float)) for a, b in func.volumes]
+    scale = float(np.prod([ratio[patient] if ratio.size > 1 else ratio[0] for ratio in ratios]))
+    return ShiftedRate(func.func, func.index_map, scale, func.volumes)
+
+
+class _PatientTerm:
+    """Residual term of a stacked model, which evaluates a user-defined function on the slice of q
+    belonging to one patient only.
+
+    Fields:
+        -   func:   Rate function taking time t and the mass distribution vector q of a single patient.
+        -   offset: Index of the first compartment of the patient within the stacked q.
+        -   n:      Number of compartments per patient.
+    """
+
+    def __init__(self, func, offset: int, n: int) -> None:
+        self.func = func
+        self.offset = offset
+        self.n = n
+        self.vectorized = is_vectorized(func)
+
+    def __call__(self, t: float, q: np.ndarray) -> float:
+        return self.func(t, q[self.offset:self.offset + self.n])
+
+
+class CompiledModel:
+    """Class to represent a PKModel lowered into the form dq/dt = K q + b(t) + r(t, q). All built-in rate
+    functions end up in the sparse rate matrix K and the forcing b(t), so that the RHS is evaluated by
+    a single matrix-vector product. User-defined functions which cannot be lowered are kept as residual
+    terms r(t, q), which are evaluated one by one as before.
+
+    The forcing is b(t) = b + W s(t), where the columns of W hold the doses of steady dosing terms
+    and s(t) indicates whether t lies within their windows. Boluses are instantaneous jumps of q, which
+    the solvers apply in between integration segments.
+
+    Fields:
+        -   K:              Sparse (CSR) rate matrix of first-order terms.
+        -   b:              Constant forcing vector of zeroth-order terms and constant doses.
+        -   W:              Sparse (CSR) matrix of the doses of steady dosing terms.
+        -   window_times:   List of the DoseWindows belonging to each column of W.
+        -   residual:       List of (index, sign, func) user-defined terms, sign being +1 for inputs and -1 for outputs.
+        -   boluses:        List of (time, index, amount) instantaneous doses.
+        -   terms:          List of (kind, row, column, sign, coefficient) lowered terms, kind being 'K', 'b' or 'W'.
+
+    Methods:
+        -   __init__:           Set up the compiled model from its matrices.
+        -   from_compartments:  Lower the functions of a list of Compartments.
+        -   from_graph:         Lower the flows of a CompartmentGraph.
+        -   breakpoints:        Times at which the forcing or the state may jump.
+        -   forcing:            Evaluate b(t).
+        -   _forcing_array:     Evaluate b(t) at many time points at once.
+        -   jump:               Sum of the boluses applied at a time point.
+        -   _switch_table:      Precompute s(t) in between all window edges.
+        -   differential_eq:    The complete set of differential equations for all compartments.
+        -   jacobian:           Jacobian of differential_eq, exact for lowered terms, finite differences for the residual.
+        -   with_values:        Re-evaluate the model for different parameter values.
+        -   update:             Re-evaluate in place the entries depending on some changed parameter values.
+        -   differentiate:      Derivatives of K, b and W with respect to a named parameter.
+        -   stack:              Build the block-diagonal model of many patients with different parameter values.
+        -   _residual_eq:       Contribution of the residual terms alone to dq/dt.
+    Properties:
+        -   is_linear:          Whether all terms could be lowered, ie there is no residual.
+        -   vectorized:         Whether all residual terms support evaluation at many points at once.
+        -   jac_sparsity:       Structural sparsity pattern of the Jacobian.
+    """
+
+    def __init__(
+        self, K, b: np.ndarray, W, window_times: list, residual: list, terms: list = None, boluses: list = None
+    ) -> None:
+        """Set up a compiled model from its matrices.
+
+        :param K:               Sparse rate matrix of shape (n, n).
+        :param b:               Constant forcing vector of length n.
+        :param W:               Sparse matrix of shape (n, m) of the doses of steady dosing terms.
+        :param window_times:    List of length m of the time windows (lists or DoseWindows) of each steady dosing term.
+        :param residual:        List of (index, sign, func) user-defined terms.
+        :param terms:           (optional) List of (kind, row, column, sign, coefficient) lowered terms. Default: None
+        :param boluses:         (optional) List of (time, index, amount) instantaneous doses. Default: None
+        """
+        self.K = scipy.sparse.csr_matrix(K)
+        self.b = np.asarray(b, dtype=float)
+        self.W = scipy.sparse.csr_matrix(W)
+        self.window_times = [w if isinstance(w, DoseWindows) else DoseWindows(w) for w in window_times]
+        self._switches = None
+        self._entries = None
+        self.residual = residual
+        self.terms = terms if terms is not None else []
+        self.boluses = boluses if boluses is not None else []
+
+    @classmethod
+    def from_compartments(cls, compartments: list, infusions: list = (), boluses: list = ()):
+        """Lower the in/output functions of all compartments of a model, together with the doses of a dosing schedule.
+
+        :param compartments:    List of Compartment objects.
+        :param infusions:       (optional) List of (start, stop, index, rate) constant-rate doses. Default: none
+        :param boluses:         (optional) List of (time, index, amount) instantaneous doses. Default: none
+        :returns:               CompiledModel
+        """
+        functions = [
+            (comp.index, sign, func)
+            for comp in compartments
+            for sign, funcs in ((1, comp.input_funcs), (-1, comp.output_funcs))
+            for func in funcs
+        ]
+        return cls._from_terms(functions, len(compartments), infusions, boluses)
+
+    @classmethod
+    def from_graph(cls, graph, infusions: list = (), boluses: list = ()):
+        """Lower the flows of a CompartmentGraph, as held by PKModel, together with the doses of a dosing schedule.
+
+        :param graph:       CompartmentGraph
+        :param infusions:   (optional) List of (start, stop, index, rate) constant-rate doses. Default: none
+        :param boluses:     (optional) List of (time, index, amount) instantaneous doses. Default: none
+        :returns:           CompiledModel
+        """
+        return cls._from_terms(graph.terms(), len(graph), infusions, boluses)
+
+    @classmethod
+    def _from_terms(cls, functions: list, n: int, infusions: list, boluses: list):
+        """Lower a list of (index, sign, func) terms of a model of n compartments, see CompiledModel.from_compartments."""
+        residual, terms, window_times = [], [], []
+        for index, sign, func in functions:
+            lowered = _lower(func)
+            if lowered is None:
+                residual.append((index, sign, func))
+                continue
+            linear, constant, windows = lowered
+            terms += [("K", index, j, sign, k) for j, k in linear]
+            terms += [("b", index, None, sign, k) for k in constant]
+            for times, k in windows:
+                terms.append(("W", index, len(window_times), sign, k))
+                window_times.append(times)
+        for start, stop, index, rate in infusions:
+            terms.append(("W", index, len(window_times), 1, _Coefficient(rate)))
+            window_times.append([[start, stop]])
+
+        values = [np.array([sign * k.value]) for _, _, _, sign, k in terms]
+        K, b, W = _assemble(terms, values, n, len(window_times))
+        return cls(K, b, W, window_times, residual, terms, list(boluses))
+
+    @property
+    def is_linear(self) -> bool:
+        """Whether the model was fully lowered, ie dq/dt = K q + b(t).
+
+        :returns:   True if there are no residual user-defined terms.
+        """
+        return not self.residual
+
+    @property
+    def vectorized(self) -> bool:
+        """Whether differential_eq supports a 2d q of shape (n, points) and an array of time points,
+        ie whether all residual user-defined terms were declared as vectorized (see functions.vectorized).
+
+        :returns:   True if all residual terms are vectorized, in particular if there are none.
+        """
+        return all(is_vectorized(func) for _, _, func in self.residual)
+
+    @property
+    def jac_sparsity(self):
+        """Structural sparsity pattern of the Jacobian, for finite differences of large models. Residual terms
+        may depend on any compartment (of their patient, for stacked models), so their rows are filled.
+
+        :returns:   Sparse (CSR) matrix with ones at all entries that may be non-zero.
+        """
+        n = self.K.shape[0]
+        pattern = scipy.sparse.lil_matrix((self.K != 0).astype(float))
+        for index, _, func in self.residual:
+            if isinstance(func, _PatientTerm):
+                pattern[index, func.offset:func.offset + func.n] = 1
+            else:
+                pattern[index, :n] = 1
+        return pattern.tocsr()
+
+    def breakpoints(self, t0: float, tf: float) -> np.ndarray:
+        """Collect the edges of all steady dosing windows and the times of all boluses within an interval.
+
+        :param t0 / tf:     Start and end of the interval.
+        :returns:           Sorted array of times strictly between t0 and tf, at which the forcing or the state may jump.
+        """
+        times = [np.concatenate([w.starts, w.stops]) for w in self.window_times] + [[time for time, _, _ in self.boluses]]
+        times = np.unique(np.concatenate(times).astype(float))
+        return times[(times > t0) & (times < tf)]
+
+    def jump(self, t: float) -> np.ndarray:
+        """Sum up the boluses applied at a time point.
+
+        :param t:   Time point
+        :returns:   Array of the jump in drug mass in each compartment.
+        """
+        jump = np.zeros(self.K.shape[0])
+        for time, index, amount in self.boluses:
+            if time == t:
+                jump[index] += amount
+        return jump
+
+    def _switch_table(self) -> tuple:
+        """Precompute s(t), which is constant in between any two consecutive window edges.
+
+        :returns:   Tuple (edges, switches), of all sorted window edges, and the switches (rows) within each interval
+                    before, in between, and after the edges.
+        """
+        if self._switches is None:
+            edges = np.unique(np.concatenate([np.concatenate([w.starts, w.stops]) for w in self.window_times]))
+            if not len(edges):
+                self._switches = edges, np.zeros((1, len(self.window_times)))
+                return self._switches
+            probes = np.concatenate([[edges[0] - 1], 0.5 * (edges[:-1] + edges[1:]), [edges[-1] + 1]])
+            switches = np.array([w.contains(probes) for w in self.window_times], dtype=float).T
+            self._switches = edges, switches
+        return self._switches
+
+    def forcing(self, t: float) -> np.ndarray:
+        """Evaluate the forcing vector b(t) of the compiled model. The windows are looked up by a binary search
+        over all window edges, except at an edge itself, where the windows including it are found directly.
+
+        :param t:   Time point, or array of time points.
+        :returns:   Array of constant and windowed dosing rates into each compartment, of shape (n, points) for an array t.
+        """
+        if np.ndim(t):
+            return self._forcing_array(np.asarray(t, dtype=float))
+        if not self.window_times:
+            return self.b
+        edges, switches = self._switch_table()
+        index = np.searchsorted(edges, t)
+        if index < len(edges) and edges[index] == t:
+            return self.b + self.W @ np.array([w.contains(t) for w in self.window_times], dtype=float)
+        return self.b + self.W @ switches[index]
+
+    def _forcing_array(self, t: np.ndarray) -> np.ndarray:
+        """Evaluate b(t) at many time points at once, see forcing.
+
+        :param t:   Array of time points.
+        :returns:   Array of shape (n, points).
+        """
+        if not self.window_times:
+            return np.repeat(self.b[:, None], len(t), axis=1)
+        edges, switches = self._switch_table()
+        index = np.searchsorted(edges, t)
+        s = switches[index]
+        at_edge = (index < len(edges)) & (edges[np.minimum(index, len(edges) - 1)] == t)
+        if at_edge.any():
+            s[at_edge] = np.array([w.contains(t[at_edge]) for w in self.window_times], dtype=float).T
+        return self.b[:, None] + self.W @ s.T
+
+    def differential_eq(self, t: float, q: np.ndarray, forcing: np.ndarray = None) -> np.ndarray:
+        """Get the vector of differential equation right hand sides, ie dq/dt, for all compartments.
+
+        If the model is vectorized, q may also be of shape (n, points), and t a scalar or an array of as many time points.
+
+        :param t:       Time point
+        :param q:       Vector of drug mass in all compartments.
+        :param forcing: (optional) Forcing vector to be used instead of b(t), eg when it is known to be constant. Default: None
+        :returns:       Array of the RHS values of the compartment differential equations.
+        """
+        q = np.asarray(q, dtype=float)
+        if forcing is None:
+            forcing = self.forcing(t)
+        if q.ndim == 2 and np.ndim(forcing) == 1:
+            forcing = forcing[:, None]
+        dq = self.K @ q + forcing
+        if self.residual:
+            dq += self._residual_eq(t, q)
+        return dq
+
+    def _residual_eq(self, t: float, q: np.ndarray) -> np.ndarray:
+        """Sum up the residual user-defined terms into a vector of the same shape as dq/dt.
+
+        :param t: Time point
+        :param q: Vector of drug mass in all compartments.
+        :returns: Array of the residual contributions to the RHS.
+        """
+        dq = np.zeros((self.K.shape[0],) + np.shape(q)[1:])
+        try:
+            for index, sign, func in self.residual:
+                dq[index] += sign * func(t, q)
+        except TypeError:
+            raise TypeError("All inputs and outputs must be functions which take 2 arguments: time t and mass distribution vector q.")
+        return dq
+
+    def jacobian(self, t: float, q: np.ndarray, sparse: bool = False):
+        """Get the Jacobian d(dq/dt)/dq of the model. The lowered part is exact (it is just K), whereas the
+        residual user-defined terms are differentiated by forward finite differences, all in a single call if the
+        model is vectorized.
+
+        :param t:       Time point
+        :param q:       Vector of drug mass in all compartments.
+        :param sparse:  (optional) Return a sparse CSR matrix instead of a dense array. Default: False
+        :returns:       Jacobian matrix of shape (n, n).
+        """
+        J = self.K.copy() if sparse else self.K.toarray()
+        if not self.residual:
+            return J
+
+        q = np.asarray(q, dtype=float)
+        r0 = self._residual_eq(t, q)
+        h = np.sqrt(np.finfo(float).eps) * np.maximum(1, np.abs(q))
+        if self.vectorized:
+            J_residual = (self._residual_eq(t, q[:, None] + np.diag(h)) - r0[:, None]) / h
+        else:
+            J_residual = np.zeros(J.shape)
+            for j in range(len(q)):
+                q_step = q.copy()
+                q_step[j] += h[j]
+                J_residual[:, j] = (self._residual_eq(t, q_step) - r0) / h[j]
+        if sparse:
+            return (J + scipy.sparse.csr_matrix(J_residual)).tocsr()
+        return J + J_residual
+
+    def with_values(self, values: dict):
+        """Re-evaluate the lowered terms of the model for a different set of parameter values, keeping its structure,
+        residual terms and boluses, so that the model needs neither to be rebuilt nor lowered again. Residual shifted
+        functions are copied with their volume ratios re-evaluated.
+
+        :param values:  Dictionary of all parameter names and their values.
+        :returns:       CompiledModel
+        """
+        evaluated = [np.array([sign * k.evaluate(values)]) for _, _, _, sign, k in self.terms]
+        K, b, W = _assemble(self.terms, evaluated, self.K.shape[0], self.W.shape[1])
+        residual = [(index, sign, _rescaled(func, values)) for index, sign, func in self.residual]
+        return CompiledModel(K, b, W, self.window_times, residual, self.terms, self.boluses)
+
+    def update(self, values: dict, names: set) -> None:
+        """Re-evaluate in place the entries of K, b and W which depend on some changed parameter values, eg after
+        PKModel.set_parameter, leaving all other entries, the sparsity structure and the residual terms as they are.
+
+        :param values:  Dictionary of all parameter names and their (new) values.
+        :param names:   Set of the names of the changed parameters.
+        """
+        if self._entries is None:
+            # Terms summed into the same entry of K, b or W
+            self._entries = dict()
+            for i, (kind, row, col, _, _) in enumerate(self.terms):
+                self._entries.setdefault((kind, row, col), []).append(i)
+        affected = {(kind, row, col) for kind, row, col, _, k in self.terms if k.depends_on(names)}
+        for kind, row, col in affected:
+            total = 0.0
+            for i in self._entries[(kind, row, col)]:
+                k = self.terms[i][4]
+                k.value = k.evaluate(values)
+                total += self.terms[i][3] * k.value
+            if kind == "b":
+                self.b[row] = total
+                continue
+            matrix = self.K if kind == "K" else self.W
+            start, stop = matrix.indptr[row], matrix.indptr[row + 1]
+            matrix.data[start + np.flatnonzero(matrix.indices[start:stop] == col)[0]] = total
+
+    def differentiate(self, name: str, values: dict) -> tuple:
+        """Differentiate the lowered part of the model with respect to a named parameter. User-defined residual
+        terms are left out, although shifted ones depend on the volume parameters in their scale, see
+        sensitivity.augment.
+
+        :param name:    Name of the parameter, see PKModel.parameters.
+        :param values:  Dictionary of all parameter names and their values.
+        :returns:       Tuple (dK, db, dW) of the derivatives of K, b and W.
+        """
+        derivatives = [np.array([sign * k.derivative(name, values)]) for _, _, _, sign, k in self.terms]
+        return _assemble(self.terms, derivatives, self.K.shape[0], self.W.shape[1])
+
+    def stack(self, values: dict, n_patients: int):
+        """Build a single block-diagonal model for many patients, which share the structure of this model but
+        differ in their parameter values. The state of patient p occupies entries p * n to (p + 1) * n - 1.
+
+        :param values:      Dictionary of all parameter names and their values, as scalars or arrays of length n_patients.
+        :param n_patients:  Number of patients.
+        :returns:           CompiledModel of size n * n_patients.
+        """
+        n, m = self.K.shape[0], self.W.shape[1]
+        stacked_values = [
+            np.broadcast_to(sign * k.evaluate(values), (n_patients,)) for _, _, _, sign, k in self.terms
+        ]
+        K, b, W = _assemble(self.terms, stacked_values, n, m, n_patients)
+        residual = [
+            (offset + index, sign, _PatientTerm(_rescaled(func, values, patient), offset, n))
+            for patient, offset in enumerate(range(0, n * n_patients, n))
+            for index, sign, func in self.residual
+        ]
+        boluses = [
+            (time, offset + index, amount)
+            for offset in range(0, n * n_patients, n)
+            for time, index, amount in self.boluses
+        ]
+        return CompiledModel(K, b, W, self.window_times, residual, boluses=boluses)
@@ -0,0 +1,204 @@
+# This holds the declarative description of a PKModel as plain data, see PKModel.load_dict and PKModel.to_dict
+
+from . import spec
+from .rates import FirstOrderRate, DoseConstantRate, DoseSteadyRate
+
+
+def _function(func):
+    """Resolve the function of a declared input or output.
+
+    :param func:    Rate function, its encoding as written by spec (eg {"function": "module:qualname"}), or "module:qualname".
+    :returns:       Rate function.
+    """
+    if isinstance(func, str):
+        func = {"function": func}
+    if isinstance(func, dict):
+        func = spec._decode(func)
+    if not callable(func):
+        raise TypeError("Declared functions need to be callables, or references of the form 'module:qualname'.")
+    return func
+
+
+def _parameter(model, name: str, value: float) -> str:
+    """Register a parameter of a declared model, checking that parameters declared twice agree.
+
+    :param model:   PKModel being built.
+    :param name:    Parameter name.
+    :param value:   Parameter value.
+    :returns:       Parameter name.
+    """
+    if name in model._parameters and model._parameters[name] != value:
+        raise ValueError("Parameter '%s' is declared with different values, give them distinct names." % name)
+    return model._add_parameter(name, value)
+
+
+def _index(model, name: str) -> int:
+    if name not in model.graph.index:
+        raise ValueError("Unknown compartment '%s'." % name)
+    return model.graph.index[name]
+
+
+def _unlabelled(graph, end: str) -> bool:
+    """Whether a flow from (end 'target') or to (end 'source') the outside is drawn from or to the unlabelled node yet,
+    which the first built-in dose and elimination are, as for PKModel.create_model."""
+    other = "source" if end == "target" else "target"
+    outside = (getattr(graph, end) >= 0) & (getattr(graph, other) < 0)
+    return any(graph.labels[flow] == "" for flow in outside.nonzero()[0])
+
+
+def _add_input(model, entry: dict) -> None:
+    """Add a declared input, either a built-in dose ('dose', optionally with 'windows') or a function ('func')."""
+    name = entry["compartment"]
+    index = _index(model, name)
+    if "dose" in entry:
+        parameter = _parameter(model, entry.get("parameter", "dose.X"), entry["dose"])
+        if "windows" in entry:
+            func = DoseSteadyRate(entry["dose"], entry["windows"], parameter)
+        else:
+            func = DoseConstantRate(entry["dose"], parameter)
+        label = entry.get("label", "dose") if _unlabelled(model.graph, "target") else ""
+    else:
+        func = _function(entry["func"])
+        label = entry.get("label", "unk. input")
+    model.graph.add_flow(func, target=index, label=label)
+
+
+def _add_output(model, entry: dict) -> None:
+    """Add a declared output, either a built-in first-order elimination ('elimination') or a function ('func')."""
+    name = entry["compartment"]
+    index = _index(model, name)
+    if "elimination" in entry:
+        parameter = _parameter(model, entry.get("parameter", "elimination.k"), entry["elimination"])
+        func = FirstOrderRate(entry["elimination"] / model.graph.volumes[index], index, parameter, name + ".volume")
+        label = entry.get("label", "elimination") if _unlabelled(model.graph, "source") else ""
+    else:
+        func = _function(entry["func"])
+        label = entry.get("label", "unk. output")
+    model.graph.add_flow(func, source=index, label=label)
+
+
+def _add_edge(model, entry: dict) -> None:
+    """Add a declared first-order transfer between two compartments, in both directions if it is an 'exchange'."""
+    source, target = entry["from"], entry["to"]
+    parameter = _parameter(model, entry.get("parameter", source + "->" + target + ".k"), entry["k"])
+    directions = [(source, target), (target, source)] if entry.get("exchange", False) else [(source, target)]
+    for a, b in directions:
+        i, j = _index(model, a), _index(model, b)
+        connection = FirstOrderRate(entry["k"] / model.graph.volumes[i], i, parameter, a + ".volume")
+        model.graph.add_flow(connection, source=i, target=j)
+
+
+def load(model, description: dict) -> None:
+    """Build a model from its declarative description in a single pass, creating all compartments and their
+    (built-in) rate functions directly, without going through the incremental builder methods.
+
+    The description is a dictionary of
+        -   compartments:   list of {"name", "volume"}.
+        -   inputs:         (optional) list of {"compartment", "dose"[, "windows"][, "parameter"]} built-in doses (steady within
+                            the windows if given, otherwise constant), or {"compartment", "func"[, "label"]} user-defined inputs.
+        -   outputs:        (optional) list of {"compartment", "elimination"[, "parameter"]} built-in first-order eliminations,
+                            or {"compartment", "func"[, "label"]} user-defined outputs.
+        -   edges:          (optional) list of {"from", "to", "k"[, "parameter"][, "exchange"]} first-order transfers with
+                            time constant k (divided by the volume of 'from'), in both directions if 'exchange' is true.
+    Functions ('func') are callables or references 'module:qualname'. Parameters are named as by the builder methods
+    ('<name>.volume', 'dose.X', 'elimination.k', '<from>-><to>.k'), unless a 'parameter' name is given.
+
+    :param model:       Empty PKModel.
+    :param description: Dictionary describing the model.
+    """
+    if len(model.graph):
+        raise ValueError("A model can only be loaded into an empty PKModel.")
+    names = [entry["name"] for entry in description["compartments"]]
+    if len(set(names)) != len(names):
+        raise ValueError("Compartment names need to be unique.")
+    for entry in description["compartments"]:
+        if not entry["volume"] > 0:
+            raise ValueError("The volume of compartment '%s' needs to be positive." % entry["name"])
+        _parameter(model, entry["name"] + ".volume", entry["volume"])
+        model.graph.add_compartment(entry["name"], entry["volume"])
+
+    for entry in description.get("inputs", []):
+        _add_input(model, entry)
+    for entry in description.get("outputs", []):
+        _add_output(model, entry)
+    for entry in description.get("edges", []):
+        _add_edge(model, entry)
+
+
+def _edges(graph) -> set:
+    """Find the first-order transfers of a model, ie flows between two compartments of built-in first-order functions,
+    which depend on the parameter-bearing time constant of their source.
+
+    :param graph:   CompartmentGraph of a PKModel
+    :returns:       Set of the indices of these flows.
+    """
+    edges = set()
+    for flow in ((graph.source >= 0) & (graph.target >= 0)).nonzero()[0]:
+        func, source = graph.funcs[flow], graph.source[flow]
+        if (
+            isinstance(func, FirstOrderRate)
+            and func.parameter is not None
+            and func.q_index == source
+            and func.volume == graph.names[source] + ".volume"
+        ):
+            edges.add(flow)
+    return edges
+
+
+def _describe_input(model, name: str, func) -> dict:
+    parameters = model._parameters
+    if isinstance(func, (DoseConstantRate, DoseSteadyRate)) and func.parameter is not None:
+        entry = {"compartment": name, "dose": parameters[func.parameter]}
+        if isinstance(func, DoseSteadyRate):
+            entry["windows"] = spec._encode(func.times)
+        if func.parameter != "dose.X":
+            entry["parameter"] = func.parameter
+        return entry
+    return {"compartment": name, "func": spec._encode(func)}
+
+
+def _describe_output(model, name: str, index: int, func) -> dict:
+    parameters = model._parameters
+    if (
+        isinstance(func, FirstOrderRate)
+        and func.parameter is not None
+        and func.q_index == index
+        and func.volume == name + ".volume"
+    ):
+        entry = {"compartment": name, "elimination": parameters[func.parameter]}
+        if func.parameter != "elimination.k":
+            entry["parameter"] = func.parameter
+        return entry
+    return {"compartment": name, "func": spec._encode(func)}
+
+
+def describe(model) -> dict:
+    """Describe the current state of a model declaratively, see load. Built-in functions become doses, eliminations
+    and edges, whereas any other function is encoded as in the model specification (see PKModel.to_spec).
+
+    :param model:   PKModel
+    :returns:       Dictionary of plain data describing the model.
+    """
+    graph = model.graph
+    edges = _edges(graph)
+    description = {
+        "compartments": [{"name": name, "volume": volume} for name, volume in zip(graph.names, graph.volumes.tolist())],
+        "inputs": [],
+        "outputs": [],
+        "edges": [],
+    }
+    for index, name in enumerate(graph.names):
+        for flow in graph.inputs(index):
+            if flow not in edges:
+                description["inputs"].append(_describe_input(model, name, graph.funcs[flow]))
+        for flow in graph.outputs(index):
+            func = graph.funcs[flow]
+            if flow in edges:
+                target = graph.names[graph.target[flow]]
+                edge = {"from": name, "to": target, "k": model._parameters[func.parameter]}
+                if func.parameter != name + "->" + target + ".k":
+                    edge["parameter"] = func.parameter
+                description["edges"].append(edge)
+            else:
+                description["outputs"].append(_describe_output(model, name, index, func))
+    return description
@@ -0,0 +1,69 @@
+# This holds the DosingSchedule class
+
+
+class DosingSchedule:
+    """Class to represent a dosing schedule which PKModel.solve understands natively. Boluses are applied as
+    instantaneous jumps of the drug mass in a compartment, and infusions as constant input rates within a time window.
+    On solving, the integration is restarted at every dose, so that the integrator never steps across a discontinuity.
+
+    Fields:
+        -   boluses:    List of (time, compartment name, amount) instantaneous doses.
+        -   infusions:  List of (start, stop, compartment name, rate) constant-rate doses.
+
+    Methods:
+        -   __init__:       Create an empty schedule.
+        -   add_bolus:      Add a single instantaneous dose.
+        -   add_infusion:   Add a single constant-rate dose over a time window.
+        -   add_regimen:    Add a series of regularly repeated boluses or infusions.
+    """
+
+    def __init__(self) -> None:
+        """Create an empty schedule, to be filled by the add_* methods."""
+        self.boluses = []
+        self.infusions = []
+
+    def add_bolus(self, compartment: str, amount: float, time: float):
+        """Add an instantaneous dose, ie a jump of the drug mass in a compartment.
+
+        :param compartment: Name of the compartment the dose is applied to.
+        :param amount:      Drug mass of the dose.
+        :param time:        Time at which the dose is applied.
+        :returns:           The schedule itself, so that calls can be chained.
+        """
+        self.boluses.append((time, compartment, amount))
+        return self
+
+    def add_infusion(self, compartment: str, rate: float, start: float, stop: float):
+        """Add a dose at a constant rate within a time window.
+
+        :param compartment: Name of the compartment the dose is applied to.
+        :param rate:        Drug mass per unit time.
+        :param start:       Start of the infusion.
+        :param stop:        End of the infusion.
+        :returns:           The schedule itself, so that calls can be chained.
+        """
+        if stop <= start:
+            raise ValueError("An infusion needs to stop after it starts.")
+        self.infusions.append((start, stop, compartment, rate))
+        return self
+
+    def add_regimen(
+        self, compartment: str, amount: float, start: float, interval: float, count: int, duration: float = 0
+    ):
+        """Add a regimen of regularly repeated doses, eg a daily dose over several weeks.
+
+        :param compartment: Name of the compartment the doses are applied to.
+        :param amount:      Drug mass of each dose.
+        :param start:       Time of the first dose.
+        :param interval:    Time between the starts of consecutive doses.
+        :param count:       Number of doses.
+        :param duration:    (optional) Duration of each dose. If zero, the doses are boluses, otherwise infusions at rate amount / duration. Default: 0
+        :returns:           The schedule itself, so that calls can be chained.
+        """
+        for i in range(count):
+            time = start + i * interval
+            if duration == 0:
+                self.add_bolus(compartment, amount, time)
+            else:
+                self.add_infusion(compartment, amount / duration, time, time + duration)
+        return self
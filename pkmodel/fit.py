@@ -0,0 +1,212 @@
+# This holds the estimation of model parameters from observed concentration-time data
+
+import concurrent.futures
+
+import numpy as np
+import scipy.optimize
+
+from . import sensitivity
+from .pk_model import PKModel
+
+# Tolerances of numerical integrations, which need to be well below those of the optimizer for useful gradients
+_TOLERANCES = {"rtol": 1e-8, "atol": 1e-10}
+
+
+class _Objective:
+    """Weighted residuals of the predicted against the observed concentrations, and their Jacobian, as functions
+    of the logarithms of the free parameters. The model is compiled once, and only re-evaluated for each set
+    of parameter values. Residuals and Jacobian come out of a single solve of the model augmented with its forward
+    sensitivities (see sensitivity.augment), which is shared between the two calls for the same parameters.
+
+    Fields:
+        -   compiled:       CompiledModel of the model.
+        -   values:         Dictionary of all parameter values, the free ones being overwritten on evaluation.
+        -   parameters:     Names of the free parameters.
+        -   t_eval:         Sorted array of the start time and all observation times.
+        -   q0:             Initial conditions of mass distribution in compartments.
+        -   observations:   List of (compartment index, volume parameter, positions in t_eval, values, sigma).
+        -   options:        Dictionary of method and engine, see PKModel.solve.
+        -   nsolves:        Number of solves so far.
+
+    Methods:
+        -   __init__:   Compile the model and collect the observations.
+        -   residuals:  Weighted residuals at the log parameters x.
+        -   jacobian:   Jacobian of the residuals with respect to x.
+    """
+
+    def __init__(self, model: PKModel, observations: dict, parameters: list, q0, t0: float, options: dict) -> None:
+        """Compile the model and collect the observations, see fit for the arguments."""
+        unknown = set(parameters) - set(model.parameters)
+        assert not unknown, "Unknown parameters: " + ", ".join(sorted(unknown))
+        names = model.get_compartment_names
+        self.compiled = model.compile(options.pop("schedule"))
+        self.values = model.parameters
+        self.parameters = list(parameters)
+        self.q0 = np.zeros(len(names)) if q0 is None else np.asarray(q0, dtype=float)
+        self.options = options
+        if options["engine"] is None:
+            options["engine"] = "analytic" if self.compiled.is_linear else "numerical"
+
+        times = [np.asarray(data[0], dtype=float) for data in observations.values()]
+        if min(np.min(t) for t in times) < t0:
+            raise ValueError("Observations need to be made after the start time t0.")
+        self.t_eval = np.unique(np.concatenate([[t0]] + times))
+        self.observations = []
+        for name, data in observations.items():
+            if name not in names:
+                raise ValueError("Unknown compartment '%s'." % name)
+            t, observed = np.asarray(data[0], dtype=float), np.asarray(data[1], dtype=float)
+            sigma = np.broadcast_to(np.asarray(data[2] if len(data) > 2 else 1.0, dtype=float), observed.shape)
+            positions = np.searchsorted(self.t_eval, t)
+            self.observations.append((names.index(name), name + ".volume", positions, observed, sigma))
+        self.nsolves = 0
+        self._last = None
+
+    def _solve(self, x: np.ndarray) -> tuple:
+        """Solve the augmented model at the log parameters x, unless it was just solved there.
+
+        :param x:   Array of the logarithms of the free parameters.
+        :returns:   Tuple (residuals, jacobian).
+        """
+        if self._last is not None and np.array_equal(self._last[0], x):
+            return self._last[1]
+        values = dict(self.values)
+        values.update(zip(self.parameters, np.exp(x)))
+        compiled = sensitivity.augment(self.compiled.with_values(values), values, self.parameters)
+        q0 = np.concatenate([self.q0, np.zeros(len(self.q0) * len(self.parameters))])
+        result = PKModel._solve_compiled(
+            compiled, self.t_eval, q0, self.options["method"], False, self.options["engine"], tolerances=_TOLERANCES
+        )
+        self.nsolves += 1
+        if not result.success:
+            raise ValueError("The model could not be solved: " + result.message)
+        result = sensitivity.split(result, len(self.q0), self.parameters)
+
+        residuals, jacobian = [], []
+        for index, volume, positions, observed, sigma in self.observations:
+            mass = result.y[index, positions]
+            residuals.append((mass / values[volume] - observed) / sigma)
+            columns = []
+            for name in self.parameters:
+                derivative = result.sensitivities[name][index, positions] / values[volume]
+                if name == volume:
+                    derivative = derivative - mass / values[volume] ** 2
+                # Chain rule for the logarithm of the parameter
+                columns.append(derivative * values[name] / sigma)
+            jacobian.append(np.array(columns).T)
+        self._last = (np.array(x), (np.concatenate(residuals), np.concatenate(jacobian)))
+        return self._last[1]
+
+    def residuals(self, x: np.ndarray) -> np.ndarray:
+        return self._solve(x)[0]
+
+    def jacobian(self, x: np.ndarray) -> np.ndarray:
+        return self._solve(x)[1]
+
+
+def _fit_start(model, observations: dict, parameters: list, start: dict, q0, t0: float, bounds: tuple, options: dict):
+    """Fit the free parameters from a single starting point, with scipy.optimize.least_squares on their logarithms.
+    This is also the worker function of multi-start fits in a process pool.
+
+    :param model:           PKModel, or its specification as returned by PKModel.to_spec.
+    :param start:           Dictionary of the starting values of the free parameters.
+    :param bounds:          Tuple of arrays of the lower and upper bounds of the logarithms of the free parameters.
+    :returns:               Result object of scipy.optimize.least_squares, with the fitted 'parameters' and the number of solves 'nsolves'.
+    See fit for the other arguments.
+    """
+    if not isinstance(model, PKModel):
+        model = PKModel.from_spec(model)
+    objective = _Objective(model, observations, parameters, q0, t0, dict(options))
+    x0 = np.clip(np.log([start[name] for name in parameters]), *bounds)
+    result = scipy.optimize.least_squares(objective.residuals, x0, jac=objective.jacobian, bounds=bounds)
+    result.parameters = dict(zip(parameters, np.exp(result.x)))
+    result.nsolves = objective.nsolves
+    return result
+
+
+def _starts(model: PKModel, parameters: list, bounds: dict, n_starts: int, seed) -> list:
+    """Draw the starting points of a multi-start fit, the first being the current parameter values of the model,
+    and the others log-uniformly distributed within the bounds, or within a factor of 10 of the current value
+    for parameters without finite bounds.
+
+    :returns:   List of dictionaries of the starting values of the free parameters.
+    """
+    rng = np.random.default_rng(seed)
+    values = model.parameters
+    starts = [{name: values[name] for name in parameters}]
+    for _ in range(n_starts - 1):
+        start = dict()
+        for name in parameters:
+            low, high = bounds.get(name, (0, np.inf))
+            if not (low > 0 and np.isfinite(high)):
+                low, high = values[name] / 10, values[name] * 10
+            start[name] = np.exp(rng.uniform(np.log(low), np.log(high)))
+        starts.append(start)
+    return starts
+
+
+def fit(
+    model: PKModel,
+    observations: dict,
+    parameters: list,
+    q0: np.ndarray = None,
+    t0: float = 0,
+    bounds: dict = None,
+    n_starts: int = 1,
+    max_workers: int = None,
+    seed: int = None,
+    method: str = "LSODA",
+    engine: str = None,
+    schedule=None,
+):
+    """Fit free parameters of a model (eg volumes, time constants and doses, see PKModel.parameters) to observed
+    concentration-time data, ie drug mass divided by the volume of a compartment, by weighted least squares.
+    The model is compiled once and re-evaluated for every set of parameter values. The Jacobian of the residuals comes
+    from the forward sensitivities, integrated alongside the state, so that each optimizer iteration needs one solve.
+    Linear models are solved with the analytic engine. Parameters are fitted on a logarithmic scale, which keeps them positive.
+
+    With n_starts > 1, further fits start from random points within the bounds, and the best fit is returned.
+    These are spread over a pool of max_workers processes, to which the model is sent as its specification, so all its
+    functions need to be built-in or defined at module level (see PKModel.to_spec).
+
+    :param model:           PKModel, which is left unchanged.
+    :param observations:    Dictionary of compartment names and tuples (times, concentrations) or (times, concentrations, standard deviations).
+    :param parameters:      Names of the free parameters.
+    :param q0:              (optional) Initial conditions of mass distribution in compartments at t0. Default: None, ie no drug
+    :param t0:              (optional) Start time of the integration, before all observations. Default: 0
+    :param bounds:          (optional) Dictionary of parameter names and (lower, upper) bounds. Default: None, ie any positive value
+    :param n_starts:        (optional) Number of starting points, the first being the current parameter values of the model. Default: 1
+    :param max_workers:     (optional) Number of worker processes of a multi-start fit. Default: number of CPUs, or no pool for a single start
+    :param seed:            (optional) Seed of the random starting points. Default: None
+    :param method:          (optional) Integration method for nonlinear models, see PKModel.solve. Default: 'LSODA'
+    :param engine:          (optional) 'numerical' or 'analytic', see PKModel.solve. Default: 'analytic' if the model is linear
+    :param schedule:        (optional) DosingSchedule, see PKModel.solve. Default: None
+    :returns:               Result object of scipy.optimize.least_squares of the best fit, with the fitted 'parameters' as a dictionary,
+                            the number of model solves 'nsolves' (over all starts), and the results of all 'starts'.
+    """
+    bounds = dict() if bounds is None else bounds
+    unknown = set(bounds) - set(parameters)
+    assert not unknown, "Bounds of parameters which are not free: " + ", ".join(sorted(unknown))
+    with np.errstate(divide="ignore"):
+        log_bounds = (
+            np.log([bounds.get(name, (0, np.inf))[0] for name in parameters]),
+            np.log([bounds.get(name, (0, np.inf))[1] for name in parameters]),
+        )
+    options = {"method": method, "engine": engine, "schedule": schedule}
+    starts = _starts(model, parameters, bounds, n_starts, seed)
+    arguments = (observations, parameters)
+
+    if n_starts == 1 or max_workers == 1:
+        results = [_fit_start(model, *arguments, start, q0, t0, log_bounds, options) for start in starts]
+    else:
+        model_spec = model.to_spec()
+        with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(_fit_start, model_spec, *arguments, start, q0, t0, log_bounds, options) for start in starts
+            ]
+            results = [future.result() for future in futures]
+
+    best = min(results, key=lambda result: result.cost)
+    best.nsolves = sum(result.nsolves for result in results)
+    best.starts = results
+    return best
@@ -1,10 +1,33 @@
 import numpy as np
 
 
+def vectorized(func):
+    """Decorator to declare that a rate function supports evaluation at many points at once: it accepts an array
+    of time points t and/or a 2d array q of shape (compartments, points), and returns a value broadcastable to
+    the number of points. If all functions of a model are vectorized, implicit solvers evaluate finite-difference
+    Jacobians in a single call.
+
+    :param func:    Rate function taking time t and mass distribution vector q.
+    :returns:       The same function, marked as vectorized.
+    """
+    func.vectorized = True
+    return func
+
+
+def is_vectorized(func) -> bool:
+    """Check whether a rate function was declared as vectorized, see vectorized.
+
+    :param func:    Rate function taking time t and mass distribution vector q.
+    :returns:       True if the function supports array-valued t and 2d q.
+    """
+    return getattr(func, "vectorized", False)
+
+
+@vectorized
 def zeroth_order(t: float, q: list, k: float) -> float:
     """Simple zeroth-order rate function.
 
-    :param t:   model time
+    :param t:   model time, or array of time points
     :param q:   Vector (list) of mass distribution through compartments (not actually used but required argument for ODE solver)
     :param k:   Time constant of the rate function.
     :returns:   Zeroth-order rate.
@@ -12,22 +35,24 @@ def zeroth_order(t: float, q: list, k: float) -> float:
     return k
 
 
+@vectorized
 def first_order(t: float, q: list, k: float, q_index: int) -> float:
     """Simple first-order rate function.
 
-    :param t:       model time
-    :param q:       Vector (list) of mass distribution through compartments
+    :param t:       model time, or array of time points
+    :param q:       Vector (list) of mass distribution through compartments, or 2d array of shape (compartments, points)
     :param k:       Time constant of the rate function.
     :param q_index: Index within q on which the rate depends to first order.
-    :returns:       First-order rate.
+    :returns:       First-order rate, for each point if q is 2d.
     """
     return k * q[q_index]
 
 
+@vectorized
 def dose_constant(t: float, q: list, X: float) -> float:
     """Dose function for a steady, constant stream of drug dosage.
 
-    :param t:   model time
+    :param t:   model time, or array of time points
     :param q:   Vector (list) of mass distribution through compartments (not actually used but required argument for ODE solver)
     :param X:   Constant dose applied
     :returns:   Dosing input rate to the system.
@@ -35,28 +60,65 @@ def dose_constant(t: float, q: list, X: float) -> float:
     return X
 
 
-def dose_steady(t: float, q: list, X: float, times: list) -> float:
-    """Administers a steady dose within a fixed list of time windows.
+class DoseWindows:
+    """Time windows of a steady dose, validated once and stored as sorted NumPy arrays, so that
+    looking up whether a time lies within any window is a binary search rather than a linear scan.
 
-    :param t:       model time
-    :param q:       Vector (list) of mass distribution through compartments (not actually used but required argument for ODE solver)
-    :param X:       dosage to be applied
-    :param times:   2d list of times at which to stop and start dosage in format [[start_time_1,stop_time_1],[start_time_2,stop_time_2],...]
-    :returns:       dosage flow resulting dependent on time, =X if in a time window, =0 if not.
+    Fields:
+        -   starts: Sorted array of the start times of the windows.
+        -   stops:  Array of the corresponding stop times.
+        -   _reach: Running maximum of the stop times, ie the latest time covered by any window starting at or before each start.
+
+    Methods:
+        -   __init__:   Validate and sort the windows.
+        -   contains:   Whether time point(s) lie within any window.
     """
 
-    # check times tuple is the correct shape
+    def __init__(self, times: list) -> None:
+        """Validate and sort a list of time windows.
 
-    if len(np.shape(times)) != 2 or np.shape(times)[1] != 2:
-        raise TypeError(
-            "times should be a 2d list of shape (n,2) where n is the number of doses, i.e. in the format \
+        :param times:   2d list of times at which to stop and start dosage in format [[start_time_1,stop_time_1],[start_time_2,stop_time_2],...]
+        """
+        if len(np.shape(times)) != 2 or np.shape(times)[1] != 2:
+            raise TypeError(
+                "times should be a 2d list of shape (n,2) where n is the number of doses, i.e. in the format \
     [[start_time_1,stop_time_1],[start_time_2,stop_time_2],...]"
-        )
+            )
+        times = np.asarray(times, dtype=float)
+        order = np.argsort(times[:, 0], kind="stable")
+        self.starts = times[order, 0]
+        self.stops = times[order, 1]
+        self._reach = np.maximum.accumulate(self.stops) if len(self.stops) else self.stops
 
-    # check if t is in within time range
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def contains(self, t):
+        """Check whether time point(s) lie within any window, boundaries included.
+
+        :param t:   Time point, or array of time points.
+        :returns:   bool, or boolean array of the shape of t.
+        """
+        index = np.searchsorted(self.starts, t, side="right") - 1
+        covered = (index >= 0) & (t <= self._reach[np.maximum(index, 0)]) if len(self) else np.zeros(np.shape(t), bool)
+        return bool(covered) if np.ndim(covered) == 0 else covered
 
-    for time in times:
-        if t >= time[0] and t <= time[1]:
-            return X
 
-    return 0  # Neede to add a default return of 0
+@vectorized
+def dose_steady(t: float, q: list, X: float, times) -> float:
+    """Administers a steady dose within a fixed list of time windows.
+
+    :param t:       model time, or array of time points
+    :param q:       Vector (list) of mass distribution through compartments (not actually used but required argument for ODE solver)
+    :param X:       dosage to be applied
+    :param times:   2d list of times at which to stop and start dosage in format [[start_time_1,stop_time_1],[start_time_2,stop_time_2],...], or DoseWindows. Pass DoseWindows when calling repeatedly, so the windows are only validated once.
+    :returns:       dosage flow resulting dependent on time, =X if in a time window, =0 if not.
+    """
+    if not isinstance(times, DoseWindows):
+        times = DoseWindows(times)
+
+    # check if t is in within time range
+    covered = times.contains(t)
+    if np.ndim(covered) == 0:
+        return X if covered else 0
+    return np.where(covered, X, 0)
@@ -0,0 +1,293 @@
+# This holds the CompartmentGraph class, the array-backed structure of a PKModel
+
+import numpy as np
+
+from .rates import ZerothOrderRate, FirstOrderRate, DoseConstantRate, DoseSteadyRate, ShiftedRate
+
+# Rate types of flows, stored as their index in the kind array
+KINDS = ("function", "zeroth_order", "first_order", "dose_constant", "dose_steady", "shifted")
+_KIND_CLASSES = (ZerothOrderRate, FirstOrderRate, DoseConstantRate, DoseSteadyRate, ShiftedRate)
+
+_FLOW_COLUMNS = {
+    "source": np.int64,
+    "target": np.int64,
+    "source_rank": np.int64,
+    "target_rank": np.int64,
+    "kind": np.int8,
+}
+
+
+def _kind(func) -> int:
+    """Rate type of a function, as its index in KINDS."""
+    for code, cls in enumerate(_KIND_CLASSES, start=1):
+        if isinstance(func, cls):
+            return code
+    return 0
+
+
+def _grow(array: np.ndarray, size: int) -> np.ndarray:
+    """Return an array holding at least size entries, doubling the capacity if needed, so that appending is amortized O(1)."""
+    if size <= len(array):
+        return array
+    grown = np.empty(max(size, 2 * len(array)), dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+class CompartmentGraph:
+    """Class to hold the structure of a PKModel in flat arrays: a volume per compartment, and a flow per rate function.
+    A flow is a function which is an output of its source compartment and an input of its target compartment, -1
+    standing for outside the model, eg a dose has only a target, an elimination only a source, and a transfer between
+    compartments has both. This is the single source of truth of the model structure, which Compartment objects are views
+    of, which CompiledModel is lowered from, and which network drawing and structure queries are answered from.
+
+    The order of the in/outputs of a compartment is kept by ranks, so that eg the first input of a compartment can be
+    replaced by another flow. The ordered flows of every compartment and the terms are cached until the flows change.
+
+    Fields:
+        -   names:      List of compartment names, in order of their index.
+        -   index:      Dictionary to map names of compartments to their index.
+        -   funcs:      List of the rate function of each flow.
+        -   labels:     List of the label of each flow, used when drawing the ends outside the model.
+        -   parameters: List of the name of the parameter each flow is proportional to, or None.
+
+    Methods:
+        -   __init__:           Set up an empty graph.
+        -   add_compartment:    Add a compartment.
+        -   add_flow:           Add a rate function as a flow.
+        -   inputs / outputs:   Flows into / out of a compartment, in order.
+        -   move_target:        Make a flow the last input of a different compartment.
+        -   detach_source:      Make a flow no longer an output of its source.
+        -   terms:              All (index, sign, function) terms of the model, in the order of the compartments.
+        -   edges:              List of the drawn edges.
+        -   adjacency:          Sparse matrix of the transfers between compartments.
+        -   in_degree / out_degree: Number of transfers into / out of every compartment.
+        -   path:               Shortest path of transfers between two compartments.
+    Properties:
+        -   volumes:            Array of the compartment volumes.
+        -   source / target / source_rank / target_rank / kind: Arrays of the flows.
+        -   n_flows:            Number of flows.
+    """
+
+    def __init__(self) -> None:
+        """Set up an empty graph."""
+        self.names = []
+        self.index = dict()
+        self._volumes = np.empty(0)
+        self._flows = {name: np.empty(0, dtype=dtype) for name, dtype in _FLOW_COLUMNS.items()}
+        self.funcs = []
+        self.labels = []
+        self.parameters = []
+        self._rank = 0
+        self._cache = dict()
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    @property
+    def volumes(self) -> np.ndarray:
+        return self._volumes[:len(self.names)]
+
+    @property
+    def n_flows(self) -> int:
+        return len(self.funcs)
+
+    @property
+    def source(self) -> np.ndarray:
+        return self._flows["source"][:len(self.funcs)]
+
+    @property
+    def target(self) -> np.ndarray:
+        return self._flows["target"][:len(self.funcs)]
+
+    @property
+    def source_rank(self) -> np.ndarray:
+        return self._flows["source_rank"][:len(self.funcs)]
+
+    @property
+    def target_rank(self) -> np.ndarray:
+        return self._flows["target_rank"][:len(self.funcs)]
+
+    @property
+    def kind(self) -> np.ndarray:
+        return self._flows["kind"][:len(self.funcs)]
+
+    def add_compartment(self, name: str, volume: float) -> int:
+        """Add a compartment without any flows.
+
+        :param name:    Name of the compartment, which needs to be unique.
+        :param volume:  Volume of the compartment.
+        :returns:       Index of the compartment.
+        """
+        if name in self.index:
+            raise ValueError("A compartment named '%s' already exists." % name)
+        index = len(self.names)
+        self._volumes = _grow(self._volumes, index + 1)
+        self._volumes[index] = volume
+        self.names.append(name)
+        self.index[name] = index
+        self._cache.clear()
+        return index
+
+    def _next_rank(self) -> int:
+        self._rank += 1
+        return self._rank
+
+    def add_flow(
+        self, func, source: int = -1, target: int = -1, label: str = "", source_rank: int = None, target_rank: int = None
+    ) -> int:
+        """Add a rate function as a flow, by default as the last output of its source and the last input of its target.
+
+        :param func:        Rate function taking time t and mass distribution vector q.
+        :param source:      (optional) Index of the compartment the function is an output of. Default: -1, ie none
+        :param target:      (optional) Index of the compartment the function is an input of. Default: -1, ie none
+        :param label:       (optional) Label of the end outside the model, for drawing. Default: ''
+        :param source_rank: (optional) Rank within the outputs of the source, eg of a replaced output. Default: last
+        :param target_rank: (optional) Rank within the inputs of the target, eg of a replaced input. Default: last
+        :returns:           Index of the flow.
+        """
+        flow = len(self.funcs)
+        values = {
+            "source": source,
+            "target": target,
+            "source_rank": self._next_rank() if source_rank is None else source_rank,
+            "target_rank": self._next_rank() if target_rank is None else target_rank,
+            "kind": _kind(func),
+        }
+        for name, value in values.items():
+            self._flows[name] = _grow(self._flows[name], flow + 1)
+            self._flows[name][flow] = value
+        self.funcs.append(func)
+        self.labels.append(label)
+        self.parameters.append(getattr(func, "parameter", None))
+        self._cache.clear()
+        return flow
+
+    def _ordered(self, end: str, index: int) -> np.ndarray:
+        if end not in self._cache:
+            # Group the flows of all compartments at once, by compartment and then by rank
+            ends = getattr(self, end)
+            order = np.lexsort((getattr(self, end + "_rank"), ends))
+            order = order[ends[order] >= 0]
+            bounds = np.searchsorted(ends[order], np.arange(len(self.names) + 1))
+            self._cache[end] = [order[a:b] for a, b in zip(bounds[:-1], bounds[1:])]
+        ordered = self._cache[end]
+        return ordered[index] if index < len(ordered) else np.empty(0, dtype=np.int64)
+
+    def inputs(self, index: int) -> np.ndarray:
+        """Get the flows into a compartment, in order.
+
+        :param index:   Index of the compartment.
+        :returns:       Array of flow indices.
+        """
+        return self._ordered("target", index)
+
+    def outputs(self, index: int) -> np.ndarray:
+        """Get the flows out of a compartment, in order.
+
+        :param index:   Index of the compartment.
+        :returns:       Array of flow indices.
+        """
+        return self._ordered("source", index)
+
+    def move_target(self, flow: int, target: int) -> int:
+        """Make a flow the last input of a different compartment.
+
+        :param flow:    Index of the flow.
+        :param target:  Index of the new target compartment.
+        :returns:       Former rank of the flow among the inputs of its target.
+        """
+        rank = self._flows["target_rank"][flow]
+        self._flows["target"][flow] = target
+        self._flows["target_rank"][flow] = self._next_rank()
+        self._cache.clear()
+        return rank
+
+    def detach_source(self, flow: int) -> int:
+        """Make a flow no longer an output of its source compartment, eg once it is replaced by another one.
+
+        :param flow:    Index of the flow.
+        :returns:       Former rank of the flow among the outputs of its source.
+        """
+        self._flows["source"][flow] = -1
+        self._cache.clear()
+        return self._flows["source_rank"][flow]
+
+    def terms(self) -> list:
+        """Collect the terms of the differential equations of all compartments, ie every flow as an input (sign +1) of
+        its target and an output (sign -1) of its source, ordered by compartment, inputs before outputs, and by rank.
+
+        :returns:   List of (index, sign, function) terms.
+        """
+        if "terms" not in self._cache:
+            self._cache["terms"] = self._terms()
+        return self._cache["terms"]
+
+    def _terms(self) -> list:
+        n = len(self.funcs)
+        index = np.concatenate([self.target, self.source])
+        sign = np.repeat([1, -1], n)
+        rank = np.concatenate([self.target_rank, self.source_rank])
+        flow = np.tile(np.arange(n), 2)
+        order = np.lexsort((rank, -sign, index))
+        order = order[index[order] >= 0]
+        return [(int(i), int(s), self.funcs[f]) for i, s, f in zip(index[order], sign[order], flow[order])]
+
+    def edges(self) -> list:
+        """List the edges of the network as drawn: transfers from compartment to compartment, and flows from or to
+        the outside, which are drawn from or to a node named by their label.
+
+        :returns:   List of (from, to) names, in order of the flows.
+        """
+        edges = []
+        for source, target, label in zip(self.source, self.target, self.labels):
+            if source >= 0 or target >= 0:
+                edges.append((self.names[source] if source >= 0 else label, self.names[target] if target >= 0 else label))
+        return edges
+
+    def _transfers(self) -> tuple:
+        transfers = (self.source >= 0) & (self.target >= 0)
+        return self.source[transfers], self.target[transfers]
+
+    def adjacency(self):
+        """Sparse adjacency matrix of the transfers between compartments.
+
+        :returns:   Sparse (CSR) matrix of shape (n, n), entry (i, j) counting the flows from i to j.
+        """
+        import scipy.sparse
+
+        source, target = self._transfers()
+        n = len(self.names)
+        return scipy.sparse.csr_matrix((np.ones(len(source)), (source, target)), shape=(n, n))
+
+    def in_degree(self) -> np.ndarray:
+        """Count the transfers into every compartment, from other compartments.
+
+        :returns:   Array of length n.
+        """
+        return np.bincount(self._transfers()[1], minlength=len(self.names))
+
+    def out_degree(self) -> np.ndarray:
+        """Count the transfers out of every compartment, into other compartments.
+
+        :returns:   Array of length n.
+        """
+        return np.bincount(self._transfers()[0], minlength=len(self.names))
+
+    def path(self, start: str, stop: str) -> list:
+        """Find a shortest path of transfers from one compartment to another, by a breadth-first search.
+
+        :param start:   Name of the first compartment.
+        :param stop:    Name of the last compartment.
+        :returns:       List of compartment names from start to stop, or None if drug cannot get from start to stop.
+        """
+        import scipy.sparse.csgraph
+
+        start, stop = self.index[start], self.index[stop]
+        _, predecessors = scipy.sparse.csgraph.breadth_first_order(self.adjacency(), start, return_predecessors=True)
+        if start != stop and predecessors[stop] < 0:
+            return None
+        path = [stop]
+        while path[-1] != start:
+            path.append(predecessors[path[-1]])
+        return [self.names[i] for i in reversed(path)]
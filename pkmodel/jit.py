@@ -0,0 +1,142 @@
+# This holds the optional Numba backend, which compiles the RHS of a CompiledModel into a single native function
+
+import weakref
+
+import numpy as np
+
+from .compiled import CompiledModel
+from .rates import ShiftedRate
+
+# User-defined rate functions are compiled for a scalar time and a contiguous mass distribution vector
+_SIGNATURE = "float64(float64, float64[::1])"
+_FUNCTIONS = weakref.WeakKeyDictionary()
+_KERNELS = dict()
+_MAX_KERNELS = 128
+# Numba takes a long time to import, so it is only imported on first use, and None if it is not installed
+numba = False
+
+
+def available() -> bool:
+    """Check whether Numba is installed, ie whether compile_rhs produces native code. It is imported on the first call.
+
+    :returns:   True if numba can be imported.
+    """
+    global numba
+    if numba is False:
+        try:
+            import numba
+        except ImportError:
+            numba = None
+    return numba is not None
+
+
+def _jit_function(func):
+    """Compile a user-defined rate function in nopython mode, if Numba supports everything it does.
+    The result is cached for as long as the function exists, so that it is compiled only once.
+
+    :param func:    Rate function taking time t and mass distribution vector q.
+    :returns:       Numba dispatcher, or None if the function cannot be compiled.
+    """
+    try:
+        return _FUNCTIONS[func]
+    except (KeyError, TypeError):
+        pass
+    try:
+        jitted = numba.njit(_SIGNATURE)(func)
+    except Exception:
+        # Numba raises a variety of errors for unsupported Python, any of which means the function stays in Python
+        jitted = None
+    try:
+        _FUNCTIONS[func] = jitted
+    except TypeError:
+        pass
+    return jitted
+
+
+def _native_term(func):
+    """Compile a residual term of a compiled model, unwrapping a ShiftedRate into its function and index map.
+
+    :param func:    Residual rate function.
+    :returns:       Tuple (dispatcher, index map, scale), the index map being None if q is passed as it is.
+                    None if the function cannot be compiled.
+    """
+    if isinstance(func, ShiftedRate):
+        jitted = _jit_function(func.func)
+        return None if jitted is None else (jitted, func.index_map, func.scale)
+    jitted = _jit_function(func)
+    return None if jitted is None else (jitted, None, 1)
+
+
+def _kernel(terms: list):
+    """Generate and compile the native RHS of a compiled model: the CSR product K q, plus all compiled residual terms.
+
+    :param terms:   List of (index, sign, dispatcher, index map, scale) compiled residual terms.
+    :returns:       Numba dispatcher of kernel(t, q, forcing, data, indices, indptr).
+    """
+    lines = [
+        "def kernel(t, q, forcing, data, indices, indptr):",
+        "    dq = forcing.copy()",
+        "    for i in range(dq.shape[0]):",
+        "        for p in range(indptr[i], indptr[i + 1]):",
+        "            dq[i] += data[p] * q[indices[p]]",
+    ]
+    namespace = dict()
+    for k, (index, sign, jitted, index_map, scale) in enumerate(terms):
+        namespace["f%d" % k] = jitted
+        argument = "q"
+        if index_map is not None:
+            namespace["targets%d" % k] = np.array([i for i, _ in index_map], dtype=np.int64)
+            namespace["sources%d" % k] = np.array([j for _, j in index_map], dtype=np.int64)
+            lines.append("    q%d = q.copy()" % k)
+            lines.append("    q%d[targets%d] = q[sources%d]" % (k, k, k))
+            argument = "q%d" % k
+        lines.append("    dq[%d] += %r * f%d(t, %s)" % (index, float(sign * scale), k, argument))
+    lines.append("    return dq")
+    source = "\n".join(lines)
+
+    key = (source, tuple((jitted, str(index_map)) for _, _, jitted, index_map, _ in terms))
+    if key not in _KERNELS:
+        if len(_KERNELS) >= _MAX_KERNELS:
+            _KERNELS.clear()
+        exec(source, namespace)
+        _KERNELS[key] = numba.njit(namespace["kernel"])
+    return _KERNELS[key]
+
+
+def compile_rhs(compiled: CompiledModel):
+    """Compile the RHS of a compiled model into native code with Numba. The rate matrix and all user-defined
+    functions which Numba can compile end up in a single native function. Functions it cannot compile (eg
+    ones calling arbitrary Python) are still evaluated in Python, on top of the native result. Without Numba,
+    this falls back to CompiledModel.differential_eq.
+
+    :param compiled:    CompiledModel
+    :returns:           Function rhs(t, q, forcing=None) with the same results as compiled.differential_eq.
+    """
+    if not available():
+        return compiled.differential_eq
+
+    native, python = [], []
+    for index, sign, func in compiled.residual:
+        term = _native_term(func)
+        if term is None:
+            python.append((index, sign, func))
+        else:
+            native.append((index, sign) + term)
+    kernel = _kernel(native)
+    data = np.ascontiguousarray(compiled.K.data, dtype=np.float64)
+    indices = np.ascontiguousarray(compiled.K.indices, dtype=np.int64)
+    indptr = np.ascontiguousarray(compiled.K.indptr, dtype=np.int64)
+
+    def rhs(t: float, q: np.ndarray, forcing: np.ndarray = None) -> np.ndarray:
+        if np.ndim(q) != 1:
+            # The kernel evaluates a single point, vectorized calls go through the compiled model
+            return compiled.differential_eq(t, q, forcing)
+        if forcing is None:
+            forcing = compiled.forcing(t)
+        q = np.ascontiguousarray(q, dtype=np.float64)
+        dq = kernel(float(t), q, np.ascontiguousarray(forcing, dtype=np.float64), data, indices, indptr)
+        for index, sign, func in python:
+            dq[index] += sign * func(t, q)
+        return dq
+
+    return rhs
@@ -0,0 +1,78 @@
+# This holds functionality to solve many variants of a PKModel in parallel
+
+import concurrent.futures
+import os
+
+import numpy as np
+
+from .pk_model import PKModel
+
+
+def _solve_chunk(model_spec: dict, parameter_sets: list, t_eval: np.ndarray, q0: np.ndarray, options: dict) -> list:
+    """Worker function: rebuild the model from its specification, compile it once, and solve it for each set
+    of parameter values in turn.
+
+    :param model_spec:      Specification of the model, as returned by PKModel.to_spec.
+    :param parameter_sets:  List of dictionaries of parameter names and values.
+    :param t_eval:          Array of time-points of interest
+    :param q0:              Initial conditions of mass distribution in compartments.
+    :param options:         Dictionary of method, sparse and engine options, see PKModel.solve.
+    :returns:               List of solutions, in order.
+    """
+    model = PKModel.from_spec(model_spec)
+    compiled = model.compile()
+    results = []
+    for parameters in parameter_sets:
+        unknown = set(parameters) - set(model.parameters)
+        assert not unknown, "Unknown parameters: " + ", ".join(sorted(unknown))
+        values = model.parameters
+        values.update(parameters)
+        results.append(
+            PKModel._solve_compiled(compiled.stack(values, 1), t_eval, q0, **options)
+        )
+    return results
+
+
+def sweep(
+    model,
+    parameter_sets: list,
+    t_eval: np.ndarray,
+    q0: np.ndarray,
+    max_workers: int = None,
+    chunksize: int = None,
+    method: str = "RK45",
+    sparse: bool = False,
+    engine: str = "numerical",
+) -> list:
+    """Solve a model for many sets of parameter values, fanning the independent solves out over a pool of processes.
+    The model is sent to the workers as its specification, so all its functions need to be built-in or defined at
+    module level (see PKModel.to_spec). Results are returned in the order of parameter_sets.
+
+    :param model:           PKModel, or its specification as returned by PKModel.to_spec.
+    :param parameter_sets:  List of dictionaries of parameter names and values, see PKModel.parameters. Parameters not listed keep their model value.
+    :param t_eval:          Array of time-points of interest
+    :param q0:              Initial conditions of mass distribution in compartments.
+    :param max_workers:     (optional) Number of worker processes. Default: number of CPUs.
+    :param chunksize:       (optional) Number of solves sent to a worker at once. Default: about four chunks per worker.
+    :param method:          (optional) Integration method, see PKModel.solve. Default: 'RK45'
+    :param sparse:          (optional) Pass the Jacobian as a sparse matrix, see PKModel.solve. Default: False
+    :param engine:          (optional) 'numerical' or 'analytic', see PKModel.solve. Default: 'numerical'
+    :returns:               List of solutions, one per set of parameter values.
+    """
+    model_spec = model.to_spec() if isinstance(model, PKModel) else model
+    parameter_sets = list(parameter_sets)
+    if chunksize is None:
+        chunksize = max(1, len(parameter_sets) // (4 * (max_workers or os.cpu_count() or 1)))
+    chunks = [parameter_sets[i:i + chunksize] for i in range(0, len(parameter_sets), chunksize)]
+    options = {"method": method, "sparse": sparse, "engine": engine}
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+        solved = executor.map(
+            _solve_chunk,
+            [model_spec] * len(chunks),
+            chunks,
+            [t_eval] * len(chunks),
+            [q0] * len(chunks),
+            [options] * len(chunks),
+        )
+        return [result for chunk in solved for result in chunk]
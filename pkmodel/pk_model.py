@@ -1,12 +1,24 @@
 # This holds the PKModel class
 
 from .compartment import Compartment
-import scipy.integrate
+from .graph import CompartmentGraph
+from .compiled import CompiledModel, _sorted_times
+from .analytic import solve_analytic
+from .profiling import SolverProfile, SegmentProfile
+from .jit import compile_rhs
+from .streaming import RunningSummary, stream
+from .cache import SolveCache
+from .steady import steady_state, periodic_steady_state
+from .adaptive import integrate_adaptive
+from .pkanalysis import auc_model
+from . import spec, declarative, sensitivity
+import json
+import time
 import numpy as np
-import networkx as nx
-import matplotlib.pyplot as plt
 
 from .functions import first_order, dose_constant, dose_steady
+from .dosing import DosingSchedule
+from .rates import FirstOrderRate, DoseConstantRate, DoseSteadyRate, shift, reparametrize
 
 
 class PKModel:
@@ -14,10 +26,11 @@ class PKModel:
     and connecting them with in/output functions. The differential equations for the network can then be solved using scipy.
 
     Fields:
-        -   _resolving_indices:     Dictionary to map names of compartments to their indices in the list.
-        -   _compartments:          List of all Compartment objects the model contains.
-        -   _network_edges:         Keeps track of all newly generated network edges for the purpose of later drawing.
-        -   _in_edge / _out_edge:   Keeps track of special -- potentially shifted -- in/out edges.
+        -   _graph:                 CompartmentGraph holding the compartments, their volumes and all in/output functions.
+        -   _parameters:            Dictionary of the values of all named model parameters, ie volumes, time constants and doses.
+        -   _recipe:                List of all builder calls (method name and arguments) made to create the model.
+        -   _views:                 List of the Compartment views of all compartments, see _compartments.
+        -   _compiled:              CompiledModel of the current state of the model without a dosing schedule, or None until compiled.
 
     Methods:
         -   create_model:           Set up a basic one-compartment model.
@@ -26,25 +39,43 @@ class PKModel:
         -   add_sibling:            Add a side-by-side/sibling node to an existing node, with an equilibrium in between.
         -   add_input:              Manually add an input function to a node.
         -   add_output:             Manually add an output function to a node.
+        -   set_parameter:          Change the value of a named model parameter.
         -   differential_eq:        The complete set of differential equations for all compartments.
+        -   compile:                Lower the model into a sparse rate matrix and forcing vector.
         -   solve:                  Solve the ODEs for some initial conditions using the scipy module.
+        -   solve_adaptive:         Solve the ODEs, choosing the output time points adaptively.
+        -   solve_stream:           Solve the ODEs chunk by chunk, yielding the solution as the integration proceeds.
+        -   solve_population:       Solve the ODEs for many sets of parameter values at once.
+        -   steady_state:           Find the steady state under constant dosing.
+        -   periodic_steady_state:  Find the periodic steady state under repeated dosing.
+        -   load_dict:              Build the model from a declarative description.
+        -   from_dict / from_json:  Create a model from a declarative description.
+        -   to_dict / to_json:      Describe the model declaratively.
+        -   to_spec:                Get a serializable specification of the model.
+        -   from_spec:              Rebuild a model from its specification.
 
         -   __init__:               Basic initialisation, no model created.
-        -   __add_new_index:        Utility method to handle insertion of a new node into the dictionary.
-        -   _permute_list_indices:  Simple utility to permute two list indices.
+        -   _add_parameter:         Utility method to register a named model parameter.
+        -   _solve_compiled:        Solve a compiled model with the chosen engine.
+        -   _integrate:             Integrate a compiled model using the scipy module.
+        -   _jacobian_options:      Jacobian arguments of scipy for implicit methods.
         -   draw_network:           This uses networkx to draw a map of the model
     Properties:
+        -   graph:                  The CompartmentGraph of the model.
+        -   _compartments:          List of Compartment views of all compartments the model contains.
         -   get_compartment_names:  Returns a list of all compartment names of the model, in order of their index.
+        -   parameters:             Returns a dictionary of all named model parameters and their values.
     """
 
     def __init__(self) -> None:
-        """ Very basic init, doesn't create any model -> need to create model by create_model or load_json."""
-        self._compartments = []
-        self._resolving_indices = dict()
-        self._network_edges = []
-        self._in_edge = None
-        self._out_edge = None
-
+        """ Very basic init, doesn't create any model -> need to create model by create_model or load_dict."""
+        self._graph = CompartmentGraph()
+        self._parameters = dict()
+        self._recipe = []
+        self._compiled = None
+        self._views = []
+
+    @spec.recorded
     def create_model(
         self,
         name: str,
@@ -66,40 +97,47 @@ class PKModel:
         :param elimination_func:            (optional) Specify the elimination function as output from the compartment. Default is first order. If a user-defined function is specified, it needs to have parameters already built-in, ie taking only time t and mass distribution vector q arguments.
         :param elimination_time_constant:   (optional) Time constant to be used in the first order default elimination function (to be divided by the volume). Default: 1
         """
+        self._compiled = None
         # Set up input and output functions with the given parameters
+        volume_parameter = self._add_parameter(name + ".volume", volume)
         if dosing_func == dose_constant:
-            in_func = lambda t, q: dosing_func(t, q, dosing_time_constant)
+            in_func = DoseConstantRate(
+                dosing_time_constant, self._add_parameter("dose.X", dosing_time_constant)
+            )
         elif dosing_func == dose_steady:
-            in_func = lambda t, q: dosing_func(
-                t, q, dosing_time_constant, dosing_time_windows
+            in_func = DoseSteadyRate(
+                dosing_time_constant,
+                dosing_time_windows,
+                self._add_parameter("dose.X", dosing_time_constant),
             )
         else:
             in_func = dosing_func
         if elimination_func == first_order:
-            out_func = lambda t, q: elimination_func(
-                t, q, elimination_time_constant / volume, 0
+            out_func = FirstOrderRate(
+                elimination_time_constant / volume,
+                0,
+                self._add_parameter("elimination.k", elimination_time_constant),
+                volume_parameter,
             )
         else:
             out_func = elimination_func
 
-        # Create compartment and add index to the dictionary of indices by name
-        self._resolving_indices[name] = 0
-        self._compartments.append(Compartment(0, volume, in_func, out_func))
-
-        # Add default in/out edges for network drawing
-        self._in_edge = ("", name)
-        self._out_edge = (name, "")
+        # Create the compartment, with unlabelled in/out edges for network drawing
+        index = self._graph.add_compartment(name, volume)
+        self._graph.add_flow(in_func, target=index)
+        self._graph.add_flow(out_func, source=index)
 
-    def _add_new_index(self, new_name: str) -> int:
-        """Determines the index to be used for a new node, and adds its name to the dictionary.
+    def _add_parameter(self, name: str, value: float) -> str:
+        """Registers a named model parameter, so that it can be looked up and varied later on.
 
-        :param new_name:    Name of the node to be created.
-        :returns:           Index of the new node.
+        :param name:    Name of the parameter, in the format '<compartment or edge>.<attribute>'.
+        :param value:   Value of the parameter.
+        :returns:       Name of the parameter.
         """
-        new_index = len(self._compartments)
-        self._resolving_indices[new_name] = new_index
-        return new_index
+        self._parameters[name] = value
+        return name
 
+    @spec.recorded
     def add_parent(
         self,
         node: str,
@@ -120,13 +158,18 @@ class PKModel:
         :param shift_input:                 (optional) Decide whether the first input of the child should be transferred to the parent as input. Default is yes. Set to False, if the first input is not a dosing!
         """
 
+        self._compiled = None
         # Create the parent and the appropriate connection
-        new_index = self._add_new_index(new_name)
-        old_index = self._resolving_indices[node]
+        old_index = self._graph.index[node]
+        new_index = self._graph.add_compartment(new_name, volume)
 
+        volume_parameter = self._add_parameter(new_name + ".volume", volume)
         if connection_function == first_order:
-            connection = lambda t, q: connection_function(
-                t, q, connection_time_constant / volume, new_index
+            connection = FirstOrderRate(
+                connection_time_constant / volume,
+                new_index,
+                self._add_parameter(new_name + "->" + node + ".k", connection_time_constant),
+                volume_parameter,
             )
         else:
             connection = connection_function
@@ -134,27 +177,14 @@ class PKModel:
         if (
             shift_input
         ):  # if needed, shift the childs first input to be the new parents input
-            shifted_func = self._compartments[old_index].input_funcs[0]
-            new_comp = Compartment(new_index, volume, shifted_func, connection)
-            self._compartments[old_index].input_funcs[0] = connection
-            self._in_edge = ("", new_name)
+            rank = self._graph.move_target(self._graph.inputs(old_index)[0], new_index)
+            self._graph.add_flow(connection, source=new_index, target=old_index, target_rank=rank)
         else:
             # create new compartment, but don't do shifting (means that new parent input will be empty, unless filled with add_input).
             # The child will then get one more connection than before.
+            self._graph.add_flow(connection, source=new_index, target=old_index)
 
-            new_comp = Compartment(new_index, volume, None, connection)
-            self._compartments[old_index].input_funcs.append(connection)
-
-        self._compartments.append(new_comp)
-
-        # Add appropriate network edge
-        self._network_edges.append((new_name, node))
-
-    def _permute_list_indices(self, l: list, a: int, b: int) -> list:
-        """ Little helper function to permute two indices of a list """
-        l[a], l[b] = l[b], l[a]
-        return l
-
+    @spec.recorded
     def add_child(
         self,
         node: str,
@@ -177,53 +207,48 @@ class PKModel:
         :param shift_correct_for_volume_change:     (optional) This determines whether a correction for changed volume is made on shifting the input function. Default is yes. Set to False, if the first input is not a first-order process.
         """
 
+        self._compiled = None
         # Create the child and the appropriate connection
-        new_index = self._add_new_index(new_name)
-        old_index = self._resolving_indices[node]
+        old_index = self._graph.index[node]
+        new_index = self._graph.add_compartment(new_name, volume)
+        old_volume = self._graph.volumes[old_index]
 
+        volume_parameter = self._add_parameter(new_name + ".volume", volume)
         if connection_function == first_order:
-            connection = lambda t, q: connection_function(
-                t,
-                q,
-                connection_time_constant / self._compartments[old_index].volume,
+            connection = FirstOrderRate(
+                connection_time_constant / old_volume,
                 old_index,
+                self._add_parameter(node + "->" + new_name + ".k", connection_time_constant),
+                node + ".volume",
             )
         else:
             connection = connection_function
 
         if shift_output:
             # if needed, shift the parents first output to be the new child's output
-            # We will need to take care to permute the list indices of the differential equation, as to pass on on the correct mass distribution vector for shifting
-            temp = self._compartments[old_index].output_funcs[
-                0
-            ]  # Needed because lambda functions are mutable in python ...
+            # The indices of parent and child are swapped for the shifted function, which is resolved here once
+            shifted_flow = self._graph.outputs(old_index)[0]
+            temp = self._graph.funcs[shifted_flow]
             if shift_correct_for_volume_change:
-                # If necessary, adjust for the effect of the change in volume on the first order rate constant, assuming the time constant is the same self._permute_list_indices(q.copy(),new_index,old_index)
-                shift_function = (
-                    lambda t, q: temp(
-                        t, self._permute_list_indices(q.copy(), new_index, old_index)
-                    )
-                    * self._compartments[old_index].volume
-                    / volume
+                # If necessary, adjust for the effect of the change in volume on the first order rate constant, assuming the time constant is the same
+                shift_function = shift(
+                    temp,
+                    new_index,
+                    old_index,
+                    old_volume / volume,
+                    (node + ".volume", volume_parameter),
                 )
             else:
-                shift_function = lambda t, q: temp(
-                    t, self._permute_list_indices(q.copy(), new_index, old_index)
-                )
-            new_comp = Compartment(new_index, volume, connection, shift_function)
-            self._compartments[old_index].output_funcs[0] = connection
-            self._out_edge = (new_name, "")
+                shift_function = shift(temp, new_index, old_index)
+            rank = self._graph.detach_source(shifted_flow)
+            self._graph.add_flow(connection, source=old_index, target=new_index, source_rank=rank)
+            self._graph.add_flow(shift_function, source=new_index, label=self._graph.labels[shifted_flow])
         else:
             # create new compartment, but don't do shifting (means that new child output will be empty, unless filled with add_output).
             # The parent will then get one more connection than before.
-            new_comp = Compartment(new_index, volume, connection, None)
-            self._compartments[old_index].output_funcs.append(connection)
-
-        self._compartments.append(new_comp)
-
-        # Add appropriate network edge
-        self._network_edges.append((node, new_name))
+            self._graph.add_flow(connection, source=old_index, target=new_index)
 
+    @spec.recorded
     def add_sibling(
         self,
         node: str,
@@ -242,39 +267,39 @@ class PKModel:
         :param connection_time_constant:    (optional) Time constant for the first-order default connection function (to be divided by the volume). Default: 1
         """
 
-        # Create the child and the appropriate connection
-        new_index = self._add_new_index(new_name)
-        old_index = self._resolving_indices[node]
-
+        self._compiled = None
+        # Create the sibling and the appropriate connections
+        old_index = self._graph.index[node]
         if (
             connection_function == first_order
         ):  # Create the connection functions in both directions! out = to the sibling, in = from the sibling
-            connection_out = lambda t, q: connection_function(
-                t,
-                q,
-                connection_time_constant / self._compartments[old_index].volume,
+            volume_parameter = self._add_parameter(new_name + ".volume", volume)
+            time_constant_parameter = self._add_parameter(
+                node + "->" + new_name + ".k", connection_time_constant
+            )
+            new_index = self._graph.add_compartment(new_name, volume)
+            connection_out = FirstOrderRate(
+                connection_time_constant / self._graph.volumes[old_index],
                 old_index,
+                time_constant_parameter,
+                node + ".volume",
             )
-            connection_in = lambda t, q: connection_function(
-                t, q, connection_time_constant / volume, new_index
+            connection_in = FirstOrderRate(
+                connection_time_constant / volume,
+                new_index,
+                time_constant_parameter,
+                volume_parameter,
             )
         else:
             raise TypeError(
                 "Connections between siblings need to be first order for equilibrium exchange! Consider adding inputs and outputs manually if you wish different behaviour."
             )
 
-        # Add new compartment with appropriate in/out streams
-        new_comp = Compartment(new_index, volume, connection_out, connection_in)
-        # Add the reverse streams to the original nodes
-        self._compartments[old_index].input_funcs.append(connection_in)
-        self._compartments[old_index].output_funcs.append(connection_out)
-
-        self._compartments.append(new_comp)
-
-        # Add network double edge
-        self._network_edges.append((node, new_name))
-        self._network_edges.append((new_name, node))
+        # Connect both ways, which gives a double edge in the network
+        self._graph.add_flow(connection_out, source=old_index, target=new_index)
+        self._graph.add_flow(connection_in, source=new_index, target=old_index)
 
+    @spec.recorded
     def add_input(self, node: str, in_func, label: str = "unk. input") -> None:
         """Add an input function to a specified node manually.
 
@@ -282,9 +307,10 @@ class PKModel:
         :param in_func: Input function, needs to take two positional arguments, time t and mass distribution vector q.
         :param label:   (optional) Label to be used for input in graph drawing.
         """
-        self._compartments[self._resolving_indices[node]].input_funcs.append(in_func)
-        self._network_edges.append((label, node))
+        self._compiled = None
+        self._graph.add_flow(in_func, target=self._graph.index[node], label=label)
 
+    @spec.recorded
     def add_output(self, node: str, out_func, label: str = "unk. output") -> None:
         """Add an output function to a specified node manually.
 
@@ -292,8 +318,46 @@ class PKModel:
         :param out_func:    Output function, needs to take two positional arguments, time t and mass distribution vector q.
         :param label:       (optional) Label to be used for output in graph drawing.
         """
-        self._compartments[self._resolving_indices[node]].output_funcs.append(out_func)
-        self._network_edges.append((node, label))
+        self._compiled = None
+        self._graph.add_flow(out_func, source=self._graph.index[node], label=label)
+
+    @spec.recorded
+    def set_parameter(
+        self, name: str, value: float = None, k: float = None, volume: float = None, X: float = None
+    ) -> None:
+        """Change the value of a named model parameter (see PKModel.parameters), given either by its full name and value,
+        eg set_parameter('central.volume', 2), or by the name of its compartment or edge and the attribute as keyword,
+        eg set_parameter('central->peripheral', k=0.3). All rate functions depending on the parameter are updated,
+        including time constants divided by a changed volume. The compiled model is updated in place, re-evaluating
+        only the affected entries, so that the model can be solved again right away without being rebuilt.
+
+        :param name:    Full name of the parameter, or the name of its compartment or edge if an attribute is given.
+        :param value:   (optional) New value of the parameter of the full name.
+        :param k:       (optional) New time constant '<name>.k'.
+        :param volume:  (optional) New volume '<name>.volume'.
+        :param X:       (optional) New dose '<name>.X'.
+        """
+        values = {name: value} if value is not None else dict()
+        for attribute, new in (("k", k), ("volume", volume), ("X", X)):
+            if new is not None:
+                values[name + "." + attribute] = new
+        if not values:
+            raise ValueError("A new value needs to be given for parameter '%s'." % name)
+        unknown = set(values) - set(self._parameters)
+        assert not unknown, "Unknown parameters: " + ", ".join(sorted(unknown))
+        for parameter, new in values.items():
+            if parameter.endswith(".volume") and not new > 0:
+                raise ValueError("The volume '%s' needs to be positive." % parameter)
+
+        self._parameters.update(values)
+        for parameter, new in values.items():
+            compartment = parameter[:-len(".volume")]
+            if parameter.endswith(".volume") and compartment in self._graph.index:
+                self._graph.volumes[self._graph.index[compartment]] = new
+        for func in self._graph.funcs:
+            reparametrize(func, self._parameters, set(values))
+        if self._compiled is not None:
+            self._compiled.update(self._parameters, set(values))
 
     def differential_eq(self, t: float, q: list) -> list:
         """Get the vector (list) of differential equation right hand sides, ie dq/dt, for all compartments.
@@ -303,47 +367,523 @@ class PKModel:
         :returns: List of the RHS values of the compartment differential equations.
         """
         assert len(q) == len(
-            self._compartments
+            self._graph
         ), "Need to have vector of the same dimensions as the number of compartments"
-        return [comp.differential_eq(t, q) for comp in self._compartments]
-
-    def solve(self, t_eval: np.ndarray, q0: np.ndarray):
+        # The terms of all compartments are cached by the graph, so that the flows are not looked up on every call
+        dq = [0] * len(self._graph)
+        try:
+            for index, sign, func in self._graph.terms():
+                dq[index] = dq[index] + sign * func(t, q)
+        except TypeError:
+            raise TypeError("All inputs and outputs must be functions which take 2 arguments: time t and mass distribution vector q.")
+        return dq
+
+    def compile(self, schedule: DosingSchedule = None) -> CompiledModel:
+        """Lower the model into the form dq/dt = K q + b(t), with a sparse rate matrix K and a forcing vector b(t).
+        All built-in rate functions are lowered, user-defined functions are kept as residual terms
+        and evaluated individually. Without a schedule, the compiled model is kept until the structure of the model
+        is changed, and updated in place by PKModel.set_parameter.
+
+        :param schedule:    (optional) DosingSchedule, whose infusions are added to the forcing and whose boluses are kept as jumps.
+        :returns:           CompiledModel of the current state of the model.
+        """
+        if schedule is None:
+            if self._compiled is None:
+                self._compiled = CompiledModel.from_graph(self._graph)
+            return self._compiled
+        infusions = [
+            (start, stop, self._graph.index[name], rate) for start, stop, name, rate in schedule.infusions
+        ]
+        boluses = [(time, self._graph.index[name], amount) for time, name, amount in schedule.boluses]
+        return CompiledModel.from_graph(self._graph, infusions, boluses)
+
+    def solve(
+        self,
+        t_eval: np.ndarray,
+        q0: np.ndarray,
+        method: str = "RK45",
+        sparse: bool = False,
+        engine: str = "numerical",
+        schedule: DosingSchedule = None,
+        profile: bool = False,
+        jit: bool = False,
+        cache: SolveCache = None,
+        sensitivities: list = None,
+        auc: bool = False,
+    ):
         """Solve the PKModel for a set of initial conditions over a series of time points.
-
-        :param t_eval:  Array of time-points of interest
+        The model is compiled first, so that the RHS is evaluated as a single matrix-vector product.
+        For the implicit methods suited to stiff models (Radau, BDF, LSODA), the Jacobian is supplied
+        from the compiled model: exact for built-in rate functions, by finite differences for user-defined ones.
+        The integration is restarted at the edges of dose_steady windows and at the doses of the schedule,
+        so that the integrator never steps across a discontinuity of the dosing. At the time of a bolus,
+        the solution after the bolus is reported.
+
+        :param t_eval:  Increasing array of time-points of interest
         :param q0:      Initial conditions of mass distribution in compartments. This must have the correct length of the number of compartments present.
+        :param method:  (optional) Integration method passed to scipy.integrate.solve_ivp. Default: 'RK45'
+        :param sparse:  (optional) Pass the Jacobian as a sparse matrix, for large models. Not supported by LSODA. Default: False
+        :param engine:  (optional) 'numerical' to integrate with scipy, or 'analytic' to propagate linear models exactly with matrix exponentials (method and sparse are then ignored). Default: 'numerical'
+        :param schedule:    (optional) DosingSchedule of boluses and infusions, in addition to the dosing functions of the model. Default: None
+        :param profile:     (optional) Record RHS calls, steps and the time spent in user-defined functions, returned as the SolverProfile in the 'profile' field of the result. Default: False
+        :param jit:         (optional) Compile the RHS, including all user-defined functions Numba can handle, into a single native function. Without Numba installed, this has no effect. Default: False
+        :param cache:       (optional) SolveCache to look the result up in, and to add it to if missing. Models with lambdas, and profiled solves, are never cached. Default: None
+        :param sensitivities:   (optional) Names of parameters (see PKModel.parameters) to integrate the forward sensitivities dq/dp of, alongside the state. They are returned as a dictionary of parameter names and arrays of the shape of y in the 'sensitivities' field of the result. Default: None
+        :param auc:     (optional) Integrate the area under the concentration curve of each compartment alongside the state, returned as an array of the shape of y in the 'auc' field of the result (see pkanalysis.metrics), so that it is exact however sparse t_eval is. Default: False
         """
         assert len(q0) == len(
-            self._compartments
+            self._graph
         ), "Initial conditions must be of the same dimensions as the number of compartments."
-        return scipy.integrate.solve_ivp(
-            fun=self.differential_eq,
-            t_span=[t_eval[0], t_eval[-1]],
-            y0=q0,
-            t_eval=t_eval,
+        if cache is not None and not profile and not sensitivities and not auc:
+            key = cache.key(self, t_eval, q0, {"method": method, "sparse": sparse, "engine": engine}, schedule)
+            result = cache.get(key) if key is not None else None
+            if result is None:
+                result = self.solve(t_eval, q0, method, sparse, engine, schedule, jit=jit)
+                if key is not None:
+                    cache.put(key, result)
+            return result
+        compiled, names = self.compile(schedule), self.get_compartment_names
+        if sensitivities:
+            unknown = set(sensitivities) - set(self._parameters)
+            assert not unknown, "Unknown parameters: " + ", ".join(sorted(unknown))
+            compiled = sensitivity.augment(compiled, self._parameters, sensitivities)
+            q0 = np.concatenate([q0, np.zeros(len(names) * len(sensitivities))])
+            names = names + ["d%s/d%s" % (name, parameter) for parameter in sensitivities for name in names]
+        if auc:
+            n = len(self._graph)
+            compiled = auc_model(compiled, self._graph.volumes)
+            q0 = np.concatenate([q0, np.zeros(n)])
+            names = names + ["AUC(%s)" % name for name in names[:n]]
+
+        if not profile:
+            result = self._solve_compiled(compiled, t_eval, q0, method, sparse, engine, jit=jit)
+        else:
+            report = SolverProfile(method if engine == "numerical" else engine, names)
+            start = time.perf_counter()
+            result = self._solve_compiled(report.instrument(compiled), t_eval, q0, method, sparse, engine, report, jit)
+            report.wall_time = time.perf_counter() - start
+            result.profile = report
+        if auc:
+            result.auc, result.y = result.y[-len(self._graph):], result.y[:-len(self._graph)]
+        if sensitivities:
+            result = sensitivity.split(result, len(self._graph), sensitivities)
+        return result
+
+    @staticmethod
+    def _solve_compiled(
+        compiled: CompiledModel,
+        t_eval: np.ndarray,
+        q0: np.ndarray,
+        method: str,
+        sparse: bool,
+        engine: str,
+        profile: SolverProfile = None,
+        jit: bool = False,
+        tolerances: dict = None,
+    ):
+        """Solve a compiled model with the chosen engine, see PKModel.solve and PKModel._integrate for the arguments."""
+        if engine == "analytic":
+            return solve_analytic(compiled, t_eval, q0)
+        elif engine != "numerical":
+            raise ValueError("engine needs to be either 'numerical' or 'analytic'.")
+        return PKModel._integrate(compiled, t_eval, q0, method, sparse, profile, jit, tolerances)
+
+    @staticmethod
+    def _integrate(
+        compiled: CompiledModel,
+        t_eval: np.ndarray,
+        q0: np.ndarray,
+        method: str,
+        sparse: bool,
+        profile: SolverProfile = None,
+        jit: bool = False,
+        tolerances: dict = None,
+    ):
+        """Integrate a compiled model with scipy.integrate.solve_ivp, supplying the Jacobian for implicit methods.
+        Linear models pass K as a constant matrix. Otherwise, the residual is differentiated by finite differences:
+        column by column in the dense case, or by scipy using the structural sparsity pattern in the sparse case.
+        The interval is split at the breakpoints of the compiled model. On each segment the forcing is constant,
+        and boluses are applied in between segments.
+
+        :param compiled:    CompiledModel to integrate.
+        :param t_eval:      Array of time-points of interest
+        :param q0:          Initial conditions of mass distribution in compartments.
+        :param method:      Integration method passed to scipy.integrate.solve_ivp.
+        :param sparse:      Pass the Jacobian (or its sparsity pattern) as a sparse matrix. Not supported by LSODA.
+        :param profile:     (optional) SolverProfile to record the RHS calls and the steps of every segment into. Default: None
+        :param jit:         (optional) Evaluate the RHS with the native function of pkmodel.jit.compile_rhs. Default: False
+        :param tolerances:  (optional) Dictionary of 'rtol' and/or 'atol' passed to scipy.integrate.solve_ivp. Default: None, ie those of scipy
+        """
+        import scipy.integrate
+        import scipy.optimize
+
+        t_eval = _sorted_times(t_eval)
+        options = PKModel._jacobian_options(compiled, t_eval[0], q0, method, sparse)
+        if tolerances is not None:
+            options.update(tolerances)
+        rhs = compile_rhs(compiled) if jit else compiled.differential_eq
+        edges = np.concatenate([t_eval[:1], compiled.breakpoints(t_eval[0], t_eval[-1]), t_eval[-1:]])
+        q = np.asarray(q0, dtype=float) + compiled.jump(edges[0])
+        y = np.full((len(q), len(t_eval)), np.nan)
+        counts = {"nfev": 0, "njev": 0, "nlu": 0}
+        status, message = 0, "The solver successfully reached the end of the integration interval."
+
+        for a, b in zip(edges[:-1], edges[1:]):
+            last = b == edges[-1]
+            # Points at the start of a segment belong to it, so that they are reported after any bolus
+            inside = (t_eval >= a) & ((t_eval <= b) if last else (t_eval < b))
+            forcing = compiled.forcing(0.5 * (a + b))
+            fun = lambda t, q: rhs(t, q, forcing)  # noqa: E731
+            if profile is not None:
+                record = SegmentProfile(a, b)
+                profile.segments.append(record)
+                start = time.perf_counter()
+            segment = scipy.integrate.solve_ivp(
+                fun=fun if profile is None else profile.timed(fun),
+                t_span=[a, b],
+                y0=q,
+                t_eval=t_eval[inside] if last else np.append(t_eval[inside], b),
+                method=method if profile is None else profile.solver(method, record),
+                **options,
+            )
+            for key in counts:
+                counts[key] += segment[key]
+            if profile is not None:
+                record.time = time.perf_counter() - start
+                record.nfev, record.njev, record.nlu = segment.nfev, segment.njev, segment.nlu
+            if not segment.success:
+                status, message = segment.status, segment.message
+                break
+            if last:
+                y[:, inside] = segment.y
+            else:
+                y[:, inside] = segment.y[:, :-1]
+                q = segment.y[:, -1] + compiled.jump(b)
+        if status == 0:
+            y[:, -1] += compiled.jump(edges[-1])
+
+        return scipy.optimize.OptimizeResult(
+            t=t_eval,
+            y=y,
+            sol=None,
+            t_events=None,
+            y_events=None,
+            status=status,
+            message=message,
+            success=status >= 0,
+            **counts,
+        )
+
+    @staticmethod
+    def _jacobian_options(compiled: CompiledModel, t0: float, q0: np.ndarray, method: str, sparse: bool) -> dict:
+        """Get the keyword arguments of scipy.integrate.solve_ivp which supply the Jacobian to implicit methods.
+
+        :param compiled:    CompiledModel to integrate.
+        :param t0:          Initial time point.
+        :param q0:          Initial conditions of mass distribution in compartments.
+        :param method:      Integration method passed to scipy.integrate.solve_ivp.
+        :param sparse:      Pass the Jacobian (or its sparsity pattern) as a sparse matrix. Not supported by LSODA.
+        :returns:           Dictionary holding 'jac' or 'jac_sparsity' and 'vectorized', empty for explicit methods.
+        """
+        if method not in ("Radau", "BDF", "LSODA"):
+            return {}
+        sparse = sparse and method != "LSODA"
+        if compiled.is_linear:
+            # The Jacobian of a linear model is constant, so scipy only needs the matrix itself (LSODA needs a function)
+            J = compiled.jacobian(t0, q0, sparse=sparse)
+            return {"jac": (lambda t, q: J) if method == "LSODA" else J}
+        if sparse:
+            # scipy then differentiates by finite differences, in a single call if the RHS is vectorized
+            return {"jac_sparsity": compiled.jac_sparsity, "vectorized": compiled.vectorized}
+        return {"jac": lambda t, q: compiled.jacobian(t, q)}
+
+    def solve_adaptive(
+        self,
+        t_span: tuple,
+        q0: np.ndarray,
+        rtol: float = 1e-3,
+        atol: float = 1e-6,
+        method: str = "RK45",
+        sparse: bool = False,
+        schedule: DosingSchedule = None,
+    ):
+        """Solve the PKModel over a time span without choosing the time points of interest in advance. The output points
+        are sampled from the dense output of the solver, such that linear interpolation in between them (eg when plotting)
+        follows the solution within the tolerances: they are dense where the solution curves, eg right after the start
+        or end of a dose, and sparse where it is flat. The edges of dosing windows are always output points, and at the
+        time of a bolus, the values before and after it are both reported.
+
+        :param t_span:      Tuple (t0, tf) of the start and end time.
+        :param q0:          Initial conditions of mass distribution in compartments. This must have the correct length of the number of compartments present.
+        :param rtol:        (optional) Relative tolerance of the linear interpolation of the output. Default: 1e-3
+        :param atol:        (optional) Absolute tolerance of the linear interpolation of the output. Default: 1e-6
+        :param method:      (optional) Integration method passed to scipy.integrate.solve_ivp. Default: 'RK45'
+        :param sparse:      (optional) Pass the Jacobian as a sparse matrix, see PKModel.solve. Default: False
+        :param schedule:    (optional) DosingSchedule of boluses and infusions, in addition to the dosing functions of the model. Default: None
+        :returns:           Result object with fields t and y of the output points, and the continuous solution in field 'sol',
+                            a DenseSolution which can be evaluated at any time within the span.
+        """
+        assert len(q0) == len(
+            self._graph
+        ), "Initial conditions must be of the same dimensions as the number of compartments."
+        compiled = self.compile(schedule)
+        options = self._jacobian_options(compiled, t_span[0], q0, method, sparse)
+        return integrate_adaptive(compiled, t_span, q0, method, options, rtol, atol)
+
+    def solve_stream(
+        self,
+        t_eval: np.ndarray,
+        q0: np.ndarray,
+        chunk_size: int = 10000,
+        downsample: int = 1,
+        summary: RunningSummary = None,
+        method: str = "RK45",
+        sparse: bool = False,
+        engine: str = "numerical",
+        schedule: DosingSchedule = None,
+    ):
+        """Solve the PKModel like PKModel.solve, but yield the solution in chunks as the integration proceeds, so that
+        memory stays bounded however long the horizon is. Every chunk is a result object like the one of PKModel.solve,
+        which can eg be plotted, written to disk, or reduced and discarded.
+
+        :param t_eval:      Increasing array of time-points of interest
+        :param q0:          Initial conditions of mass distribution in compartments. This must have the correct length of the number of compartments present.
+        :param chunk_size:  (optional) Number of time points of t_eval integrated per chunk. Default: 10000
+        :param downsample:  (optional) Only keep every downsample-th time point of t_eval in the yielded chunks. Default: 1
+        :param summary:     (optional) RunningSummary, which is updated with every time point before downsampling. Default: None
+        :param method:      (optional) Integration method passed to scipy.integrate.solve_ivp. Default: 'RK45'
+        :param sparse:      (optional) Pass the Jacobian as a sparse matrix, see PKModel.solve. Default: False
+        :param engine:      (optional) 'numerical' or 'analytic', see PKModel.solve. Default: 'numerical'
+        :param schedule:    (optional) DosingSchedule of boluses and infusions, in addition to the dosing functions of the model. Default: None
+        :returns:           Generator of result objects with fields t and y of each chunk.
+        """
+        assert len(q0) == len(
+            self._graph
+        ), "Initial conditions must be of the same dimensions as the number of compartments."
+        t_eval = _sorted_times(t_eval)
+
+        def solve(compiled, t_chunk, q):
+            return self._solve_compiled(compiled, t_chunk, q, method, sparse, engine)
+
+        return stream(solve, self.compile(schedule), t_eval, q0, chunk_size, downsample, summary)
+
+    def solve_population(
+        self,
+        param_table: np.ndarray,
+        t_eval: np.ndarray,
+        q0: np.ndarray,
+        parameter_names: list = None,
+        method: str = "RK45",
+        sparse: bool = True,
+        chunk_size: int = 1000,
+        schedule: DosingSchedule = None,
+    ):
+        """Solve the PKModel for a population of virtual patients, which share the model structure but differ in their
+        parameter values. The patients are integrated together as one block-diagonal system, in chunks of chunk_size
+        patients, so that the model is neither rebuilt nor recompiled per patient. Note that the step size within a chunk
+        is set by the fastest patient.
+
+        :param param_table:     Array of shape (n_patients, n_params) of parameter values, one row per patient.
+        :param t_eval:          Array of time-points of interest
+        :param q0:              Initial conditions, either shared (length of the number of compartments) or per patient, of shape (n_patients, n_compartments).
+        :param parameter_names: (optional) Names of the parameters in the columns of param_table, see PKModel.parameters. Parameters not listed keep their model value. Default: all parameters, in order.
+        :param method:          (optional) Integration method passed to scipy.integrate.solve_ivp. Default: 'RK45'
+        :param sparse:          (optional) Pass the Jacobian as a sparse matrix. Default: True
+        :param chunk_size:      (optional) Maximum number of patients integrated together. Default: 1000
+        :param schedule:        (optional) DosingSchedule applied to every patient, see PKModel.solve. Default: None
+        :returns:               Result object with fields t, and y of shape (n_patients, n_compartments, n_times).
+        """
+        import scipy.optimize
+
+        if parameter_names is None:
+            parameter_names = list(self._parameters)
+        param_table = np.atleast_2d(np.asarray(param_table, dtype=float))
+        n_patients, n = param_table.shape[0], len(self._graph)
+        assert param_table.shape[1] == len(
+            parameter_names
+        ), "Parameter table must have one column per parameter name."
+        unknown = set(parameter_names) - set(self._parameters)
+        assert not unknown, "Unknown parameters: " + ", ".join(sorted(unknown))
+        q0 = np.broadcast_to(np.asarray(q0, dtype=float), (n_patients, n))
+
+        compiled = self.compile(schedule)
+        y = np.empty((n_patients, n, len(t_eval)))
+        success, messages = True, []
+        for start in range(0, n_patients, chunk_size):
+            stop = min(start + chunk_size, n_patients)
+            values = dict(self._parameters)
+            values.update({name: param_table[start:stop, i] for i, name in enumerate(parameter_names)})
+            result = self._integrate(
+                compiled.stack(values, stop - start), t_eval, q0[start:stop].ravel(), method, sparse
+            )
+            y[start:stop] = result.y.reshape(stop - start, n, -1)
+            success = success and result.success
+            messages.append(result.message)
+
+        return scipy.optimize.OptimizeResult(
+            t=np.asarray(t_eval), y=y, success=success, message=" ".join(set(messages))
         )
 
+    def steady_state(self, t: float = None, q_guess: np.ndarray = None, schedule: DosingSchedule = None) -> np.ndarray:
+        """Find the steady state of the model under constant dosing directly, rather than by integrating over a long
+        horizon: a single linear solve of K q + b = 0 for models of built-in rate functions, and root-finding otherwise.
+        Boluses of the schedule are ignored, as they have no steady state.
+
+        :param t:           (optional) Time point whose dosing is held constant, eg within a dose_steady window. Default: None, ie the dosing after all windows have closed
+        :param q_guess:     (optional) Initial guess of the root-finding for models with user-defined functions. Default: None, ie no drug
+        :param schedule:    (optional) DosingSchedule, whose infusions count towards the dosing at t. Default: None
+        :returns:           Array of the drug mass in each compartment at the steady state.
+        """
+        return steady_state(self.compile(schedule), t, q_guess)
+
+    def periodic_steady_state(
+        self,
+        period: float,
+        t0: float = 0,
+        q_guess: np.ndarray = None,
+        method: str = "RK45",
+        schedule: DosingSchedule = None,
+    ) -> np.ndarray:
+        """Find the periodic steady state of the model under dosing which repeats with the given period (eg dose_steady
+        windows or scheduled doses every period), by the shooting method over the single period starting at t0.
+        For models of built-in rate functions, this takes one propagation over the period and a linear solve,
+        otherwise root-finding with one integration of the period per evaluation.
+
+        :param period:      Period of the dosing.
+        :param t0:          (optional) Start of a period, such that the dosing of [t0, t0 + period] is the repeating one. Default: 0
+        :param q_guess:     (optional) Initial guess of the root-finding for models with user-defined functions. Default: None, ie no drug
+        :param method:      (optional) Integration method passed to scipy.integrate.solve_ivp, for models with user-defined functions. Default: 'RK45'
+        :param schedule:    (optional) DosingSchedule of boluses and infusions, in addition to the dosing functions of the model. Default: None
+        :returns:           Array of the drug mass in each compartment at t0 (before any bolus at t0), which, used as q0 of
+                            PKModel.solve from t0, gives the periodic solution.
+        """
+
+        def solve(compiled, t_eval, q, tolerances):
+            return self._integrate(compiled, t_eval, q, method, False, tolerances=tolerances)
+
+        return periodic_steady_state(solve, self.compile(schedule), period, t0, q_guess)
+
+    @spec.recorded
+    def load_dict(self, description: dict) -> None:
+        """Build the model from a declarative description of its compartments, volumes, doses, eliminations and edges,
+        in a single pass rather than by a sequence of builder calls, see declarative.load for the format.
+        The model needs to be empty.
+
+        :param description: Dictionary describing the model, as returned by PKModel.to_dict.
+        """
+        self._compiled = None
+        declarative.load(self, description)
+
+    @classmethod
+    def from_dict(cls, description: dict):
+        """Create a model from a declarative description, see PKModel.load_dict.
+
+        :param description: Dictionary describing the model.
+        :returns:           New PKModel.
+        """
+        model = cls()
+        model.load_dict(description)
+        return model
+
+    @classmethod
+    def from_json(cls, text: str):
+        """Create a model from a declarative description in json, see PKModel.load_dict.
+
+        :param text:    json string describing the model, as returned by PKModel.to_json.
+        :returns:       New PKModel.
+        """
+        return cls.from_dict(json.loads(text))
+
+    def to_dict(self) -> dict:
+        """Describe the current state of the model declaratively, see declarative.describe. Lambdas cannot be described.
+
+        :returns:   Dictionary of plain data, from which PKModel.from_dict builds an equivalent model.
+        """
+        return declarative.describe(self)
+
+    def to_json(self, indent: int = None) -> str:
+        """Describe the current state of the model declaratively in json, see PKModel.to_dict.
+
+        :param indent:  (optional) Indentation passed to json.dumps. Default: None
+        :returns:       json string.
+        """
+        return json.dumps(self.to_dict(), indent=indent)
+
+    def to_spec(self) -> dict:
+        """Get a serializable specification of the model, ie the sequence of builder calls that created it. Built-in
+        and other module-level functions are referenced by name, so that the specification consists of plain data only,
+        and can be pickled (eg to send it to a worker process) or stored. Lambdas cannot be serialized.
+
+        :returns:   Dictionary holding the pkmodel version and the list of builder steps.
+        """
+        return spec.to_spec(self._recipe)
+
+    @classmethod
+    def from_spec(cls, model_spec: dict):
+        """Rebuild a model from its specification, by replaying the builder calls.
+
+        :param model_spec:  Specification, as returned by PKModel.to_spec.
+        :returns:           New PKModel.
+        """
+        model = cls()
+        spec.build(model, model_spec)
+        return model
+
+    @property
+    def parameters(self) -> dict:
+        """Get the named parameters of the model, ie compartment volumes ('<name>.volume'), time constants of the
+        built-in connections ('<source>-><target>.k', named in the direction the connection was created),
+        the elimination time constant ('elimination.k') and the built-in dose ('dose.X').
+
+        :returns:   dictionary of parameter names and their values, in order of creation.
+        """
+        return dict(self._parameters)
+
+    @property
+    def graph(self) -> CompartmentGraph:
+        """Get the array-backed graph of the model, eg for structure queries such as CompartmentGraph.path.
+        It is shared with the model, which is to be changed by the builder methods and PKModel.set_parameter though,
+        so that the compiled model is kept up to date.
+
+        :returns:   CompartmentGraph of the model.
+        """
+        return self._graph
+
+    @property
+    def _compartments(self) -> list:
+        """Get views of all compartments of the model, in order of their index.
+
+        :returns:   list of Compartment objects.
+        """
+        # Views only hold their index, so they are kept until compartments are added
+        if len(self._views) != len(self._graph):
+            self._views = [Compartment(index, graph=self._graph) for index in range(len(self._graph))]
+        return self._views
+
     @property
     def get_compartment_names(self) -> list:
         """Get names of compartments currently stored in the model.
 
-        :returns:   list of all keys of the dictionary holding the names of compartments.
+        :returns:   list of the names of compartments, in order of their index.
         """
-        return list(self._resolving_indices.keys())
+        return list(self._graph.names)
 
-    def draw_network(self, testing=False, layout=nx.spectral_layout) -> None:
-        """Uses networkx to plot a graphical outline of the generated network.
+    def draw_network(self, testing=False, layout=None) -> None:
+        """Uses networkx to plot a graphical outline of the generated network. networkx and matplotlib are only
+        imported here, so that building and solving models does not need them.
 
         :param testing: (optional) When testing in continuous integration, can't plot.
-        :param layout:  (optional) Provide details of wanted networkx layout.
+        :param layout:  (optional) Provide details of wanted networkx layout. Default: networkx.spectral_layout
         """
+        import networkx as nx
+        import matplotlib.pyplot as plt
+
+        if layout is None:
+            layout = nx.spectral_layout
         G = nx.DiGraph()
 
-        # Collect previously defined edges
-        for edge in self._network_edges:
-            G.add_edge(edge[0], edge[1])
-        G.add_edge(self._in_edge[0], self._in_edge[1])
-        G.add_edge(self._out_edge[0], self._out_edge[1])
+        # Flows from and to the outside are drawn from and to nodes named by their labels
+        G.add_edges_from(self._graph.edges())
 
         pos = layout(G)  # positions for all nodes
 
@@ -1,26 +1,209 @@
-# This will hold visualisation code
-import matplotlib.pyplot as plt
+# This holds the analysis and visualisation of solutions, matplotlib is only imported when plotting
+
+import numpy as np
+
+# Number of last points of an interval whose log-linear fit gives the terminal half-life
+TERMINAL_POINTS = 3
+
+
+def _at(t: np.ndarray, y: np.ndarray, time: float) -> np.ndarray:
+    """Interpolate a solution linearly at a time point within its time span.
+
+    :param t:       Sorted array of time points.
+    :param y:       Array of shape (..., len(t)).
+    :param time:    Time point.
+    :returns:       Array of shape (...).
+    """
+    i = np.clip(np.searchsorted(t, time), 1, len(t) - 1)
+    step = t[i] - t[i - 1]
+    weight = (time - t[i - 1]) / step if step > 0 else 1.0
+    return y[..., i - 1] * (1 - weight) + y[..., i] * weight
+
+
+def _interval(t: np.ndarray, y: np.ndarray, start: float, stop: float) -> tuple:
+    """Cut a solution to an interval, interpolating its values at the ends.
+
+    :param t:           Sorted array of time points.
+    :param y:           Array of shape (..., len(t)).
+    :param start / stop: Ends of the interval, within the time span of t.
+    :returns:           Tuple (t, y) of the points within the interval, including both ends.
+    """
+    inside = (t > start) & (t < stop)
+    t_cut = np.concatenate([[start], t[inside], [stop]])
+    y_cut = np.concatenate([_at(t, y, start)[..., None], y[..., inside], _at(t, y, stop)[..., None]], axis=-1)
+    return t_cut, y_cut
+
+
+def _half_life(t: np.ndarray, c: np.ndarray, points: int) -> np.ndarray:
+    """Terminal half-life ln(2) / lambda, lambda being the elimination rate of a log-linear least-squares fit
+    of the last points of each concentration curve.
+
+    :param t:       Array of time points.
+    :param c:       Array of shape (..., len(t)) of concentrations.
+    :param points:  Number of last points to fit.
+    :returns:       Array of shape (...), NaN where the curve is not positive and decreasing.
+    """
+    t, c = t[-points:], c[..., -points:]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        log_c = np.log(np.where(c > 0, c, np.nan))
+        dt = t - t.mean()
+        slope = np.sum(dt * (log_c - log_c.mean(axis=-1, keepdims=True)), axis=-1) / np.sum(dt ** 2)
+        return np.where(slope < 0, np.log(2) / -slope, np.nan)
+
+
+def metrics(solution, model, intervals: list = None, volumes: np.ndarray = None, terminal_points: int = TERMINAL_POINTS):
+    """Compute the pharmacokinetic summary metrics of the concentration (drug mass divided by volume) in all
+    compartments of a solution in a single vectorized pass, for a single solution of PKModel.solve (y of shape
+    (compartments, points)) as well as a batched one of PKModel.solve_population (y of shape (patients, compartments, points)).
+    If the solution holds the AUC integrated during the solve (see the auc argument of PKModel.solve), it is used
+    rather than the trapezoidal rule, so that the time points can be sparse.
+
+    :param solution:        Result object with fields t and y, eg returned by PKModel.solve.
+    :param model:           PKModel which was solved, providing the compartment names and volumes.
+    :param intervals:       (optional) Sorted edges of dosing intervals, eg [0, 12, 24], to compute the metrics per interval. Default: None, ie the whole time span
+    :param volumes:         (optional) Volumes to divide by instead of those of the model, of shape (compartments,) or (patients, compartments), eg the volumes of each patient. Default: None
+    :param terminal_points: (optional) Number of last points of each interval fitted for the half-life. Default: 3
+    :returns:               Result object with fields
+                                - names:        Compartment names.
+                                - auc:          Area under the concentration curve.
+                                - cmax / tmax:  Maximum concentration and the time it is first reached.
+                                - trough:       Minimum concentration.
+                                - half_life:    Terminal half-life, NaN where the concentration is not decaying at the end.
+                            each of shape (..., compartments), or (..., compartments, intervals) if intervals are given.
+    """
+    import scipy.optimize
+
+    t = np.asarray(solution.t, dtype=float)
+    volumes = model.graph.volumes if volumes is None else np.asarray(volumes, dtype=float)
+    c = np.asarray(solution.y, dtype=float) / volumes[..., None]
+    auc_state = getattr(solution, "auc", None)
+    edges = [t[0], t[-1]] if intervals is None else list(intervals)
+    if not (len(edges) >= 2 and np.all(np.diff(edges) > 0) and edges[0] >= t[0] and edges[-1] <= t[-1]):
+        raise ValueError("The intervals need to be increasing edges within the time span of the solution.")
+
+    results = {"auc": [], "cmax": [], "tmax": [], "trough": [], "half_life": []}
+    for start, stop in zip(edges[:-1], edges[1:]):
+        t_cut, c_cut = _interval(t, c, start, stop)
+        if auc_state is not None:
+            auc = _at(t, auc_state, stop) - _at(t, auc_state, start)
+        else:
+            auc = np.sum(0.5 * (c_cut[..., 1:] + c_cut[..., :-1]) * np.diff(t_cut), axis=-1)
+        results["auc"].append(auc)
+        results["cmax"].append(c_cut.max(axis=-1))
+        results["tmax"].append(t_cut[np.argmax(c_cut, axis=-1)])
+        results["trough"].append(c_cut.min(axis=-1))
+        results["half_life"].append(_half_life(t_cut, c_cut, terminal_points))
+
+    combine = (lambda values: values[0]) if intervals is None else (lambda values: np.stack(values, axis=-1))
+    return scipy.optimize.OptimizeResult(
+        names=model.get_compartment_names, **{name: combine(values) for name, values in results.items()}
+    )
+
+
+def auc_model(compiled, volumes: np.ndarray):
+    """Augment a compiled model with the AUC of the concentration in each compartment as extra states,
+    d AUC_i / dt = q_i / V_i, which are appended after all states of the model.
+
+    :param compiled:    CompiledModel, whose first len(volumes) states are the compartments.
+    :param volumes:     Array of the compartment volumes.
+    :returns:           CompiledModel with len(volumes) more states.
+    """
+    import scipy.sparse
+    from .compiled import CompiledModel
+
+    n, size = len(volumes), compiled.K.shape[0]
+    rates = scipy.sparse.csr_matrix((1 / np.asarray(volumes, dtype=float), (np.arange(n), np.arange(n))), shape=(n, size))
+    K = scipy.sparse.bmat([[compiled.K, scipy.sparse.csr_matrix((size, n))], [rates, None]], format="csr")
+    b = np.concatenate([compiled.b, np.zeros(n)])
+    W = scipy.sparse.vstack([compiled.W, scipy.sparse.csr_matrix((n, compiled.W.shape[1]))], format="csr")
+    return CompiledModel(K, b, W, compiled.window_times, compiled.residual, boluses=compiled.boluses)
+
+
+def decimate(y: np.ndarray, max_points: int) -> np.ndarray:
+    """Choose the points of curves to be drawn at a limited resolution, eg one bucket of consecutive points per pixel:
+    the minimum and the maximum of every curve within each of max_points / 2 buckets are kept, as are the first and
+    last point, so that peaks and troughs are drawn however many points are dropped.
+
+    :param y:           Array of shape (points,), or (curves, points) for curves drawn at the same points.
+    :param max_points:  Number of points to be kept per curve, at most.
+    :returns:           Sorted array of the indices of the points to be kept.
+    """
+    y = np.atleast_2d(y)
+    n = y.shape[-1]
+    if n <= max_points:
+        return np.arange(n)
+    bucket = np.arange(n) * max(max_points // 2, 1) // n
+    starts = np.flatnonzero(np.diff(bucket)) + 1
+    first, last = np.concatenate([[0], starts]), np.concatenate([starts - 1, [n - 1]])
+    keep = [np.array([0, n - 1])]
+    for row in y:
+        # Within each bucket, the points are sorted by value
+        order = np.lexsort((row, bucket))
+        keep += [order[first], order[last]]
+    return np.unique(np.concatenate(keep))
+
+
+def _draw(ax, t: np.ndarray, y: np.ndarray, names: list, max_points: int, percentiles: tuple) -> None:
+    """Draw the decimated curves of all compartments, as the median and a band in between percentiles for a batched y."""
+    if y.ndim == 3:
+        lower, median, upper = np.percentile(y, [percentiles[0], 50, percentiles[1]], axis=0)
+    for i, name in enumerate(names):
+        if y.ndim == 3:
+            index = decimate(np.stack([lower[i], median[i], upper[i]]), max_points)
+            (line,) = ax.plot(t[index], median[i, index], label=name)
+            ax.fill_between(t[index], lower[i, index], upper[i, index], color=line.get_color(), alpha=0.3, linewidth=0)
+        else:
+            row = np.asarray(y[i])
+            index = decimate(row, max_points)
+            ax.plot(t[index], row[index], label=name)
 
 
 def plot_solution(
-    solution, names, time_units="time units", mass_units="mass units", title="PK Model", testing=False
+    solution,
+    names=None,
+    time_units="time units",
+    mass_units="mass units",
+    title="PK Model",
+    testing=False,
+    max_points=None,
+    percentiles=(5, 95),
+    filename=None,
 ):
     """Method to plot the solution object returned by PKModel.solve() as a mass / time graph
-    including different compartments.
+    including different compartments. Long solutions are decimated to the resolution of the plot (see decimate).
+    Batched solutions of PKModel.solve_population are drawn as the median over all patients, within a band of percentiles.
 
-    :param solution:        Solution object returned by PKModel.solve()
-    :param names:           List of the compartment names.  Can be obtained by PKModel.get_compartment_names
+    :param solution:        Solution object returned by PKModel.solve() or PKModel.solve_population(), or a StoredSolution
+    :param names:           (optional) List of the compartment names. Can be obtained by PKModel.get_compartment_names. Default = the names of a StoredSolution.
     :param time_units:      (optional) Units for time to be displayed in the axis label. Default = 'time units'.
     :param mass_units:      (optional) Units for mass to be displayed in the axis label. Default = 'mass units'.
     :param title:           (optional) Title of the plot.
     :param testing:         (optional) Don't do plt.show if testing, as this fails the test if window isn't closed. Default = False.
+    :param max_points:      (optional) Number of points drawn per curve, at most. Default = twice the width of the plot in pixels.
+    :param percentiles:     (optional) Lower and upper percentile of the band drawn for batched solutions. Default = (5, 95).
+    :param filename:        (optional) Save the plot to this file on a new figure instead of showing it, which needs no display. Default = None.
+    :returns:               matplotlib Figure of the plot.
     """
+    if filename is None:
+        import matplotlib.pyplot as plt
+
+        ax = plt.gca()
+    else:
+        from matplotlib.figure import Figure
+
+        ax = Figure().add_subplot(111)
+    if names is None:
+        names = solution.names
+    if max_points is None:
+        max_points = 2 * int(ax.bbox.width)
 
-    for i in range(solution.y.shape[0]):
-        plt.plot(solution.t, solution.y[i, :], label=names[i])
-        plt.legend(names)
-        plt.title(title)
-        plt.ylabel("Drug mass [" + mass_units + "]")
-        plt.xlabel("Time [" + time_units + "]")
-    if not testing:
+    _draw(ax, np.asarray(solution.t), solution.y, names, max_points, percentiles)
+    ax.legend()
+    ax.set_title(title)
+    ax.set_ylabel("Drug mass [" + mass_units + "]")
+    ax.set_xlabel("Time [" + time_units + "]")
+    if filename is not None:
+        ax.figure.savefig(filename)
+    elif not testing:
         plt.show()
+    return ax.figure
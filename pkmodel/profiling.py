@@ -0,0 +1,267 @@
+# This holds the instrumentation used by PKModel.solve(profile=True)
+
+import time
+
+import numpy as np
+
+from .compiled import CompiledModel
+from .functions import is_vectorized
+
+
+class FunctionProfile:
+    """Calls of and wall time spent in a single user-defined rate function of a compartment.
+
+    Fields:
+        -   compartment:    Name of the compartment the function belongs to.
+        -   kind:           'input' or 'output'.
+        -   name:           Name of the function, or of its class for callable objects.
+        -   calls:          Number of calls.
+        -   time:           Wall time spent in the function, in seconds.
+    """
+
+    def __init__(self, compartment: str, kind: str, name: str) -> None:
+        self.compartment = compartment
+        self.kind = kind
+        self.name = name
+        self.calls = 0
+        self.time = 0.0
+
+
+class SegmentProfile:
+    """Statistics of the integration of a single segment in between breakpoints.
+
+    Fields:
+        -   t_start / t_stop:   Time span of the segment.
+        -   nfev / njev / nlu:  Counts of RHS evaluations, Jacobian evaluations and LU decompositions reported by scipy.
+        -   accepted:           Number of accepted steps.
+        -   rejected:           Number of rejected step attempts, or None if the method does not reveal them (LSODA).
+        -   time:               Wall time of the segment, in seconds.
+    """
+
+    def __init__(self, t_start: float, t_stop: float) -> None:
+        self.t_start = t_start
+        self.t_stop = t_stop
+        self.nfev = 0
+        self.njev = 0
+        self.nlu = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.time = 0.0
+
+
+class _TimedFunction:
+    """Rate function wrapper which adds up the calls and wall time of the function in a FunctionProfile."""
+
+    def __init__(self, func, record: FunctionProfile) -> None:
+        self.func = func
+        self.record = record
+        self.vectorized = is_vectorized(func)
+
+    def __call__(self, t: float, q: np.ndarray) -> float:
+        start = time.perf_counter()
+        try:
+            return self.func(t, q)
+        finally:
+            self.record.time += time.perf_counter() - start
+            self.record.calls += 1
+
+
+def _attempts(solver, nfev: int, times: list):
+    """Number of step attempts made by a scipy solver within a single call of its _step_impl.
+    Explicit Runge-Kutta methods evaluate the RHS n_stages times per attempt. The implicit methods
+    evaluate it only at the stage times of the current attempt (t + h for BDF, three collocation
+    points for Radau), so that every distinct time point marks an attempt. Only the evaluations of the steps are
+    recorded, not those of finite-difference Jacobians, see SolverProfile.solver.
+
+    :param solver:  scipy.integrate.OdeSolver after the step.
+    :param nfev:    Number of RHS evaluations made during the step.
+    :param times:   Time points of these evaluations.
+    :returns:       Number of attempts, or None if it cannot be inferred.
+    """
+    import scipy.integrate
+
+    if hasattr(solver, "n_stages"):
+        return nfev // solver.n_stages
+    if isinstance(solver, scipy.integrate.BDF):
+        return len(set(times))
+    if isinstance(solver, scipy.integrate.Radau):
+        return len(set(times)) // 3
+    return None
+
+
+class SolverProfile:
+    """Report of a profiled solve, see PKModel.solve(profile=True). Built-in rate functions are lowered into
+    the compiled matrices and are therefore not timed individually: their cost is the compiled_time,
+    ie the time of the RHS evaluations which was not spent in user-defined functions.
+
+    Fields:
+        -   method:         Integration method, or 'analytic' for the analytic engine.
+        -   wall_time:      Wall time of the complete solve, in seconds.
+        -   rhs_calls:      Number of RHS evaluations by the solver.
+        -   rhs_time:       Wall time spent in RHS evaluations, in seconds.
+        -   segments:       List of SegmentProfile, one per integration segment.
+        -   functions:      List of FunctionProfile, one per user-defined rate function.
+
+    Methods:
+        -   __init__:       Set up an empty profile.
+        -   instrument:     Wrap the user-defined functions of a compiled model with timers.
+        -   timed:          Wrap the RHS with a timer.
+        -   solver:         Step-counting subclass of a scipy solver.
+        -   by_compartment: Wall time of the user-defined functions, summed up per compartment.
+        -   as_dict:        The report as plain data.
+        -   report:         The report as a human-readable table.
+    Properties:
+        -   accepted_steps: Total number of accepted steps.
+        -   rejected_steps: Total number of rejected steps, or None if unknown.
+        -   compiled_time:  Wall time of the RHS evaluations outside of user-defined functions.
+    """
+
+    def __init__(self, method: str, names: list) -> None:
+        """Set up an empty profile.
+
+        :param method:  Integration method.
+        :param names:   Compartment names, in order of their index.
+        """
+        self.method = method if isinstance(method, str) else method.__name__
+        self.names = names
+        self.wall_time = 0.0
+        self.rhs_calls = 0
+        self.rhs_time = 0.0
+        self.segments = []
+        self.functions = []
+
+    def instrument(self, compiled: CompiledModel) -> CompiledModel:
+        """Wrap every residual user-defined function of a compiled model with a timer.
+
+        :param compiled:    CompiledModel, which is left unchanged.
+        :returns:           CompiledModel sharing the matrices of compiled, with timed residual functions.
+        """
+        residual = []
+        for index, sign, func in compiled.residual:
+            name = getattr(func, "__qualname__", type(func).__name__)
+            record = FunctionProfile(self.names[index], "input" if sign > 0 else "output", name)
+            self.functions.append(record)
+            residual.append((index, sign, _TimedFunction(func, record)))
+        return CompiledModel(
+            compiled.K, compiled.b, compiled.W, compiled.window_times, residual, compiled.terms, compiled.boluses
+        )
+
+    def timed(self, fun):
+        """Wrap an RHS function of (t, q), so that its calls and wall time are added to the profile.
+
+        :param fun: RHS function.
+        :returns:   Wrapped RHS function.
+        """
+        def wrapper(t, q):
+            start = time.perf_counter()
+            try:
+                return fun(t, q)
+            finally:
+                self.rhs_time += time.perf_counter() - start
+                self.rhs_calls += 1
+
+        return wrapper
+
+    def solver(self, method, segment: SegmentProfile):
+        """Subclass a scipy solver so that it counts its accepted and rejected steps into a segment.
+
+        :param method:  Name of a scipy.integrate solver, or an OdeSolver subclass.
+        :param segment: SegmentProfile to count into.
+        :returns:       OdeSolver subclass, to be passed as method to scipy.integrate.solve_ivp.
+        """
+        import scipy.integrate
+
+        base = getattr(scipy.integrate, method) if isinstance(method, str) else method
+
+        class ProfiledSolver(base):
+            def __init__(self, fun, *args, **kwargs):
+                super().__init__(fun, *args, **kwargs)
+                self._times = []
+                # Only the evaluations of the steps are recorded: finite-difference Jacobians are evaluated by scipy
+                # through fun_vectorized instead, at the current time, which would otherwise count as attempts
+                step_fun = self.fun
+
+                def recorded(t, y):
+                    self._times.append(t)
+                    return step_fun(t, y)
+
+                self.fun = recorded
+
+            def _step_impl(self):
+                nfev, self._times = self.nfev, []
+                success, message = super()._step_impl()
+                attempts = _attempts(self, self.nfev - nfev, self._times)
+                if success:
+                    segment.accepted += 1
+                if attempts is None or segment.rejected is None:
+                    segment.rejected = None
+                else:
+                    segment.rejected += max(attempts - success, 0)
+                return success, message
+
+        ProfiledSolver.__name__ = base.__name__
+        return ProfiledSolver
+
+    @property
+    def accepted_steps(self) -> int:
+        """Total number of accepted steps over all segments."""
+        return sum(segment.accepted for segment in self.segments)
+
+    @property
+    def rejected_steps(self) -> int:
+        """Total number of rejected step attempts over all segments, or None if the method does not reveal them."""
+        if any(segment.rejected is None for segment in self.segments):
+            return None
+        return sum(segment.rejected for segment in self.segments)
+
+    @property
+    def compiled_time(self) -> float:
+        """Wall time of the RHS evaluations which was not spent in user-defined functions, ie in the compiled matrices."""
+        return max(self.rhs_time - sum(f.time for f in self.functions), 0.0)
+
+    def by_compartment(self) -> dict:
+        """Sum up the wall time of the user-defined functions per compartment.
+
+        :returns:   Dictionary of compartment names and wall times in seconds, for compartments with user-defined functions.
+        """
+        totals = dict()
+        for f in self.functions:
+            totals[f.compartment] = totals.get(f.compartment, 0.0) + f.time
+        return totals
+
+    def as_dict(self) -> dict:
+        """Get the complete report as plain data, eg for logging or json.
+
+        :returns:   Dictionary of the totals, and of lists of dictionaries for the segments and the functions.
+        """
+        return {
+            "method": self.method,
+            "wall_time": self.wall_time,
+            "rhs_calls": self.rhs_calls,
+            "rhs_time": self.rhs_time,
+            "compiled_time": self.compiled_time,
+            "accepted_steps": self.accepted_steps,
+            "rejected_steps": self.rejected_steps,
+            "segments": [dict(vars(segment)) for segment in self.segments],
+            "functions": [dict(vars(f)) for f in self.functions],
+        }
+
+    def report(self) -> str:
+        """Format the report as a table, with the user-defined functions sorted by their wall time.
+
+        :returns:   Multi-line string.
+        """
+        lines = [
+            "method: %s, wall time: %.4g s" % (self.method, self.wall_time),
+            "RHS: %d calls, %.4g s (%.4g s in compiled terms)" % (self.rhs_calls, self.rhs_time, self.compiled_time),
+            "steps: %d accepted, %s rejected in %d segment(s)"
+            % (self.accepted_steps, self.rejected_steps, len(self.segments)),
+        ]
+        if self.functions:
+            lines.append("%-20s %-8s %-30s %10s %12s" % ("compartment", "kind", "function", "calls", "time [s]"))
+            for f in sorted(self.functions, key=lambda f: f.time, reverse=True):
+                lines.append("%-20s %-8s %-30s %10d %12.4g" % (f.compartment, f.kind, f.name, f.calls, f.time))
+        return "\n".join(lines)
+
+    def __str__(self) -> str:
+        return self.report()
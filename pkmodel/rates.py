@@ -0,0 +1,183 @@
+# This holds callable rate terms with their parameters built in
+
+import numpy as np
+
+from .functions import zeroth_order, first_order, dose_constant, dose_steady, is_vectorized, DoseWindows
+
+
+class ZerothOrderRate:
+    """Zeroth-order rate function with its time constant built in, ie taking only time t and
+    mass distribution vector q arguments. Unlike an anonymous lambda, the parameters remain
+    visible, so that PKModel.compile() can lower the term into a forcing vector.
+
+    Fields:
+        -   k:          Time constant of the rate function.
+        -   parameter:  Name of the model parameter k was taken from, or None.
+    """
+
+    vectorized = True
+
+    def __init__(self, k: float, parameter: str = None) -> None:
+        self.k = k
+        self.parameter = parameter
+
+    def __call__(self, t: float, q: list) -> float:
+        return zeroth_order(t, q, self.k)
+
+
+class FirstOrderRate:
+    """First-order rate function with its time constant and compartment index built in.
+
+    Fields:
+        -   k:          Time constant of the rate function (already divided by the volume).
+        -   q_index:    Index within q on which the rate depends to first order.
+        -   parameter:  Name of the model parameter holding the time constant, or None.
+        -   volume:     Name of the model parameter holding the volume the time constant is divided by, or None.
+    """
+
+    vectorized = True
+
+    def __init__(self, k: float, q_index: int, parameter: str = None, volume: str = None) -> None:
+        self.k = k
+        self.q_index = q_index
+        self.parameter = parameter
+        self.volume = volume
+
+    def __call__(self, t: float, q: list) -> float:
+        return first_order(t, q, self.k, self.q_index)
+
+
+class DoseConstantRate:
+    """Constant dosing function with its dose built in.
+
+    Fields:
+        -   X:          Constant dose applied.
+        -   parameter:  Name of the model parameter X was taken from, or None.
+    """
+
+    vectorized = True
+
+    def __init__(self, X: float, parameter: str = None) -> None:
+        self.X = X
+        self.parameter = parameter
+
+    def __call__(self, t: float, q: list) -> float:
+        return dose_constant(t, q, self.X)
+
+
+class DoseSteadyRate:
+    """Steady dosing within fixed time windows, with dose and windows built in. The windows are
+    validated on construction, and looked up by binary search on every call.
+
+    Fields:
+        -   X:          Dose to be applied within the windows.
+        -   times:      2d list of times at which to stop and start dosage, see dose_steady.
+        -   parameter:  Name of the model parameter X was taken from, or None.
+        -   _windows:   DoseWindows built from times.
+    """
+
+    vectorized = True
+
+    def __init__(self, X: float, times: list, parameter: str = None) -> None:
+        self.X = X
+        self.times = times
+        self.parameter = parameter
+        self._windows = DoseWindows(times)
+
+    def __call__(self, t: float, q: list) -> float:
+        return dose_steady(t, q, self.X, self._windows)
+
+
+class ShiftedRate:
+    """Rate function that was shifted from one compartment onto another by PKModel.add_child. It
+    evaluates the original function on a remapped mass distribution vector, optionally scaled to
+    correct for the change in volume. Shifts of shifted functions are flattened into a single
+    index map by shift, so that every call remaps q once, however long the chain of children.
+
+    Fields:
+        -   func:       Original rate function, taking time t and mass distribution vector q.
+        -   index_map:  List of (i, j) pairs: entry i of the vector passed to func is taken from q[j].
+        -   scale:      Factor by which the result of func is multiplied.
+        -   volumes:    List of (numerator, denominator) names of the volume parameters whose ratios give the scale, or None.
+    """
+
+    def __init__(self, func, index_map: list, scale: float = 1, volumes: list = None) -> None:
+        self.func = func
+        self.index_map = [(int(i), int(j)) for i, j in index_map]
+        self.scale = scale
+        self.volumes = [tuple(v) for v in volumes] if volumes is not None else None
+        self._targets = np.array([i for i, _ in self.index_map], dtype=int)
+        self._sources = np.array([j for _, j in self.index_map], dtype=int)
+
+    @property
+    def vectorized(self) -> bool:
+        """Whether the original function supports array-valued t and 2d q, see functions.vectorized."""
+        return is_vectorized(self.func)
+
+    def __call__(self, t: float, q: list) -> float:
+        remapped = np.array(q, dtype=float)
+        remapped[self._targets] = remapped[self._sources]
+        return self.func(t, remapped) * self.scale
+
+
+def shift(func, a: int, b: int, scale: float = 1, volumes: tuple = None):
+    """Shift a rate function from one compartment onto another, as done by PKModel.add_child, such that
+    the result evaluates func with the entries a and b of q swapped, multiplied by scale. The remapping
+    is resolved here rather than on every call: first-order rates get their q_index and time constant
+    rewritten, rates independent of q are kept as they are, and shifted functions are composed into a
+    single flat ShiftedRate. Any other function is wrapped into a ShiftedRate.
+
+    :param func:    Rate function taking time t and mass distribution vector q.
+    :param a / b:   Indices within q to be swapped.
+    :param scale:   (optional) Factor by which the result of func is multiplied. Default: 1
+    :param volumes: (optional) Names of the numerator and denominator volume parameters whose ratio gives the scale. Default: None
+    :returns:       Shifted rate function.
+    """
+    swap = {a: b, b: a}
+    if isinstance(func, FirstOrderRate):
+        if scale == 1 and volumes is None:
+            return FirstOrderRate(func.k, swap.get(func.q_index, func.q_index), func.parameter, func.volume)
+        if volumes is not None and func.parameter is not None and func.volume == volumes[0]:
+            # k = parameter / V_old becomes parameter / V_old * V_old / V_new = parameter / V_new
+            return FirstOrderRate(func.k * scale, swap.get(func.q_index, func.q_index), func.parameter, volumes[1])
+    if isinstance(func, (ZerothOrderRate, DoseConstantRate, DoseSteadyRate)) and scale == 1 and volumes is None:
+        return func
+    volumes = [tuple(volumes)] if volumes is not None else None
+    if not isinstance(func, ShiftedRate):
+        return ShiftedRate(func, [(a, b), (b, a)], scale, volumes)
+    # Entry i seen by the inner function is q[swap(j)] where j is its source in the inner map
+    index_map = dict(func.index_map)
+    sources = {i: swap.get(index_map.get(i, i), index_map.get(i, i)) for i in set(index_map) | {a, b}}
+    if func.volumes is not None or volumes is not None:
+        volumes = (func.volumes or []) + (volumes or [])
+    return ShiftedRate(
+        func.func, [(i, j) for i, j in sorted(sources.items()) if i != j], func.scale * scale, volumes
+    )
+
+
+def reparametrize(func, values: dict, names: set) -> None:
+    """Update the values built into a rate function in place, after some of the named model parameters they were
+    taken from were changed, eg by PKModel.set_parameter. Time constants are divided by their volume parameters,
+    and the scale of shifted functions is the product of their volume ratios, as when they were built.
+    Functions which do not depend on the changed parameters are left unchanged.
+
+    :param func:    Rate function.
+    :param values:  Dictionary of all parameter names and their (new) values.
+    :param names:   Set of the names of the changed parameters.
+    """
+    if isinstance(func, ShiftedRate):
+        reparametrize(func.func, values, names)
+        if func.volumes is not None and names.intersection(name for ratio in func.volumes for name in ratio):
+            func.scale = float(np.prod([values[a] / values[b] for a, b in func.volumes]))
+        return
+    if not isinstance(func, (ZerothOrderRate, FirstOrderRate, DoseConstantRate, DoseSteadyRate)) or func.parameter is None:
+        return
+    if isinstance(func, FirstOrderRate):
+        if func.parameter in names or func.volume in names:
+            volume = values[func.volume] if func.volume is not None else 1
+            func.k = values[func.parameter] / volume
+    elif func.parameter in names:
+        if isinstance(func, ZerothOrderRate):
+            func.k = values[func.parameter]
+        else:
+            func.X = values[func.parameter]
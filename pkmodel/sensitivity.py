@@ -0,0 +1,104 @@
+# This holds the forward sensitivity equations behind the sensitivities argument of PKModel.solve
+
+import numpy as np
+import scipy.sparse
+
+from .compiled import CompiledModel, _PatientTerm, _rescaled
+from .functions import is_vectorized
+from .rates import ShiftedRate
+
+
+class _DirectionalTerm:
+    """Sensitivity of a residual term, ie the derivative of a user-defined function in the direction of the sensitivity
+    of the state to one parameter, d func(t, q) / dq * s, by a forward finite difference.
+
+    Fields:
+        -   func:   Rate function taking time t and the mass distribution vector q.
+        -   n:      Number of compartments.
+        -   offset: Index of the first entry of the sensitivity s within the augmented state.
+    """
+
+    def __init__(self, func, n: int, offset: int) -> None:
+        self.func = func
+        self.n = n
+        self.offset = offset
+        self.vectorized = is_vectorized(func)
+
+    def __call__(self, t: float, q: np.ndarray) -> float:
+        state, direction = q[:self.n], q[self.offset:self.offset + self.n]
+        norm = np.linalg.norm(direction, axis=0)
+        # The step is scaled such that state + h * direction differs from state by a relative sqrt(eps)
+        h = np.sqrt(np.finfo(float).eps) * np.maximum(1, np.linalg.norm(state, axis=0)) / np.where(norm > 0, norm, 1)
+        derivative = (self.func(t, state + h * direction) - self.func(t, state)) / h
+        return np.where(norm > 0, derivative, 0.0)
+
+
+def _scale_derivative(func, name: str, values: dict):
+    """Derivative of a residual term with respect to a named parameter at fixed state. User-defined functions only
+    depend on the parameters through the volume ratios in the scale of shifted functions, which is proportional
+    to the parameter to the power of its count in the numerators less that in the denominators.
+
+    :param func:    Residual rate function, with its scale evaluated at the values.
+    :param name:    Name of the parameter.
+    :param values:  Dictionary of all parameter names and their values.
+    :returns:       ShiftedRate scaled by the derivative of the scale, or None if the term does not depend on the parameter.
+    """
+    if not isinstance(func, ShiftedRate) or func.volumes is None:
+        return None
+    power = sum((a == name) - (b == name) for a, b in func.volumes)
+    if power == 0:
+        return None
+    return ShiftedRate(func.func, func.index_map, func.scale * power / values[name])
+
+
+def augment(compiled: CompiledModel, values: dict, parameters: list) -> CompiledModel:
+    """Augment a compiled model with its forward sensitivity equations. The sensitivity s_p = dq/dp to a parameter p
+    follows ds_p/dt = J(t, q) s_p + dK/dp q + db/dp + dW/dp s(t). For the lowered part, J is K and the derivatives are
+    known exactly from the structure of the coefficients, so that the augmented system is again of the compiled form,
+    with a block lower triangular rate matrix. Only residual user-defined terms need finite differences for J, while
+    their derivatives with respect to the volume parameters in the scale of shifted functions are again known exactly.
+    Linear models stay linear, and can be solved with any engine.
+
+    The state of the augmented model is q, followed by s_p for every parameter in turn. Initial conditions and boluses
+    do not depend on the parameters, so the sensitivities start at zero and do not jump.
+
+    :param compiled:    CompiledModel
+    :param values:      Dictionary of all parameter names and their values, see PKModel.parameters.
+    :param parameters:  List of the names of the parameters to differentiate with respect to.
+    :returns:           CompiledModel of size n * (1 + len(parameters)).
+    """
+    n = compiled.K.shape[0]
+    derivatives = [compiled.differentiate(name, values) for name in parameters]
+    blocks = [[compiled.K] + [None] * len(parameters)]
+    for i, (dK, _, _) in enumerate(derivatives):
+        blocks.append([dK] + [compiled.K if j == i else None for j in range(len(parameters))])
+    K = scipy.sparse.bmat(blocks, format="csr")
+    b = np.concatenate([compiled.b] + [db for _, db, _ in derivatives])
+    W = scipy.sparse.vstack([compiled.W] + [dW for _, _, dW in derivatives], format="csr")
+
+    # Residual functions only see the state, and add their directional derivatives to every sensitivity, as well as
+    # their derivatives with respect to the parameter of the sensitivity if they are scaled by its volume
+    functions = [(index, sign, _rescaled(func, values)) for index, sign, func in compiled.residual]
+    residual = [(index, sign, _PatientTerm(func, 0, n)) for index, sign, func in functions]
+    for offset, name in zip(range(n, n * (1 + len(parameters)), n), parameters):
+        residual += [(offset + index, sign, _DirectionalTerm(func, n, offset)) for index, sign, func in functions]
+        for index, sign, func in functions:
+            derivative = _scale_derivative(func, name, values)
+            if derivative is not None:
+                residual.append((offset + index, sign, _PatientTerm(derivative, 0, n)))
+    return CompiledModel(K, b, W, compiled.window_times, residual, boluses=compiled.boluses)
+
+
+def split(result, n: int, parameters: list):
+    """Split the solution of an augmented model into the state and the sensitivities.
+
+    :param result:      Result object with fields t and y of the augmented model.
+    :param n:           Number of compartments.
+    :param parameters:  List of the names of the parameters, in the order of augment.
+    :returns:           The result object, with y holding the state only, and a 'sensitivities' field holding a
+                        dictionary of parameter names and arrays of shape (n, len(t)) of dq/dp.
+    """
+    y = result.y
+    result.y = y[:n]
+    result.sensitivities = {name: y[(i + 1) * n:(i + 2) * n] for i, name in enumerate(parameters)}
+    return result
@@ -0,0 +1,112 @@
+# This holds the serializable model specification, a record of the builder calls that created a PKModel
+
+import functools
+import importlib
+import inspect
+
+import numpy as np
+
+from . import rates
+from .version_info import VERSION
+
+_RATES = (
+    rates.ZerothOrderRate,
+    rates.FirstOrderRate,
+    rates.DoseConstantRate,
+    rates.DoseSteadyRate,
+    rates.ShiftedRate,
+)
+
+
+def recorded(method):
+    """Decorator for PKModel builder methods, which appends each successful call and its arguments
+    (including defaults) to the _recipe of the model, so that the model can be rebuilt elsewhere.
+
+    :param method:  Builder method of PKModel.
+    :returns:       Wrapped method.
+    """
+    signature = inspect.signature(method)
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        bound = signature.bind(self, *args, **kwargs)
+        bound.apply_defaults()
+        arguments = dict(bound.arguments)
+        del arguments["self"]
+        result = method(self, *args, **kwargs)
+        self._recipe.append((method.__name__, arguments))
+        return result
+
+    return wrapper
+
+
+def _encode(value):
+    """Encode an argument of a builder call into plain data (dicts, lists, strings and numbers). Functions are
+    referenced by their module and name, and the rate objects of pkmodel.rates by their fields.
+
+    :param value:   Argument value.
+    :returns:       Encoded value.
+    """
+    if isinstance(value, (list, tuple)):
+        return [_encode(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _encode(v) for k, v in value.items()}
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, _RATES):
+        fields = {k: _encode(v) for k, v in vars(value).items() if not k.startswith("_")}
+        return {"rate": type(value).__name__, "fields": fields}
+    if callable(value):
+        qualname = getattr(value, "__qualname__", None)
+        if qualname is None or "<" in qualname:
+            raise TypeError(
+                "Only functions defined at module level can be serialized, not lambdas or nested functions: "
+                + repr(value)
+            )
+        return {"function": value.__module__ + ":" + qualname}
+    return value
+
+
+def _decode(value):
+    """Decode an argument encoded by _encode.
+
+    :param value:   Encoded value.
+    :returns:       Argument value.
+    """
+    if isinstance(value, list):
+        return [_decode(v) for v in value]
+    if isinstance(value, dict) and "rate" in value:
+        return getattr(rates, value["rate"])(**{k: _decode(v) for k, v in value["fields"].items()})
+    if isinstance(value, dict) and "function" in value:
+        module, qualname = value["function"].split(":")
+        return functools.reduce(getattr, qualname.split("."), importlib.import_module(module))
+    if isinstance(value, dict):
+        return {k: _decode(v) for k, v in value.items()}
+    return value
+
+
+def to_spec(recipe: list) -> dict:
+    """Encode the recipe of a PKModel into a serializable specification.
+
+    :param recipe:  List of (method name, arguments) builder calls.
+    :returns:       Dictionary holding the pkmodel version and the list of builder steps.
+    """
+    return {
+        "version": VERSION,
+        "steps": [
+            {"method": name, "arguments": {k: _encode(v) for k, v in arguments.items()}}
+            for name, arguments in recipe
+        ],
+    }
+
+
+def build(model, spec: dict) -> None:
+    """Replay the builder steps of a specification on an empty model.
+
+    :param model:   Empty PKModel.
+    :param spec:    Specification, as returned by to_spec.
+    """
+    for step in spec["steps"]:
+        getattr(model, step["method"])(**{k: _decode(v) for k, v in step["arguments"].items()})
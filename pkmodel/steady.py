@@ -0,0 +1,98 @@
+# This holds the steady-state solvers behind PKModel.steady_state and PKModel.periodic_steady_state
+
+import numpy as np
+
+from .analytic import solve_analytic
+
+# Tolerances of the integrations within the shooting method, which need to be well below those of the root-finding
+_SHOOTING_TOLERANCES = {"rtol": 1e-10, "atol": 1e-12}
+
+
+def _singular() -> ValueError:
+    return ValueError(
+        "The model has no unique steady state, eg because the drug is never eliminated from some compartment."
+    )
+
+
+def _root(fun, q_guess: np.ndarray, jac=None) -> np.ndarray:
+    """Find a root of a nonlinear system with scipy.optimize.root.
+
+    :param fun:         Function of q, whose root is sought.
+    :param q_guess:     Initial guess.
+    :param jac:         (optional) Jacobian of fun. Default: None, ie finite differences
+    :returns:           Root.
+    """
+    import scipy.optimize
+
+    result = scipy.optimize.root(fun, q_guess, jac=jac)
+    if not result.success:
+        raise ValueError("The steady state could not be found: " + result.message)
+    return result.x
+
+
+def steady_state(compiled, t: float = None, q_guess: np.ndarray = None) -> np.ndarray:
+    """Find the steady state of a compiled model, ie the q at which dq/dt = K q + b + r(q) vanishes, for the forcing
+    held constant. Linear models need a single sparse linear solve of K q = -b. Nonlinear models are solved by
+    root-finding with the Jacobian of the compiled model, starting from q_guess.
+
+    :param compiled:    CompiledModel
+    :param t:           (optional) Time point whose forcing (and residual terms) are held. Default: None, ie the constant forcing b, which is the one after all dosing windows have closed
+    :param q_guess:     (optional) Initial guess for nonlinear models. Default: None, ie no drug
+    :returns:           Array of the drug mass in each compartment at the steady state.
+    """
+    import scipy.sparse.linalg
+
+    forcing = compiled.b if t is None else compiled.forcing(t)
+    t = 0 if t is None else t
+    n = compiled.K.shape[0]
+    if compiled.is_linear:
+        try:
+            return scipy.sparse.linalg.splu(scipy.sparse.csc_matrix(compiled.K)).solve(-forcing)
+        except RuntimeError:
+            raise _singular()
+
+    q_guess = np.zeros(n) if q_guess is None else np.asarray(q_guess, dtype=float)
+    return _root(
+        lambda q: compiled.differential_eq(t, q, forcing), q_guess, jac=lambda q: compiled.jacobian(t, q)
+    )
+
+
+def periodic_steady_state(solve, compiled, period: float, t0: float = 0, q_guess: np.ndarray = None) -> np.ndarray:
+    """Find the periodic steady state of a compiled model, whose dosing repeats with the given period, by the shooting
+    method: the state q at t0 is sought for which integrating over one period [t0, t0 + period] returns to q.
+    For linear models, the state after one period is exp(K period) q + c, so that a single integration from no drug
+    (giving c) and a single linear solve suffice. Nonlinear models are solved by root-finding, integrating one period
+    per evaluation.
+
+    The state at t0 is taken before any bolus at t0, so that it can be passed as the initial conditions of a solve.
+
+    :param solve:       Function solve(compiled, t_eval, q0, tolerances) returning a result with fields t and y, eg PKModel._solve_compiled.
+    :param compiled:    CompiledModel
+    :param period:      Period of the dosing.
+    :param t0:          (optional) Start of a period. Default: 0
+    :param q_guess:     (optional) Initial guess for nonlinear models. Default: None, ie no drug
+    :returns:           Array of the drug mass in each compartment at t0 of the periodic steady state.
+    """
+    import scipy.linalg
+
+    if not period > 0:
+        raise ValueError("The period needs to be positive.")
+    n = compiled.K.shape[0]
+    t_eval = np.array([t0, t0 + period], dtype=float)
+    end_jump = compiled.jump(t0 + period)
+
+    if compiled.is_linear:
+        c = solve_analytic(compiled, t_eval, np.zeros(n)).y[:, -1] - end_jump
+        A = np.eye(n) - scipy.linalg.expm(compiled.K.toarray() * period)
+        if np.linalg.cond(A) > 1 / np.finfo(float).eps:
+            raise _singular()
+        return np.linalg.solve(A, c)
+
+    def shoot(q: np.ndarray) -> np.ndarray:
+        result = solve(compiled, t_eval, q, _SHOOTING_TOLERANCES)
+        if not result.success:
+            raise ValueError("The integration over one period failed: " + result.message)
+        return result.y[:, -1] - end_jump - q
+
+    q_guess = np.zeros(n) if q_guess is None else np.asarray(q_guess, dtype=float)
+    return _root(shoot, q_guess)
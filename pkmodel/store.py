@@ -0,0 +1,187 @@
+# This holds the on-disk storage of solutions, as memory-mapped NumPy arrays with json metadata
+
+import json
+import os
+
+import numpy as np
+
+from .pk_model import PKModel
+from .version_info import VERSION
+
+_TIMES = "t.npy"
+_VALUES = "y.npy"
+_METADATA = "metadata.json"
+
+
+def _model_metadata(model: PKModel) -> dict:
+    """Describe the model a solution belongs to.
+
+    :param model:   PKModel, or None.
+    :returns:       Dictionary of the specification (None if the model holds unserializable functions) and parameters.
+    """
+    if model is None:
+        return {"spec": None, "parameters": None}
+    try:
+        model_spec = model.to_spec()
+    except TypeError:
+        model_spec = None
+    return {"spec": model_spec, "parameters": model.parameters}
+
+
+class SolutionWriter:
+    """Class to write a solution to disk chunk by chunk, eg as yielded by PKModel.solve_stream, so that it never needs
+    to be held in memory as a whole. The store is a directory holding the time points (t.npy), the drug mass
+    (y.npy, of shape (compartments, points), or (patients, compartments, points) for a population) and a json file
+    of metadata describing the model.
+
+    Fields:
+        -   path:       Directory of the store.
+        -   t:          Array of all time points.
+        -   y:          Memory-mapped array of the drug mass, filled by write.
+        -   filled:     Number of time points written so far.
+        -   metadata:   Dictionary of the metadata.
+
+    Methods:
+        -   __init__:   Create the store, with all time points but no values yet.
+        -   write:      Append a chunk of the solution.
+        -   close:      Flush the values and mark the store as complete.
+    """
+
+    def __init__(
+        self, path: str, names: list, t: np.ndarray, patients: int = None, model: PKModel = None, metadata: dict = None
+    ) -> None:
+        """Create the store, with all time points but no values yet.
+
+        :param path:        Directory of the store, which is created if needed.
+        :param names:       Compartment names, in order of their index.
+        :param t:           Array of all time points to be written.
+        :param patients:    (optional) Number of patients, for population solutions as returned by PKModel.solve_population. Default: None
+        :param model:       (optional) PKModel the solution belongs to, whose specification and parameters are stored. Default: None
+        :param metadata:    (optional) Dictionary of further json-serializable information. Default: None
+        """
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.t = np.asarray(t, dtype=float)
+        np.save(os.path.join(path, _TIMES), self.t)
+        shape = (len(names), len(self.t)) if patients is None else (patients, len(names), len(self.t))
+        self.y = np.lib.format.open_memmap(os.path.join(path, _VALUES), mode="w+", dtype=float, shape=shape)
+        self.filled = 0
+        self.metadata = {
+            "version": VERSION,
+            "names": list(names),
+            "shape": list(shape),
+            "model": _model_metadata(model),
+            "metadata": metadata if metadata is not None else dict(),
+            "complete": False,
+        }
+        self._write_metadata()
+
+    def _write_metadata(self) -> None:
+        with open(os.path.join(self.path, _METADATA), "w") as file:
+            json.dump(self.metadata, file, indent=2)
+
+    def write(self, solution) -> None:
+        """Append a chunk of the solution, which needs to continue at the next time point not written yet.
+
+        :param solution:    Result object with fields t and y, eg a chunk yielded by PKModel.solve_stream.
+        """
+        count = len(solution.t)
+        if not np.allclose(solution.t, self.t[self.filled:self.filled + count]):
+            raise ValueError("The chunk does not continue the time points written so far.")
+        self.y[..., self.filled:self.filled + count] = solution.y
+        self.filled += count
+
+    def close(self) -> None:
+        """Flush the values to disk, and mark the store as complete if all time points were written."""
+        self.y.flush()
+        self.metadata["complete"] = self.filled == len(self.t)
+        self._write_metadata()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def save_solution(path: str, solution, names: list, model: PKModel = None, metadata: dict = None):
+    """Write a complete solution to disk in one go, see SolutionWriter.
+
+    :param path:        Directory of the store, which is created if needed.
+    :param solution:    Result object with fields t and y, as returned by PKModel.solve or PKModel.solve_population.
+    :param names:       Compartment names, in order of their index.
+    :param model:       (optional) PKModel the solution belongs to. Default: None
+    :param metadata:    (optional) Dictionary of further json-serializable information. Default: None
+    :returns:           StoredSolution of the written store.
+    """
+    patients = solution.y.shape[0] if np.ndim(solution.y) == 3 else None
+    with SolutionWriter(path, names, solution.t, patients, model, metadata) as writer:
+        writer.write(solution)
+    return StoredSolution(path)
+
+
+class StoredSolution:
+    """Class to lazily read a solution written by save_solution or SolutionWriter. The values are memory-mapped, so that only
+    the slices selected are read from disk.
+
+    Fields:
+        -   path:       Directory of the store.
+        -   t:          Array of all time points.
+        -   y:          Read-only memory-mapped array of the drug mass.
+        -   names:      Compartment names, in order of their index.
+        -   metadata:   Dictionary of the metadata, see SolutionWriter.
+
+    Methods:
+        -   __init__:   Open the store.
+        -   __getitem__:    Drug mass in a single compartment, by name.
+        -   select:     Result object of selected compartments within a time range.
+        -   model:      Rebuild the PKModel the solution belongs to.
+    """
+
+    def __init__(self, path: str) -> None:
+        """Open a store, without reading the values.
+
+        :param path:    Directory of the store.
+        """
+        self.path = path
+        with open(os.path.join(path, _METADATA)) as file:
+            self.metadata = json.load(file)
+        self.names = self.metadata["names"]
+        self.t = np.load(os.path.join(path, _TIMES))
+        self.y = np.load(os.path.join(path, _VALUES), mmap_mode="r")
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        """Get the drug mass in a single compartment.
+
+        :param name:    Compartment name.
+        :returns:       Memory-mapped array of shape (points,), or (patients, points) for a population.
+        """
+        return self.y[..., self.names.index(name), :]
+
+    def select(self, compartments: list = None, t_start: float = None, t_stop: float = None):
+        """Read the drug mass of some compartments within a time range, boundaries included.
+
+        :param compartments:    (optional) List of compartment names. Default: all compartments
+        :param t_start:         (optional) First time of the range. Default: first time point
+        :param t_stop:          (optional) Last time of the range. Default: last time point
+        :returns:               Result object with fields t and y (in memory), like the one of PKModel.solve.
+        """
+        import scipy.optimize
+
+        start = 0 if t_start is None else np.searchsorted(self.t, t_start, side="left")
+        stop = len(self.t) if t_stop is None else np.searchsorted(self.t, t_stop, side="right")
+        if compartments is None:
+            y = self.y[..., start:stop]
+        else:
+            y = self.y[..., [self.names.index(name) for name in compartments], start:stop]
+        return scipy.optimize.OptimizeResult(t=self.t[start:stop], y=np.array(y), success=True)
+
+    def model(self) -> PKModel:
+        """Rebuild the PKModel the solution belongs to from the stored specification.
+
+        :returns:   PKModel
+        """
+        model_spec = self.metadata["model"]["spec"]
+        if model_spec is None:
+            raise ValueError("The store holds no specification of the model, as it was not saved or not serializable.")
+        return PKModel.from_spec(model_spec)
@@ -0,0 +1,130 @@
+# This holds the chunked integration behind PKModel.solve_stream, and running summaries of streamed solutions
+
+import numpy as np
+
+
+class RunningSummary:
+    """Summary statistics of a solution which are updated chunk by chunk, so that they cover every time point
+    of a streamed solve, even though the chunks themselves are downsampled or discarded.
+
+    Fields:
+        -   names:      Compartment names, in order of their index.
+        -   count:      Number of time points seen.
+        -   t_first:    First time point seen, or None.
+        -   t_last:     Last time point seen, or None.
+        -   y_last:     Drug mass in each compartment at t_last, or None.
+        -   minimum:    Minimum drug mass in each compartment.
+        -   maximum:    Maximum drug mass in each compartment.
+        -   t_maximum:  Time at which the maximum was first reached, for each compartment.
+        -   auc:        Area under the curve of the drug mass in each compartment (trapezoidal rule).
+
+    Methods:
+        -   __init__:   Set up an empty summary.
+        -   update:     Add a chunk of the solution.
+        -   as_dict:    The summary by compartment name.
+    Properties:
+        -   mean:       Time-averaged drug mass in each compartment.
+    """
+
+    def __init__(self, names: list) -> None:
+        """Set up an empty summary.
+
+        :param names:   Compartment names, in order of their index.
+        """
+        n = len(names)
+        self.names = list(names)
+        self.count = 0
+        self.t_first = None
+        self.t_last = None
+        self.y_last = None
+        self.minimum = np.full(n, np.inf)
+        self.maximum = np.full(n, -np.inf)
+        self.t_maximum = np.full(n, np.nan)
+        self.auc = np.zeros(n)
+
+    def update(self, t: np.ndarray, y: np.ndarray) -> None:
+        """Add a chunk of the solution, which needs to follow the chunks added before in time.
+
+        :param t:   Array of time points of the chunk.
+        :param y:   Array of shape (compartments, len(t)) of the drug mass at these points.
+        """
+        if not len(t):
+            return
+        if self.t_last is not None:
+            # Continue the trapezoidal rule across the boundary to the previous chunk
+            t = np.concatenate([[self.t_last], t])
+            y = np.concatenate([self.y_last[:, None], y], axis=1)
+            self.count -= 1
+        else:
+            self.t_first = t[0]
+        self.auc += np.sum(0.5 * (y[:, 1:] + y[:, :-1]) * np.diff(t), axis=1)
+        self.minimum = np.minimum(self.minimum, y.min(axis=1))
+        index = np.argmax(y, axis=1)
+        new_maximum = y[np.arange(len(y)), index] > self.maximum
+        self.maximum[new_maximum] = y[new_maximum, index[new_maximum]]
+        self.t_maximum[new_maximum] = t[index[new_maximum]]
+        self.count += len(t)
+        self.t_last, self.y_last = t[-1], y[:, -1].copy()
+
+    @property
+    def mean(self) -> np.ndarray:
+        """Time-averaged drug mass in each compartment, ie the AUC divided by the time span seen.
+
+        :returns:   Array of the mean in each compartment, NaN if fewer than two time points were seen.
+        """
+        if self.count < 2 or self.t_last == self.t_first:
+            return np.full(len(self.names), np.nan)
+        return self.auc / (self.t_last - self.t_first)
+
+    def as_dict(self) -> dict:
+        """Get the summary as a dictionary of compartment names and their statistics.
+
+        :returns:   Dictionary of dictionaries holding 'min', 'max', 't_max', 'mean' and 'auc' of each compartment.
+        """
+        mean = self.mean
+        return {
+            name: {
+                "min": self.minimum[i],
+                "max": self.maximum[i],
+                "t_max": self.t_maximum[i],
+                "mean": mean[i],
+                "auc": self.auc[i],
+            }
+            for i, name in enumerate(self.names)
+        }
+
+
+def stream(solve, compiled, t_eval: np.ndarray, q0: np.ndarray, chunk_size: int, downsample: int = 1, summary=None):
+    """Integrate a compiled model chunk by chunk over t_eval, holding at most chunk_size time points in memory.
+    Each chunk is integrated from the last point of the previous one. Since a solve reports the state after any
+    bolus at its first time point, that bolus is taken out of the initial state again, so that it is not applied twice.
+
+    :param solve:       Function solve(compiled, t_eval, q0) returning a result with fields t and y, eg PKModel._solve_compiled.
+    :param compiled:    CompiledModel to integrate.
+    :param t_eval:      Increasing array of time-points of interest.
+    :param q0:          Initial conditions of mass distribution in compartments.
+    :param chunk_size:  Number of time points integrated per chunk.
+    :param downsample:  (optional) Only keep every downsample-th time point of t_eval in the chunks. Default: 1
+    :param summary:     (optional) RunningSummary, updated with every time point before downsampling. Default: None
+    :returns:           Generator of the results of every chunk, with fields t and y of the kept time points.
+    """
+    if chunk_size < 2:
+        raise ValueError("chunk_size needs to be at least 2.")
+    t_eval = np.asarray(t_eval, dtype=float)
+    q = np.asarray(q0, dtype=float)
+    start = 0
+    while True:
+        # Chunks overlap by one point, the last point of the previous chunk
+        stop = min(start + chunk_size, len(t_eval))
+        result = solve(compiled, t_eval[start:stop], q)
+        first = 0 if start == 0 else 1
+        t, y = result.t[first:], result.y[:, first:]
+        if summary is not None and result.success:
+            summary.update(t, y)
+        kept = (np.arange(start + first, stop) % downsample) == 0
+        result.t, result.y = t[kept], y[:, kept]
+        yield result
+        if not result.success or stop == len(t_eval):
+            return
+        q = y[:, -1] - compiled.jump(t[-1])
+        start = stop - 1
@@ -67,6 +67,10 @@ setup(
         'networkx',
     ],
     extras_require={
+        'jit': [
+            # Numba compiles the RHS into native code, see pkmodel.jit
+            'numba',
+        ],
         'docs': [
             # Sphinx for doc generation. Version 1.7.3 has a bug:
             'sphinx>=1.5, !=1.7.3',
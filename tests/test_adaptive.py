@@ -0,0 +1,64 @@
+# This sets up unit tests to be run with pytest on adaptive.py
+
+import pytest
+import numpy as np
+
+
+def build_model():
+    from pkmodel.pk_model import PKModel
+    from pkmodel.functions import dose_steady
+
+    test_model = PKModel()
+    test_model.create_model("main", 1, dosing_func=dose_steady, dosing_time_windows=[(0, 1), (4, 5)])
+    test_model.add_sibling("main", "peripheral", 0.5)
+    return test_model
+
+
+def test_solve_adaptive():
+    from pkmodel.dosing import DosingSchedule
+
+    test_model = build_model()
+    schedule = DosingSchedule().add_bolus("main", 1, 2.5)
+    result = test_model.solve_adaptive((0, 10), [0, 0], rtol=1e-3, atol=1e-6, schedule=schedule)
+    assert result.success
+    assert len(result.t) < 300
+    # Window edges are output points, and the bolus is reported before and after
+    assert {1.0, 4.0, 5.0} <= set(result.t)
+    assert np.sum(result.t == 2.5) == 2
+    before, after = np.flatnonzero(result.t == 2.5)
+    assert result.y[:, after] - result.y[:, before] == pytest.approx([1, 0])
+
+    t_eval = np.linspace(0, 10, 1001)
+    exact = test_model.solve(t_eval, [0, 0], engine="analytic", schedule=schedule).y
+    assert result.sol(t_eval) == pytest.approx(exact, abs=1e-4)
+    assert result.sol(2.5) == pytest.approx(result.y[:, after])
+    # Linear interpolation of the output points stays within the tolerances (up to the error of the solver)
+    interpolated = np.array([np.interp(t_eval, result.t, y) for y in result.y])
+    assert np.all(np.abs(interpolated - exact) <= 2 * (1e-6 + 1e-3 * np.abs(exact)))
+
+    with pytest.raises(ValueError):
+        result.sol(11)
+
+
+def test_sample():
+    from pkmodel.adaptive import sample
+
+    # Straight lines need no points beyond the initial ones, curves are refined where they bend most
+    assert len(sample(lambda t: np.vstack([2 * t + 1]), np.linspace(0, 1, 5), 1e-3, 1e-6)) == 5
+    times = sample(lambda t: np.vstack([np.exp(-10 * t)]), np.array([0.0, 1.0]), 0, 1e-4)
+    assert np.sum(times < 0.5) > 2 * np.sum(times >= 0.5)
+
+
+def test_narrow_peak():  # a peak in between a few evenly spaced points is found from the steps of the solver
+    from pkmodel.pk_model import PKModel
+
+    def pulse(t, q):
+        return 10 * np.exp(-(((t - 3.4375) / 0.07) ** 2))
+
+    test_model = PKModel()
+    test_model.create_model("central", 1, dosing_func=pulse, elimination_time_constant=200)
+    result = test_model.solve_adaptive((0, 10), np.array([0.0]))
+    dense = result.sol(np.linspace(3.2, 3.7, 5001))
+
+    assert dense.max() > 0.04
+    assert result.y[0].max() == pytest.approx(dense.max(), rel=1e-2)
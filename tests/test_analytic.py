@@ -0,0 +1,59 @@
+# This sets up unit tests to be run with pytest on analytic.py
+
+import pytest
+import numpy as np
+import scipy.integrate
+
+
+def test_analytic_one_compartment():
+    from pkmodel.pk_model import PKModel
+
+    test_model = PKModel()
+    test_model.create_model("central", 2, dosing_time_constant=3, elimination_time_constant=1)
+    t_eval = np.linspace(0, 5, 50)
+    solution = test_model.solve(t_eval, np.array([1.0]), engine="analytic")
+
+    # dq/dt = 3 - q / 2, so q(t) = 6 - 5 exp(-t / 2)
+    assert solution.success
+    assert np.allclose(solution.t, t_eval)
+    assert np.allclose(solution.y[0], 6 - 5 * np.exp(-t_eval / 2), rtol=1e-12)
+
+
+def test_analytic_dosing_windows():
+    from pkmodel.pk_model import PKModel
+    from pkmodel.functions import dose_steady
+
+    test_model = PKModel()
+    test_model.create_model(
+        "main", 1, dosing_func=dose_steady, dosing_time_windows=[(0, 0.1), (1, 1.15), (2, 2.2)]
+    )
+    test_model.add_sibling("main", "peripheral", 0.5, connection_time_constant=0.5)
+    test_model.add_parent("main", "subcutaneous", 0.05, connection_time_constant=0.1)
+    test_model.add_child("main", "child", 2)
+
+    t_eval = np.linspace(0, 4, 333)
+    q0 = np.array([0.5, 0.0, 0.0, 0.0])
+    analytic = test_model.solve(t_eval, q0, engine="analytic")
+    reference = scipy.integrate.solve_ivp(
+        test_model.compile().differential_eq,
+        [0, 4],
+        q0,
+        t_eval=t_eval,
+        method="Radau",
+        rtol=1e-11,
+        atol=1e-13,
+    )
+
+    assert analytic.y.shape == (4, 333)
+    assert np.allclose(analytic.y, reference.y, atol=1e-9)
+
+
+def test_analytic_requires_linear_model():
+    from pkmodel.pk_model import PKModel
+
+    test_model = PKModel()
+    test_model.create_model("main", 1, elimination_func=lambda t, q: 0.1 * q[0] ** 2)
+    with pytest.raises(TypeError):
+        test_model.solve(np.linspace(0, 1, 10), np.array([1.0]), engine="analytic")
+    with pytest.raises(ValueError):
+        test_model.solve(np.linspace(0, 1, 10), np.array([1.0]), engine="unknown")
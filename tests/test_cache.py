@@ -0,0 +1,57 @@
+# This sets up unit tests to be run with pytest on cache.py
+
+import os
+import numpy as np
+
+
+def two_compartments(volume=1):
+    from pkmodel.pk_model import PKModel
+
+    test_model = PKModel()
+    test_model.create_model("main", volume)
+    test_model.add_sibling("main", "peripheral", 0.5, connection_time_constant=0.5)
+    return test_model
+
+
+def test_cache_key():
+    from pkmodel.cache import SolveCache
+
+    t_eval = np.linspace(0, 5, 51)
+    options = {"method": "RK45", "sparse": False, "engine": "numerical"}
+    key = SolveCache.key(two_compartments(), t_eval, [0, 0], options)
+    # Identically built models share their key, any change of model, q0, t_eval or options changes it
+    assert SolveCache.key(two_compartments(), t_eval.copy(), np.zeros(2), dict(options)) == key
+    assert SolveCache.key(two_compartments(2), t_eval, [0, 0], options) != key
+    assert SolveCache.key(two_compartments(), t_eval, [1, 0], options) != key
+    assert SolveCache.key(two_compartments(), t_eval[:-1], [0, 0], options) != key
+    assert SolveCache.key(two_compartments(), t_eval, [0, 0], dict(options, method="BDF")) != key
+
+    test_model = two_compartments()
+    test_model.add_output("peripheral", lambda t, q: 0.1 * q[1])
+    assert SolveCache.key(test_model, t_eval, [0, 0], options) is None
+
+
+def test_cached_solve(tmp_path):
+    from pkmodel.cache import SolveCache
+
+    cache = SolveCache(maxsize=1, directory=str(tmp_path))
+    t_eval = np.linspace(0, 5, 51)
+    first = two_compartments().solve(t_eval, [0, 0], cache=cache)
+    # Room for two results on disk
+    cache.max_bytes = 2.5 * os.path.getsize(os.path.join(str(tmp_path), os.listdir(str(tmp_path))[0]))
+    first.y[:] = 0
+    second = two_compartments().solve(t_eval, [0, 0], cache=cache)
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert np.allclose(second.y, two_compartments().solve(t_eval, [0, 0]).y)
+
+    # The in-memory cache holds a single result, older ones are reloaded from disk
+    two_compartments(2).solve(t_eval, [0, 0], cache=cache)
+    assert len(cache) == 1 and len(os.listdir(str(tmp_path))) == 2
+    assert np.allclose(two_compartments().solve(t_eval, [0, 0], cache=cache).y, second.y)
+    assert cache.hits == 2
+
+    # The on-disk cache is bounded in size, evicting the least recently used result
+    two_compartments(3).solve(t_eval, [0, 0], cache=cache)
+    assert len(os.listdir(str(tmp_path))) == 2
+    cache.clear()
+    assert len(cache) == 0 and not os.listdir(str(tmp_path))
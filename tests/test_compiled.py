@@ -0,0 +1,110 @@
+# This sets up unit tests to be run with pytest on compiled.py
+
+import numpy as np
+
+
+def complex_model():
+    from pkmodel.pk_model import PKModel
+
+    test_model = PKModel()
+    test_model.create_model(
+        "main", 1, dosing_time_constant=2, elimination_time_constant=2
+    )
+    test_model.add_parent("main", "parent", 1, connection_time_constant=0.5)
+    test_model.add_child("main", "child", 1 / 3, connection_time_constant=4)
+    test_model.add_sibling("main", "sibling", 0.5, connection_time_constant=3)
+    return test_model
+
+
+def test_compiled_matches_model():
+    test_model = complex_model()
+    compiled = test_model.compile()
+
+    assert compiled.is_linear
+    assert np.allclose(compiled.differential_eq(0, [1, 2, 3, 4]), [18, 1, -14, -21])
+    q = np.random.default_rng(0).random(4)
+    assert np.allclose(compiled.differential_eq(0, q), test_model.differential_eq(0, q))
+    assert np.allclose(compiled.K.toarray() @ q + compiled.b, test_model.differential_eq(0, q))
+
+
+def test_compiled_steady_dosing():
+    from pkmodel.pk_model import PKModel
+    from pkmodel.functions import dose_steady
+
+    test_model = PKModel()
+    test_model.create_model(
+        "central", 1, dosing_func=dose_steady, dosing_time_windows=[(0, 1), (3, 4)]
+    )
+    test_model.add_parent("central", "parent", 0.5)
+    compiled = test_model.compile()
+
+    assert compiled.is_linear
+    for t in [0.5, 1.5, 3.5, 5]:
+        assert np.allclose(compiled.differential_eq(t, [1, 2]), test_model.differential_eq(t, [1, 2]))
+
+
+def test_compiled_residual():
+    from pkmodel.pk_model import PKModel
+
+    test_model = PKModel()
+    test_model.create_model("main", 1)
+    test_model.add_sibling("main", "peripheral", 0.5)
+    test_model.add_output("peripheral", lambda t, q: 0.1 * q[1] ** 2)
+    test_model.add_child("peripheral", "child", 2)
+    compiled = test_model.compile()
+
+    assert not compiled.is_linear
+    assert len(compiled.residual) == 1
+    q = np.array([1.0, 2.0, 3.0])
+    assert np.allclose(compiled.differential_eq(1, q), test_model.differential_eq(1, q))
+
+
+def test_jacobian():
+    from pkmodel.pk_model import PKModel
+
+    test_model = complex_model()
+    compiled = test_model.compile()
+    assert np.allclose(compiled.jacobian(0, np.ones(4)), compiled.K.toarray())
+
+    test_model = PKModel()
+    test_model.create_model("main", 1)
+    test_model.add_sibling("main", "peripheral", 0.5)
+    test_model.add_output("peripheral", lambda t, q: 0.1 * q[1] ** 2)
+    compiled = test_model.compile()
+    q = np.array([1.0, 2.0])
+    expected = compiled.K.toarray() + np.array([[0, 0], [0, -0.4]])
+
+    assert np.allclose(compiled.jacobian(0, q), expected, atol=1e-6)
+    assert np.allclose(compiled.jacobian(0, q, sparse=True).toarray(), expected, atol=1e-6)
+
+
+def test_vectorized():
+    from pkmodel.pk_model import PKModel
+    from pkmodel.functions import dose_steady, vectorized
+
+    @vectorized
+    def loss(t, q):
+        return 0.1 * q[1] ** 2
+
+    test_model = PKModel()
+    test_model.create_model("main", 1, dosing_func=dose_steady, dosing_time_windows=[(0, 1), (2, 3)])
+    test_model.add_child("main", "child", 2)
+    test_model.add_sibling("main", "peripheral", 0.5)
+    test_model.add_output("peripheral", loss)
+    compiled = test_model.compile()
+    assert compiled.vectorized
+    assert all(comp.vectorized for comp in test_model._compartments)
+
+    t = np.array([0.5, 1, 1.5, 2, 2.5, 4])
+    y = np.arange(18.0).reshape(3, 6) / 10
+    expected = np.array([test_model.differential_eq(s, y[:, i]) for i, s in enumerate(t)]).T
+    assert np.allclose(compiled.differential_eq(t, y), expected)
+    assert np.allclose(np.array(test_model.differential_eq(t, y)), expected)
+    expected = compiled.K.toarray()
+    expected[2, 1] -= 0.2 * y[1, 1]
+    assert np.allclose(compiled.jacobian(0, y[:, 1]), expected, atol=1e-6)
+
+    # Unmarked user-defined functions keep the scalar contract
+    test_model.add_output("main", lambda t, q: 0.1 * q[0])
+    assert not test_model.compile().vectorized
+    assert not test_model._compartments[0].vectorized
@@ -0,0 +1,86 @@
+# This sets up unit tests to be run with pytest on declarative.py
+
+import json
+import pytest
+import numpy as np
+
+
+def renal_clearance(t, q):
+    return 0.1 * q[1]
+
+
+def build_model():
+    from pkmodel.pk_model import PKModel
+    from pkmodel.functions import dose_steady
+
+    test_model = PKModel()
+    test_model.create_model("main", 1, dosing_func=dose_steady, dosing_time_windows=[(0, 0.5), (1, 1.5)])
+    test_model.add_sibling("main", "kidney", 3, connection_time_constant=0.2)
+    test_model.add_parent("main", "subcutaneous", 0.05, connection_time_constant=0.1)
+    test_model.add_child("main", "child", 2)
+    test_model.add_output("kidney", renal_clearance, label="rh. clear.")
+    return test_model
+
+
+def test_declarative_round_trip():
+    from pkmodel.pk_model import PKModel
+
+    test_model = build_model()
+    description = test_model.to_dict()
+    assert [e["from"] + "->" + e["to"] for e in description["edges"]] == [
+        "main->child",
+        "main->kidney",
+        "kidney->main",
+        "subcutaneous->main",
+    ]
+    assert description["outputs"][0] == {"compartment": "kidney", "func": {"function": __name__ + ":renal_clearance"}}
+
+    rebuilt = PKModel.from_json(test_model.to_json())
+    assert rebuilt.get_compartment_names == test_model.get_compartment_names
+    assert rebuilt.parameters == test_model.parameters
+    assert rebuilt.to_dict() == json.loads(json.dumps(description))
+    for t in [0.2, 0.7, 1.2]:
+        q = np.array([1.0, 2.0, 3.0, 4.0])
+        assert np.allclose(rebuilt.differential_eq(t, q), test_model.differential_eq(t, q))
+    # Declarative models are serializable as well, and can be extended by the builder methods
+    assert PKModel.from_spec(json.loads(json.dumps(rebuilt.to_spec()))).parameters == rebuilt.parameters
+    rebuilt.add_sibling("main", "peripheral", 0.5)
+    rebuilt.draw_network(testing=True)
+
+
+def test_declarative_description():
+    from pkmodel.pk_model import PKModel
+
+    test_model = PKModel.from_dict(
+        {
+            "compartments": [{"name": "main", "volume": 1}, {"name": "peripheral", "volume": 0.5}],
+            "inputs": [{"compartment": "main", "dose": 2}],
+            "outputs": [{"compartment": "main", "elimination": 1}],
+            "edges": [{"from": "main", "to": "peripheral", "k": 0.5, "exchange": True}],
+        }
+    )
+    reference = PKModel()
+    reference.create_model("main", 1, dosing_time_constant=2)
+    reference.add_sibling("main", "peripheral", 0.5, connection_time_constant=0.5)
+
+    assert test_model.parameters == reference.parameters
+    assert np.allclose(test_model.compile().K.toarray(), reference.compile().K.toarray())
+    assert np.allclose(test_model.compile().b, reference.compile().b)
+
+
+@pytest.mark.parametrize(
+    "description",
+    [
+        {"compartments": [{"name": "main", "volume": 1}, {"name": "main", "volume": 2}]},
+        {"compartments": [{"name": "main", "volume": 0}]},
+        {"compartments": [{"name": "main", "volume": 1}], "edges": [{"from": "main", "to": "other", "k": 1}]},
+        {"compartments": [{"name": "main", "volume": 1}], "inputs": [{"compartment": "main", "dose": 1}] * 2 + [
+            {"compartment": "main", "dose": 2}
+        ]},
+    ],
+)
+def test_declarative_validation(description):
+    from pkmodel.pk_model import PKModel
+
+    with pytest.raises(ValueError):
+        PKModel.from_dict(description)
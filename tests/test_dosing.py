@@ -0,0 +1,74 @@
+# This sets up unit tests to be run with pytest on dosing.py
+
+import pytest
+import numpy as np
+
+
+def two_compartments():
+    from pkmodel.pk_model import PKModel
+
+    test_model = PKModel()
+    test_model.create_model("main", 1, dosing_time_constant=0)
+    test_model.add_sibling("main", "peripheral", 0.5, connection_time_constant=0.5)
+    return test_model
+
+
+def one_compartment():
+    from pkmodel.pk_model import PKModel
+
+    test_model = PKModel()
+    test_model.create_model("central", 1, dosing_time_constant=0)
+    return test_model
+
+
+def test_schedule():
+    from pkmodel.dosing import DosingSchedule
+
+    schedule = DosingSchedule().add_bolus("main", 2, 0).add_regimen("main", 1, 1, 2, 3, duration=0.5)
+    assert schedule.boluses == [(0, "main", 2)]
+    assert schedule.infusions == [(1, 1.5, "main", 2), (3, 3.5, "main", 2), (5, 5.5, "main", 2)]
+    with pytest.raises(ValueError):
+        schedule.add_infusion("main", 1, 2, 1)
+
+
+def test_single_bolus():
+    from pkmodel.dosing import DosingSchedule
+
+    test_model = one_compartment()
+    t_eval = np.linspace(0, 4, 41)
+    schedule = DosingSchedule().add_bolus("central", 1, 1)
+    for engine in ["numerical", "analytic"]:
+        solution = test_model.solve(t_eval, np.array([0.0]), engine=engine, schedule=schedule)
+        # The value at the time of the bolus is reported after the bolus
+        expected = np.where(t_eval >= 1, np.exp(-(t_eval - 1)), 0)
+        assert np.allclose(solution.y[0], expected, atol=1e-3)
+
+
+@pytest.mark.parametrize("method", ["RK45", "BDF"])
+def test_schedule_matches_analytic(method):
+    from pkmodel.dosing import DosingSchedule
+
+    test_model = two_compartments()
+    schedule = DosingSchedule().add_regimen("main", 1, 0, 1, 5).add_regimen("peripheral", 2, 0.3, 1.5, 4, duration=0.2)
+    t_eval = np.linspace(0, 8, 200)
+    numerical = test_model.solve(t_eval, np.zeros(2), method=method, schedule=schedule)
+    analytic = test_model.solve(t_eval, np.zeros(2), engine="analytic", schedule=schedule)
+
+    assert numerical.success
+    assert np.allclose(numerical.y, analytic.y, atol=1e-2)
+
+
+def test_infusion_matches_dose_steady():
+    from pkmodel.pk_model import PKModel
+    from pkmodel.functions import dose_steady
+    from pkmodel.dosing import DosingSchedule
+
+    windowed = PKModel()
+    windowed.create_model("central", 1, dosing_func=dose_steady, dosing_time_constant=3, dosing_time_windows=[(0.5, 1), (2, 2.5)])
+    schedule = DosingSchedule().add_infusion("central", 3, 0.5, 1).add_infusion("central", 3, 2, 2.5)
+    scheduled = one_compartment()
+    t_eval = np.linspace(0, 4, 50)
+
+    assert np.allclose(
+        windowed.solve(t_eval, np.zeros(1)).y, scheduled.solve(t_eval, np.zeros(1), schedule=schedule).y, atol=1e-3
+    )
@@ -0,0 +1,86 @@
+# This sets up unit tests to be run with pytest on fit.py
+
+import pytest
+import numpy as np
+
+
+def saturable_clearance(t, q):
+    return 0.5 * q[1] / (1 + q[1])
+
+
+def main_loss(t, q):
+    return 0.5 * q[0] / (1 + q[0])
+
+
+def build_model(volume: float, k: float, nonlinear: bool = False):
+    from pkmodel.pk_model import PKModel
+    from pkmodel.functions import dose_steady
+
+    test_model = PKModel()
+    test_model.create_model("main", 1, dosing_func=dose_steady, dosing_time_constant=2, dosing_time_windows=[(0, 1)])
+    test_model.add_sibling("main", "peripheral", volume, connection_time_constant=k)
+    if nonlinear:
+        test_model.add_output("peripheral", saturable_clearance)
+    return test_model
+
+
+def observe(test_model, t: np.ndarray) -> dict:
+    engine = "analytic" if test_model.compile().is_linear else "numerical"
+    y = test_model.solve(np.append(0, t), [0, 0], engine=engine, method="Radau").y[:, 1:]
+    return {"main": (t, y[0] / 1), "peripheral": (t[::2], y[1, ::2] / test_model.parameters["peripheral.volume"])}
+
+
+@pytest.mark.parametrize("nonlinear", [False, True])
+def test_fit(nonlinear):
+    from pkmodel.fit import fit
+
+    observations = observe(build_model(0.5, 0.8, nonlinear), np.linspace(0.5, 8, 16))
+    test_model = build_model(2, 0.2, nonlinear)
+    result = fit(test_model, observations, ["peripheral.volume", "main->peripheral.k"])
+    assert result.success
+    assert result.parameters["peripheral.volume"] == pytest.approx(0.5, rel=1e-3)
+    assert result.parameters["main->peripheral.k"] == pytest.approx(0.8, rel=1e-3)
+    # One solve per iteration, shared between residuals and Jacobian
+    assert result.nsolves <= result.nfev + result.njev
+    assert test_model.parameters["peripheral.volume"] == 2
+
+
+def test_fit_shifted_function():  # the volume enters the scale of the elimination shifted onto the child
+    from pkmodel.pk_model import PKModel
+    from pkmodel.fit import fit
+
+    def shifted(volume):
+        test_model = PKModel()
+        test_model.create_model("main", volume, dosing_time_constant=0, elimination_func=main_loss)
+        test_model.add_child("main", "c1", 3)
+        return test_model
+
+    t = np.linspace(0.5, 8, 16)
+    y = shifted(2).solve(np.append(0, t), [4, 0], method="Radau").y[:, 1:]
+    observations = {"main": (t, y[0] / 2), "c1": (t, y[1] / 3)}
+    test_model = shifted(1)
+    result = fit(test_model, observations, ["main.volume"], q0=[4, 0])
+    assert result.success
+    assert result.parameters["main.volume"] == pytest.approx(2, rel=1e-3)
+
+
+def test_fit_multistart():
+    from pkmodel.fit import fit
+
+    observations = observe(build_model(0.5, 0.8), np.linspace(0.5, 8, 16))
+    observations["main"] += (0.1 * np.ones(16),)
+    result = fit(
+        build_model(2, 0.2),
+        observations,
+        ["peripheral.volume", "main->peripheral.k", "dose.X"],
+        bounds={"dose.X": (1, 3)},
+        n_starts=3,
+        max_workers=2,
+        seed=1,
+    )
+    assert len(result.starts) == 3
+    assert result.cost == min(start.cost for start in result.starts)
+    assert result.parameters["dose.X"] == pytest.approx(2, rel=1e-3)
+
+    with pytest.raises(ValueError):
+        fit(build_model(2, 0.2), {"other": ([1], [1])}, ["dose.X"])
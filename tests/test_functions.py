@@ -21,3 +21,20 @@ def test_dose_steady(t, X, times, expected, raises):
             assert dose_steady(t, None, X, times) == expected
     else:
         assert dose_steady(t, None, X, times) == expected
+
+
+def test_dose_windows():
+    """Test that DoseWindows finds the windows by binary search, for unsorted and overlapping windows."""
+    import numpy as np
+    from pkmodel.functions import dose_steady, DoseWindows
+
+    windows = DoseWindows([[7, 9], [1, 3], [2, 10], [12, 15]])
+    t = np.array([0, 1, 3, 9.5, 10, 11, 12, 15, 16])
+    expected = np.array([0, 5, 5, 5, 5, 0, 5, 5, 0])
+
+    assert len(windows) == 4
+    assert windows.contains(11) is False
+    assert np.array_equal(dose_steady(t, None, 5, windows), expected)
+    assert [dose_steady(s, None, 5, windows) for s in t] == list(expected)
+    with pytest.raises(TypeError):
+        DoseWindows([[1, 3, 6]])
@@ -0,0 +1,87 @@
+# This sets up unit tests to be run with pytest on graph.py
+
+import numpy as np
+import pytest
+
+
+def chain_with_sibling():
+    from pkmodel.pk_model import PKModel
+
+    test_model = PKModel()
+    test_model.create_model("central", 2)
+    test_model.add_parent("central", "subcutaneous", 1, connection_time_constant=3)
+    test_model.add_child("central", "kidney", 1, connection_time_constant=0.5)
+    test_model.add_sibling("central", "peripheral", 4, connection_time_constant=0.2)
+    return test_model
+
+
+def test_structure_queries():
+    graph = chain_with_sibling().graph
+
+    assert graph.names == ["central", "subcutaneous", "kidney", "peripheral"]
+    assert graph.in_degree().tolist() == [2, 0, 1, 1]
+    assert graph.out_degree().tolist() == [2, 1, 0, 1]
+    assert graph.adjacency().toarray()[0].tolist() == [0, 0, 1, 1]
+    assert graph.path("subcutaneous", "kidney") == ["subcutaneous", "central", "kidney"]
+    assert graph.path("kidney", "central") is None
+    # The shifted dose and elimination are drawn from and to the unlabelled node
+    assert set(graph.edges()) == {
+        ("", "subcutaneous"),
+        ("subcutaneous", "central"),
+        ("central", "kidney"),
+        ("kidney", ""),
+        ("central", "peripheral"),
+        ("peripheral", "central"),
+    }
+
+    with pytest.raises(ValueError):
+        graph.add_compartment("central", 1)
+
+
+def test_views_follow_the_graph():
+    from pkmodel.rates import DoseConstantRate, FirstOrderRate
+
+    test_model = chain_with_sibling()
+    central, subcutaneous, kidney, _ = test_model._compartments
+
+    # The connection from the parent replaces the shifted dose as the first input, as does the one to the child
+    # for the shifted elimination
+    assert isinstance(subcutaneous.input_funcs[0], DoseConstantRate)
+    assert central.input_funcs[0] is subcutaneous.output_funcs[0]
+    assert central.output_funcs[0] is kidney.input_funcs[0]
+    assert kidney.output_funcs[0].q_index == 2
+    assert [type(func) for func in central.output_funcs] == [FirstOrderRate, FirstOrderRate]
+    assert not hasattr(central, "__dict__")
+
+    test_model.graph.volumes[0] = 5
+    assert central.volume == 5
+
+
+def test_compiles_like_the_compartments():
+    from pkmodel.compiled import CompiledModel
+
+    test_model = chain_with_sibling()
+    from_graph = CompiledModel.from_graph(test_model.graph)
+    from_compartments = CompiledModel.from_compartments(test_model._compartments)
+
+    assert np.allclose(from_graph.K.toarray(), from_compartments.K.toarray())
+    assert np.allclose(from_graph.b, from_compartments.b)
+    q = np.array([1.0, 2.0, 3.0, 4.0])
+    assert np.allclose(from_graph.differential_eq(0.5, q), test_model.differential_eq(0.5, q))
+
+
+def test_cache_follows_changes():  # ordered flows and terms are cached, but not across changes of the flows
+    from pkmodel.rates import ZerothOrderRate
+
+    test_model = chain_with_sibling()
+    q = np.array([1.0, 2.0, 3.0, 4.0])
+    before = test_model.differential_eq(0.5, q)
+    central = test_model._compartments[0]
+    inputs = central.input_funcs
+
+    test_model.add_input("central", ZerothOrderRate(2))
+    assert central.input_funcs == inputs + (test_model.graph.funcs[-1],)
+    assert test_model.differential_eq(0.5, q) == pytest.approx(np.add(before, [2, 0, 0, 0]))
+    test_model.add_child("kidney", "bladder", 1)
+    assert len(test_model._compartments) == 5
+    assert test_model._compartments[2].output_funcs[0].q_index == 2
@@ -0,0 +1,30 @@
+# This sets up unit tests to be run with pytest on the import of the pkmodel package
+
+import os
+import subprocess
+import sys
+
+# Import time of the package in a fresh interpreter, which is mostly that of numpy and scipy.sparse (about 0.35s),
+# so that eager imports of heavy dependencies exceed it
+IMPORT_BUDGET = 0.6
+SCRIPT = """
+import sys, time
+start = time.perf_counter()
+import pkmodel
+print(time.perf_counter() - start)
+print(" ".join(sorted(m for m in sys.modules if m.split(".")[0] in ("matplotlib", "networkx", "numba", "multiprocessing")
+                      or m.startswith("scipy.sparse.linalg")
+                      or (m.startswith("scipy.") and m.split(".")[1] not in ("sparse", "version") and m[6] != "_"))))
+"""
+
+
+def test_import_is_lazy():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    environment = dict(os.environ, PYTHONPATH=root + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    # No capture_output and text arguments, which need Python 3.7
+    output = subprocess.run(
+        [sys.executable, "-c", SCRIPT], stdout=subprocess.PIPE, universal_newlines=True, check=True, env=environment
+    ).stdout.split("\n")
+    # Plotting, graph drawing, Numba, process pools and all of scipy but its sparse matrices are only imported once used
+    assert output[1] == ""
+    assert float(output[0]) < IMPORT_BUDGET
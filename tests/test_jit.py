@@ -0,0 +1,73 @@
+# This sets up unit tests to be run with pytest on jit.py
+
+import pytest
+import numpy as np
+
+
+def michaelis_menten(t, q):
+    return 2 * q[0] / (0.5 + q[0])
+
+
+def periodic_dose(t, q):
+    return 1.0 if np.mod(t, 1) < 0.1 else 0.0
+
+
+def nonlinear_model():
+    from pkmodel.pk_model import PKModel
+
+    test_model = PKModel()
+    test_model.create_model("main", 1, dosing_func=periodic_dose, elimination_func=michaelis_menten)
+    test_model.add_child("main", "child", 2)
+    test_model.add_sibling("main", "peripheral", 0.5)
+    test_model.add_output("peripheral", lambda t, q: 0.1 * q[2] ** 2)
+    return test_model
+
+
+def test_compile_rhs():
+    from pkmodel.jit import compile_rhs
+
+    compiled = nonlinear_model().compile()
+    rhs = compile_rhs(compiled)
+    for t, q in [(0.05, np.array([1.0, 2.0, 3.0])), (0.5, np.array([0.3, 0.0, 0.1]))]:
+        assert np.allclose(rhs(t, q), compiled.differential_eq(t, q))
+        assert np.allclose(rhs(t, q, compiled.b), compiled.differential_eq(t, q, compiled.b))
+
+
+def test_jit_solve():
+    test_model = nonlinear_model()
+    t_eval = np.linspace(0, 3, 31)
+    for method in ["RK45", "BDF"]:
+        reference = test_model.solve(t_eval, np.zeros(3), method=method)
+        jitted = test_model.solve(t_eval, np.zeros(3), method=method, jit=True)
+        assert jitted.success
+        assert np.allclose(jitted.y, reference.y)
+
+
+def test_native_functions():
+    pytest.importorskip("numba")
+    from pkmodel.jit import _native_term
+    from pkmodel.functions import first_order
+
+    assert _native_term(michaelis_menten) is not None
+    # Calls to plain Python functions cannot be compiled, so these stay in Python
+    assert _native_term(lambda t, q: first_order(t, q, 0.2, 1)) is None
+
+
+def test_native_solve():  # the compiled kernel itself, rather than the fallback without Numba
+    pytest.importorskip("numba")
+    from pkmodel.jit import compile_rhs, _native_term
+
+    test_model = nonlinear_model()
+    compiled = test_model.compile()
+    assert all(_native_term(func) is not None for _, _, func in compiled.residual)
+    rhs = compile_rhs(compiled)
+    assert rhs != compiled.differential_eq
+    q = np.array([1.0, 2.0, 3.0])
+    assert np.allclose(rhs(0.05, q), compiled.differential_eq(0.05, q))
+
+    t_eval = np.linspace(0, 3, 31)
+    for method in ["RK45", "BDF"]:
+        reference = test_model.solve(t_eval, np.zeros(3), method=method)
+        jitted = test_model.solve(t_eval, np.zeros(3), method=method, jit=True)
+        assert jitted.success
+        assert np.allclose(jitted.y, reference.y)
@@ -0,0 +1,51 @@
+# This sets up unit tests to be run with pytest on parallel.py
+
+import numpy as np
+
+
+def main_loss(t, q):
+    return 0.5 * q[0] / (1 + q[0])
+
+
+def test_sweep_matches_serial_solves():
+    from pkmodel.pk_model import PKModel
+    from pkmodel.parallel import sweep
+
+    test_model = PKModel()
+    test_model.create_model("main", 1)
+    test_model.add_sibling("main", "peripheral", 0.5)
+    t_eval = np.linspace(0, 5, 20)
+    q0 = np.zeros(2)
+    parameter_sets = [{"main->peripheral.k": k, "peripheral.volume": 1 + k} for k in np.linspace(0.1, 2, 7)]
+
+    results = sweep(test_model, parameter_sets, t_eval, q0, max_workers=2, chunksize=3, engine="analytic")
+
+    assert len(results) == 7
+    for parameters, result in zip(parameter_sets, results):
+        individual = PKModel()
+        individual.create_model("main", 1)
+        individual.add_sibling(
+            "main", "peripheral", parameters["peripheral.volume"], connection_time_constant=parameters["main->peripheral.k"]
+        )
+        assert np.allclose(result.y, individual.solve(t_eval, q0, engine="analytic").y)
+
+
+def test_sweep_rescales_shifted_functions():  # the volume correction of a shifted user function follows the parameters
+    from pkmodel.pk_model import PKModel
+    from pkmodel.parallel import sweep
+
+    def shifted(volume):
+        test_model = PKModel()
+        test_model.create_model("main", volume, elimination_func=main_loss)
+        test_model.add_child("main", "c1", 3)
+        return test_model
+
+    t_eval = np.linspace(0, 5, 11)
+    q0 = np.array([2.0, 0.0])
+    parameter_sets = [{"main.volume": volume} for volume in (0.5, 1.0, 2.0)]
+
+    results = sweep(shifted(1), parameter_sets, t_eval, q0, max_workers=2, method="Radau")
+
+    for parameters, result in zip(parameter_sets, results):
+        reference = shifted(parameters["main.volume"]).solve(t_eval, q0, method="Radau")
+        assert np.allclose(result.y, reference.y, atol=1e-3)
@@ -0,0 +1,63 @@
+# This sets up unit tests to be run with pytest on pkanalysis.py
+
+import numpy as np
+import pytest
+
+
+def decay():  # concentration 2 exp(-t / 2) from a mass of 4 in a volume of 2
+    from pkmodel.pk_model import PKModel
+
+    test_model = PKModel()
+    test_model.create_model("central", 2, dosing_time_constant=0)
+    return test_model
+
+
+def test_metrics():
+    from pkmodel.pkanalysis import metrics
+
+    test_model = decay()
+    solution = test_model.solve(np.linspace(0, 10, 2001), np.array([4.0]), engine="analytic")
+    result = metrics(solution, test_model)
+
+    assert result.names == ["central"]
+    assert result.auc == pytest.approx([4 * (1 - np.exp(-5))], rel=1e-4)
+    assert (result.cmax[0], result.tmax[0]) == (pytest.approx(2), 0)
+    assert result.trough == pytest.approx([2 * np.exp(-5)])
+    assert result.half_life == pytest.approx([2 * np.log(2)])
+
+    per_interval = metrics(solution, test_model, intervals=[0, 4, 10])
+    assert per_interval.auc.shape == (1, 2)
+    assert per_interval.auc.sum() == pytest.approx(result.auc[0])
+    assert per_interval.cmax[0, 1] == pytest.approx(2 * np.exp(-2))
+
+    with pytest.raises(ValueError):
+        metrics(solution, test_model, intervals=[0, 12])
+
+
+def test_auc_state():  # the AUC integrated during the solve is exact for sparse output
+    from pkmodel.pkanalysis import metrics
+
+    test_model = decay()
+    test_model.add_sibling("central", "peripheral", 1)
+    solution = test_model.solve(np.array([0.0, 5.0, 10.0]), np.array([4.0, 0.0]), method="LSODA", auc=True)
+    dense = test_model.solve(np.linspace(0, 10, 2001), np.array([4.0, 0.0]), engine="analytic")
+
+    assert solution.y.shape == solution.auc.shape == (2, 3)
+    assert np.allclose(metrics(solution, test_model).auc, metrics(dense, test_model).auc, rtol=1e-3)
+    assert np.allclose(solution.auc[:, 0], 0)
+
+
+def test_batched_metrics():
+    from pkmodel.pkanalysis import metrics
+
+    test_model = decay()
+    volumes = np.array([[1.0], [2.0], [4.0]])
+    population = test_model.solve_population(
+        volumes, np.linspace(0, 10, 2001), np.array([4.0]), ["central.volume"], method="LSODA"
+    )
+    result = metrics(population, test_model, volumes=volumes)
+
+    assert result.cmax.shape == (3, 1)
+    assert result.cmax[:, 0] == pytest.approx([4, 2, 1], rel=1e-3)
+    # The elimination rate is the time constant over the volume
+    assert result.half_life[:, 0] == pytest.approx(np.log(2) * volumes[:, 0], rel=1e-2)
@@ -143,3 +143,94 @@ def test_network_graph():
     test_model.add_child("main", "child", 1 / 3)
     test_model.add_sibling("main", "sibling", 0.5)
     test_model.draw_network(testing=True)
+
+
+@pytest.mark.parametrize("method,sparse", [("BDF", False), ("BDF", True), ("Radau", True), ("LSODA", True)])
+def test_stiff_methods(method, sparse):
+    from pkmodel.pk_model import PKModel
+
+    test_model = PKModel()
+    test_model.create_model("main", 1)
+    test_model.add_sibling("main", "peripheral", 0.5, connection_time_constant=0.5)
+    test_model.add_parent("main", "subcutaneous", 0.05, connection_time_constant=0.1)
+    test_model.add_output("peripheral", lambda t, q: 0.1 * q[1] ** 2)
+
+    t_eval = np.linspace(0, 5, 100)
+    reference = test_model.solve(t_eval, np.zeros(3))
+    stiff = test_model.solve(t_eval, np.zeros(3), method=method, sparse=sparse)
+
+    assert stiff.success
+    assert np.allclose(stiff.y, reference.y, atol=1e-2)
+
+
+def test_shifted_chain():  # shifting along a chain of children is resolved at build time, without nesting
+    from pkmodel.pk_model import PKModel
+    from pkmodel.rates import FirstOrderRate, ShiftedRate
+
+    def chain(elimination_func=None):
+        test_model = PKModel()
+        if elimination_func is None:
+            test_model.create_model("c0", 2)
+        else:
+            test_model.create_model("c0", 2, elimination_func=elimination_func)
+        for i in range(1, 20):
+            test_model.add_child("c%d" % (i - 1), "c%d" % i, 1 + i)
+        return test_model
+
+    last = chain()._compartments[-1].output_funcs[0]
+    assert isinstance(last, FirstOrderRate)
+    assert (last.q_index, last.volume, last.k) == (19, "c19.volume", pytest.approx(1 / 20))
+
+    last = chain(util2)._compartments[-1].output_funcs[0]
+    assert isinstance(last, ShiftedRate) and last.func is util2
+    assert last.scale == pytest.approx(2 / 20)
+    # util2 reads q[0], which has been handed down the chain to the last compartment
+    assert last(1, np.arange(20.0)) == pytest.approx(19 * 2 / 20)
+
+
+def test_set_parameter():  # editing parameters gives the model which would have been built with the new values
+    from pkmodel.pk_model import PKModel
+
+    def build(volume=1, k=0.5):
+        test_model = PKModel()
+        test_model.create_model("central", 2)
+        test_model.add_child("central", "kidney", volume, connection_time_constant=3)
+        test_model.add_child("kidney", "bladder", 2)
+        test_model.add_sibling("central", "peripheral", 4, connection_time_constant=k)
+        test_model.add_output("central", util2)
+        return test_model
+
+    test_model = build()
+    compiled = test_model.compile()
+    test_model.set_parameter("central->peripheral", k=0.3)
+    test_model.set_parameter("kidney.volume", 5)
+
+    reference = build(5, 0.3)
+    assert test_model.compile() is compiled
+    assert np.allclose(compiled.K.toarray(), reference.compile().K.toarray())
+    assert test_model.parameters == reference.parameters
+    assert test_model._compartments[1].volume == 5
+    q = np.array([1.0, 2.0, 3.0, 4.0])
+    assert np.allclose(test_model.differential_eq(0.5, q), reference.differential_eq(0.5, q))
+    # The edits are part of the specification of the model
+    assert np.allclose(PKModel.from_spec(test_model.to_spec()).compile().K.toarray(), compiled.K.toarray())
+
+    with pytest.raises(AssertionError):
+        test_model.set_parameter("central->kidney", volume=2)
+    with pytest.raises(ValueError):
+        test_model.set_parameter("central.volume", -1)
+
+
+@pytest.mark.parametrize("engine", ["numerical", "analytic"])
+def test_decreasing_times(engine):  # both engines integrate forward in time only
+    from pkmodel.pk_model import PKModel
+
+    test_model = PKModel()
+    test_model.create_model("main", 1)
+    t_eval = np.linspace(5, 0, 11)
+
+    with pytest.raises(ValueError):
+        test_model.solve(t_eval, [1.0], engine=engine)
+    with pytest.raises(ValueError):
+        test_model.solve_stream(t_eval, [1.0], chunk_size=4, engine=engine)
+    assert test_model.solve(t_eval[::-1], [1.0], engine=engine).success
@@ -0,0 +1,93 @@
+# This sets up unit tests to be run with pytest on PKModel.solve_population
+
+import pytest
+import numpy as np
+import scipy.integrate
+
+
+def main_loss(t, q):
+    return 0.5 * q[0] / (1 + q[0])
+
+
+def build_model(volume=0.5, time_constant=0.5, child_volume=2, elimination=1, custom=False):
+    from pkmodel.pk_model import PKModel
+    from pkmodel.functions import dose_steady
+
+    test_model = PKModel()
+    test_model.create_model(
+        "main",
+        1,
+        dosing_func=dose_steady,
+        dosing_time_windows=[(0, 0.5), (1, 1.5)],
+        elimination_time_constant=elimination,
+    )
+    test_model.add_sibling("main", "peripheral", volume, connection_time_constant=time_constant)
+    test_model.add_parent("main", "subcutaneous", 0.1, connection_time_constant=0.2)
+    test_model.add_child("main", "child", child_volume)
+    if custom:
+        test_model.add_output("peripheral", lambda t, q: 0.1 * q[1] ** 2)
+    return test_model
+
+
+def test_parameters():
+    test_model = build_model()
+    assert test_model.parameters == {
+        "main.volume": 1,
+        "dose.X": 1,
+        "elimination.k": 1,
+        "peripheral.volume": 0.5,
+        "main->peripheral.k": 0.5,
+        "subcutaneous.volume": 0.1,
+        "subcutaneous->main.k": 0.2,
+        "child.volume": 2,
+        "main->child.k": 1,
+    }
+
+
+@pytest.mark.parametrize("custom,method", [(False, "RK45"), (False, "BDF"), (True, "RK45"), (True, "Radau")])
+def test_population_matches_individual_models(custom, method):
+    table = np.array([[0.5, 0.5, 2, 1], [1.0, 0.3, 0.5, 2], [0.2, 2.0, 1, 0.1]])
+    names = ["peripheral.volume", "main->peripheral.k", "child.volume", "elimination.k"]
+    t_eval = np.linspace(0, 3, 50)
+    q0 = np.array([0.0, 0.5, 0.0, 0.0])
+
+    population = build_model(custom=custom).solve_population(
+        table, t_eval, q0, parameter_names=names, method=method, chunk_size=2
+    )
+    assert population.success
+    assert population.y.shape == (3, 4, 50)
+
+    for row, y in zip(table, population.y):
+        individual = build_model(*row[:3], elimination=row[3], custom=custom)
+        reference = scipy.integrate.solve_ivp(
+            individual.compile().differential_eq, [0, 3], q0, t_eval=t_eval, method="Radau", rtol=1e-6, atol=1e-9
+        )
+        # The population is only accurate to within the default solver tolerances around the dosing windows
+        assert np.allclose(y, reference.y, atol=5e-2)
+
+
+def test_population_invalid_table():
+    test_model = build_model()
+    with pytest.raises(AssertionError):
+        test_model.solve_population(np.ones((2, 2)), np.linspace(0, 1, 5), np.zeros(4), parameter_names=["main.volume"])
+    with pytest.raises(AssertionError):
+        test_model.solve_population(np.ones((2, 1)), np.linspace(0, 1, 5), np.zeros(4), parameter_names=["unknown"])
+
+
+def test_population_rescales_shifted_functions():  # the volume correction of a shifted user function follows the table
+    from pkmodel.pk_model import PKModel
+
+    def shifted(volume):
+        test_model = PKModel()
+        test_model.create_model("main", volume, elimination_func=main_loss)
+        test_model.add_child("main", "c1", 3)
+        return test_model
+
+    volumes = np.array([[1.0], [2.0], [0.5]])
+    t_eval = np.linspace(0, 5, 11)
+    q0 = np.array([2.0, 0.0])
+    population = shifted(1).solve_population(volumes, t_eval, q0, ["main.volume"], method="Radau")
+
+    for (volume,), y in zip(volumes, population.y):
+        reference = shifted(volume).solve(t_eval, q0, method="Radau")
+        assert np.allclose(y, reference.y, atol=1e-3)
@@ -0,0 +1,71 @@
+# This sets up unit tests to be run with pytest on profiling.py
+
+import numpy as np
+
+
+def slow_input(t, q):
+    return 1 if np.mod(t, 1) < 0.1 else 0
+
+
+def profiled_model():
+    from pkmodel.pk_model import PKModel
+
+    test_model = PKModel()
+    test_model.create_model("main", 1, dosing_func=slow_input)
+    test_model.add_sibling("main", "peripheral", 0.5, connection_time_constant=0.5)
+    test_model.add_output("peripheral", lambda t, q: 0.2 * q[1], label="per. loss")
+    return test_model
+
+
+def test_profile_counts():
+    test_model = profiled_model()
+    t_eval = np.linspace(0, 5, 51)
+    plain = test_model.solve(t_eval, [0, 0])
+    result = test_model.solve(t_eval, [0, 0], profile=True)
+    report = result.profile
+    assert np.allclose(result.y, plain.y)
+    assert report.rhs_calls == result.nfev
+    # RK45 evaluates the RHS twice to start and six times per step attempt
+    assert 2 + 6 * (report.accepted_steps + report.rejected_steps) == result.nfev
+    assert report.rejected_steps > 0
+    assert [(f.compartment, f.kind, f.calls) for f in report.functions] == [
+        ("main", "input", result.nfev),
+        ("peripheral", "output", result.nfev),
+    ]
+    assert set(report.by_compartment()) == {"main", "peripheral"}
+    assert 0 <= report.compiled_time <= report.rhs_time <= report.wall_time
+    assert "slow_input" in report.report()
+
+
+def test_profile_methods():
+    test_model = profiled_model()
+    t_eval = np.linspace(0, 5, 51)
+    for method in ["BDF", "Radau"]:
+        report = test_model.solve(t_eval, [0, 0], method=method, profile=True).profile
+        assert report.accepted_steps > 0 and report.rejected_steps >= 0
+    report = test_model.solve(t_eval, [0, 0], method="LSODA", profile=True).profile
+    assert report.rejected_steps is None
+    assert report.as_dict()["rejected_steps"] is None
+
+
+def test_jacobian_not_counted():  # finite-difference Jacobians of scipy are not mistaken for step attempts
+    from pkmodel.profiling import SolverProfile, SegmentProfile
+    import scipy.sparse
+
+    def fun(t, q):
+        return np.array([-q[0] ** 2, q[0] - q[1]])
+
+    segment = SegmentProfile(0, 1)
+    for method in ["BDF", "Radau"]:
+        solver = SolverProfile(method, ["a", "b"]).solver(method, segment)(
+            fun, 0, np.array([1.0, 0.0]), 1, jac_sparsity=scipy.sparse.csr_matrix(np.ones((2, 2)))
+        )
+        solver._times = []
+        if method == "BDF":
+            solver.jac(solver.t, solver.y)
+        else:
+            solver.jac(solver.t, solver.y, fun(solver.t, solver.y))
+        assert solver._times == []
+        # The evaluations of a step are still recorded
+        solver.step()
+        assert solver._times
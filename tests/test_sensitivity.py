@@ -0,0 +1,108 @@
+# This sets up unit tests to be run with pytest on sensitivity.py
+
+import pytest
+import numpy as np
+
+
+def saturable_clearance(t, q):
+    return 0.5 * q[1] / (1 + q[1])
+
+
+def main_loss(t, q):
+    return 0.5 * q[0] / (1 + q[0])
+
+
+def build_model(values: dict, nonlinear: bool = False):
+    from pkmodel.pk_model import PKModel
+    from pkmodel.functions import dose_steady
+
+    test_model = PKModel()
+    test_model.create_model(
+        "main",
+        values["main.volume"],
+        dosing_func=dose_steady,
+        dosing_time_constant=values["dose.X"],
+        dosing_time_windows=[(0, 1), (3, 4)],
+        elimination_time_constant=values["elimination.k"],
+    )
+    test_model.add_sibling("main", "peripheral", values["peripheral.volume"], connection_time_constant=values["main->peripheral.k"])
+    test_model.add_child("main", "child", values["child.volume"], connection_time_constant=values["main->child.k"])
+    if nonlinear:
+        test_model.add_output("peripheral", saturable_clearance)
+    return test_model
+
+
+VALUES = {
+    "main.volume": 1.5,
+    "dose.X": 2,
+    "elimination.k": 0.8,
+    "peripheral.volume": 0.5,
+    "main->peripheral.k": 0.4,
+    "child.volume": 2,
+    "main->child.k": 0.3,
+}
+
+
+def finite_differences(nonlinear: bool, **options) -> dict:
+    t_eval = np.linspace(0, 6, 13)
+    derivatives = dict()
+    for name in VALUES:
+        h = 1e-6 * VALUES[name]
+        solutions = [
+            build_model(dict(VALUES, **{name: VALUES[name] + sign * h}), nonlinear).solve(t_eval, [0, 0, 0], **options).y
+            for sign in (1, -1)
+        ]
+        derivatives[name] = (solutions[0] - solutions[1]) / (2 * h)
+    return derivatives
+
+
+@pytest.mark.parametrize("engine", ["analytic", "numerical"])
+def test_sensitivities_linear(engine):
+    test_model = build_model(VALUES)
+    assert set(test_model.parameters) == set(VALUES)
+    options = {"engine": engine} if engine == "analytic" else {"method": "LSODA"}
+    result = test_model.solve(np.linspace(0, 6, 13), [0, 0, 0], sensitivities=list(VALUES), **options)
+    reference = test_model.solve(np.linspace(0, 6, 13), [0, 0, 0], engine="analytic")
+    assert result.y == pytest.approx(reference.y, abs=1e-2)
+
+    expected = finite_differences(False, engine="analytic")
+    for name in VALUES:
+        tolerance = 1e-6 if engine == "analytic" else 1e-2
+        assert result.sensitivities[name] == pytest.approx(expected[name], abs=tolerance), name
+
+
+def test_sensitivities_nonlinear():
+    test_model = build_model(VALUES, nonlinear=True)
+    names = ["peripheral.volume", "main->peripheral.k"]
+    result = test_model.solve(np.linspace(0, 6, 13), [0, 0, 0], method="LSODA", sensitivities=names, profile=True)
+    assert result.y.shape == (3, 13)
+    assert "dperipheral/dperipheral.volume" in result.profile.by_compartment()
+
+    # Tight tolerances for the finite differences of the reference
+    expected = finite_differences(True, method="Radau")
+    for name in names:
+        assert result.sensitivities[name] == pytest.approx(expected[name], abs=2e-2), name
+
+
+def test_sensitivities_shifted_function():  # the scale of a shifted user function depends on both volumes
+    from pkmodel.pk_model import PKModel
+
+    def shifted(values):
+        test_model = PKModel()
+        test_model.create_model("main", values["main.volume"], elimination_func=main_loss)
+        test_model.add_child("main", "c1", values["c1.volume"])
+        return test_model
+
+    values = {"main.volume": 2.0, "c1.volume": 3.0}
+    t_eval = np.linspace(0, 5, 11)
+    q0 = [2.0, 0.0]
+    result = shifted(values).solve(t_eval, q0, method="LSODA", sensitivities=list(values))
+
+    for name in values:
+        h = 1e-6 * values[name]
+        solutions = [
+            shifted(dict(values, **{name: values[name] + sign * h})).solve(t_eval, q0, method="Radau").y for sign in (1, -1)
+        ]
+        expected = (solutions[0] - solutions[1]) / (2 * h)
+        assert np.abs(expected).max() > 0.1
+        assert result.sensitivities[name] == pytest.approx(expected, abs=5e-3), name
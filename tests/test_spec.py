@@ -0,0 +1,56 @@
+# This sets up unit tests to be run with pytest on spec.py
+
+import json
+import pickle
+import pytest
+import numpy as np
+
+
+def renal_clearance(t, q):
+    return 0.1 * q[1]
+
+
+def build_model():
+    from pkmodel.pk_model import PKModel
+    from pkmodel.functions import dose_steady
+    from pkmodel.rates import FirstOrderRate
+
+    test_model = PKModel()
+    test_model.create_model("main", 1, dosing_func=dose_steady, dosing_time_windows=[(0, 0.5), (1, 1.5)])
+    test_model.add_sibling("main", "kidney", 3, connection_time_constant=0.2)
+    test_model.add_parent("main", "subcutaneous", 0.05, connection_time_constant=0.1)
+    test_model.add_child("main", "child", 2, shift_correct_for_volume_change=False)
+    test_model.add_output("kidney", renal_clearance, label="rh. clear.")
+    test_model.add_output("child", FirstOrderRate(0.3, 3))
+    return test_model
+
+
+def test_spec_round_trip():
+    from pkmodel.pk_model import PKModel
+
+    test_model = build_model()
+    model_spec = test_model.to_spec()
+    # The specification consists of plain data only
+    model_spec = json.loads(json.dumps(model_spec))
+    rebuilt = PKModel.from_spec(model_spec)
+
+    assert rebuilt.get_compartment_names == test_model.get_compartment_names
+    assert rebuilt.parameters == test_model.parameters
+    assert rebuilt.to_spec() == model_spec
+    q = np.array([1.0, 2.0, 3.0, 4.0])
+    for t in [0.2, 0.7]:
+        assert np.allclose(rebuilt.differential_eq(t, q), test_model.differential_eq(t, q))
+
+
+def test_model_pickles():
+    test_model = build_model()
+    unpickled = pickle.loads(pickle.dumps(test_model))
+    q = np.array([1.0, 2.0, 3.0, 4.0])
+    assert np.allclose(unpickled.differential_eq(0.2, q), test_model.differential_eq(0.2, q))
+
+
+def test_lambda_not_serializable():
+    test_model = build_model()
+    test_model.add_input("main", lambda t, q: 1)
+    with pytest.raises(TypeError):
+        test_model.to_spec()
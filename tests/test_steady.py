@@ -0,0 +1,76 @@
+# This sets up unit tests to be run with pytest on steady.py
+
+import pytest
+import numpy as np
+
+
+def saturable_clearance(t, q):
+    return 0.5 * q[1] / (1 + q[1])
+
+
+def two_compartment(dosing_func=None, windows=None):
+    from pkmodel.pk_model import PKModel
+    from pkmodel.functions import dose_constant
+
+    test_model = PKModel()
+    test_model.create_model(
+        "main",
+        1,
+        dosing_func=dosing_func if dosing_func is not None else dose_constant,
+        dosing_time_constant=2,
+        dosing_time_windows=windows,
+    )
+    test_model.add_sibling("main", "peripheral", 0.5, connection_time_constant=0.5)
+    return test_model
+
+
+def test_steady_state():
+    test_model = two_compartment()
+    q = test_model.steady_state()
+    # Elimination balances the dose, and the peripheral compartment is in equilibrium with the main one
+    assert q == pytest.approx([2, 1])
+    assert test_model.differential_eq(0, q) == pytest.approx([0, 0], abs=1e-12)
+
+    test_model.add_output("peripheral", saturable_clearance)
+    q = test_model.steady_state()
+    assert test_model.differential_eq(0, q) == pytest.approx([0, 0], abs=1e-10)
+    solution = test_model.solve(np.linspace(0, 100, 3), [0, 0], method="LSODA")
+    assert solution.y[:, -1] == pytest.approx(q, rel=1e-3)
+
+
+def test_steady_state_singular():
+    from pkmodel.pk_model import PKModel
+
+    test_model = PKModel()
+    test_model.create_model("main", 1, elimination_time_constant=0)
+    with pytest.raises(ValueError):
+        test_model.steady_state()
+
+
+def test_periodic_steady_state():
+    from pkmodel.functions import dose_steady
+
+    windows = [(i, i + 0.25) for i in range(100)]
+    test_model = two_compartment(dose_steady, windows)
+    q = test_model.periodic_steady_state(1)
+    one_period = test_model.solve(np.linspace(0, 1, 5), q, engine="analytic")
+    assert one_period.y[:, -1] == pytest.approx(q)
+    long_run = test_model.solve(np.arange(0, 51.0), [0, 0], engine="analytic")
+    assert long_run.y[:, -1] == pytest.approx(q, rel=1e-6)
+
+    # Nonlinear models by shooting, here starting half a period into the dosing
+    test_model.add_output("peripheral", saturable_clearance)
+    q = test_model.periodic_steady_state(1, t0=20.5)
+    long_run = test_model.solve(np.arange(0.5, 81.0), [0, 0], method="LSODA")
+    assert long_run.y[:, -1] == pytest.approx(q, rel=1e-2)
+
+
+def test_periodic_steady_state_boluses():
+    from pkmodel.dosing import DosingSchedule
+
+    test_model = two_compartment()
+    schedule = DosingSchedule().add_regimen("main", 1, 0, 2, 100)
+    q = test_model.periodic_steady_state(2, schedule=schedule)
+    one_period = test_model.solve([0, 1, 2], q, engine="analytic", schedule=schedule)
+    # The state returned is the one before the bolus, which is applied at either end of the period
+    assert one_period.y[:, -1] == pytest.approx(q + [1, 0])
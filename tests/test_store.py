@@ -0,0 +1,62 @@
+# This sets up unit tests to be run with pytest on store.py
+
+import pytest
+import numpy as np
+
+
+def two_compartments():
+    from pkmodel.pk_model import PKModel
+
+    test_model = PKModel()
+    test_model.create_model("main", 1)
+    test_model.add_sibling("main", "peripheral", 0.5, connection_time_constant=0.5)
+    return test_model
+
+
+def test_save_and_select(tmp_path):
+    from pkmodel.store import save_solution, StoredSolution
+
+    test_model = two_compartments()
+    solution = test_model.solve(np.linspace(0, 5, 51), [0, 0])
+    save_solution(str(tmp_path / "run"), solution, test_model.get_compartment_names, test_model, {"patient": "A"})
+
+    stored = StoredSolution(str(tmp_path / "run"))
+    assert isinstance(stored.y, np.memmap)
+    assert stored.metadata["complete"] and stored.metadata["metadata"] == {"patient": "A"}
+    assert np.array_equal(stored["peripheral"], solution.y[1])
+
+    selected = stored.select(["peripheral"], t_start=1, t_stop=2)
+    assert np.allclose(selected.t, np.linspace(1, 2, 11))
+    assert np.array_equal(selected.y, solution.y[1:, 10:21])
+    assert stored.model().parameters == test_model.parameters
+
+
+def test_stream_to_store(tmp_path):
+    from pkmodel.store import SolutionWriter, StoredSolution
+
+    test_model = two_compartments()
+    t_eval = np.linspace(0, 5, 51)
+    with SolutionWriter(str(tmp_path / "run"), test_model.get_compartment_names, t_eval) as writer:
+        for chunk in test_model.solve_stream(t_eval, [0, 0], chunk_size=20, engine="analytic"):
+            writer.write(chunk)
+        with pytest.raises(ValueError):
+            writer.write(chunk)
+
+    stored = StoredSolution(str(tmp_path / "run"))
+    assert stored.metadata["complete"] and stored.metadata["model"]["spec"] is None
+    assert np.allclose(stored.y, test_model.solve(t_eval, [0, 0], engine="analytic").y)
+    with pytest.raises(ValueError):
+        stored.model()
+
+
+def test_population_store(tmp_path):
+    from pkmodel.store import save_solution, StoredSolution
+
+    test_model = two_compartments()
+    table = np.array([[1.0], [2.0], [3.0]])
+    population = test_model.solve_population(table, np.linspace(0, 5, 51), [0, 0], parameter_names=["main.volume"])
+    save_solution(str(tmp_path / "population"), population, test_model.get_compartment_names)
+
+    stored = StoredSolution(str(tmp_path / "population"))
+    assert stored["main"].shape == (3, 51)
+    assert np.array_equal(stored.select(["main"], t_stop=1).y, population.y[:, :1, :11])
@@ -0,0 +1,50 @@
+# This sets up unit tests to be run with pytest on streaming.py
+
+import pytest
+import numpy as np
+import scipy.integrate
+
+
+def dosed_model():
+    from pkmodel.pk_model import PKModel
+    from pkmodel.functions import dose_steady
+
+    test_model = PKModel()
+    test_model.create_model("main", 1, dosing_func=dose_steady, dosing_time_windows=[(0, 0.5), (3, 3.5)])
+    test_model.add_sibling("main", "peripheral", 0.5, connection_time_constant=0.5)
+    return test_model
+
+
+@pytest.mark.parametrize("engine", ["numerical", "analytic"])
+def test_stream_chunks(engine):
+    from pkmodel.dosing import DosingSchedule
+    from pkmodel.streaming import RunningSummary
+
+    test_model = dosed_model()
+    t_eval = np.linspace(0, 10, 101)
+    # Boluses on chunk boundaries must be applied exactly once
+    schedule = DosingSchedule().add_bolus("main", 1, 2.2).add_bolus("peripheral", 0.5, 4)
+    full = test_model.solve(t_eval, [0, 0], engine=engine, schedule=schedule)
+    # The integrator restarts at chunk boundaries, so only the analytic engine reproduces the full solve exactly
+    atol = 1e-3 if engine == "numerical" else 1e-10
+
+    summary = RunningSummary(test_model.get_compartment_names)
+    chunks = list(test_model.solve_stream(t_eval, [0, 0], chunk_size=23, engine=engine, schedule=schedule, summary=summary))
+    assert len(chunks) == 5
+    assert np.array_equal(np.concatenate([c.t for c in chunks]), t_eval)
+    assert np.allclose(np.concatenate([c.y for c in chunks], axis=1), full.y, atol=atol)
+
+    assert summary.count == len(t_eval)
+    assert np.allclose(summary.auc, scipy.integrate.trapezoid(full.y, t_eval, axis=1), atol=atol)
+    assert np.allclose(summary.maximum, full.y.max(axis=1), atol=atol)
+    assert np.allclose(summary.mean * 10, summary.auc)
+    assert summary.as_dict()["main"]["t_max"] == t_eval[np.argmax(full.y[0])]
+
+
+def test_stream_downsample():
+    test_model = dosed_model()
+    t_eval = np.linspace(0, 10, 101)
+    chunks = list(test_model.solve_stream(t_eval, [0, 0], chunk_size=30, downsample=7))
+    assert np.array_equal(np.concatenate([c.t for c in chunks]), t_eval[::7])
+    with pytest.raises(ValueError):
+        next(test_model.solve_stream(t_eval, [0, 0], chunk_size=1))
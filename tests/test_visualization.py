@@ -8,3 +8,37 @@ def test_plot():
     model_out = test_model.solve(np.linspace(0, 1, 1000), np.array([0.0]))
     plot_solution(model_out, test_model.get_compartment_names, testing=True)
     assert True
+
+
+def test_decimate():
+    from pkmodel.pkanalysis import decimate
+    import numpy as np
+
+    y = np.sin(np.linspace(0, 20, 100001))
+    y[31337] = 5
+    index = decimate(y, 200)
+    assert len(index) <= 202 and index[0] == 0 and index[-1] == len(y) - 1
+    # Extremes survive, including a single spike
+    assert 31337 in index
+    assert y[index].min() == y.min()
+    assert np.array_equal(decimate(y[:50], 200), np.arange(50))
+
+
+def test_plot_to_file(tmp_path):
+    from pkmodel.pkanalysis import plot_solution
+    from pkmodel.pk_model import PKModel
+    import numpy as np
+
+    test_model = PKModel()
+    test_model.create_model("central", 1)
+    test_model.add_sibling("central", "peripheral", 2)
+    names = test_model.get_compartment_names
+    t_eval = np.linspace(0, 5, 20001)
+    figure = plot_solution(test_model.solve(t_eval, np.zeros(2)), names, filename=tmp_path / "single.png")
+    assert (tmp_path / "single.png").exists()
+    assert all(len(line.get_xdata()) < 2000 for line in figure.axes[0].get_lines())
+
+    population = test_model.solve_population(np.array([[1.0], [2.0], [3.0]]), t_eval, np.zeros(2), ["central.volume"])
+    figure = plot_solution(population, names, filename=tmp_path / "population.png")
+    assert (tmp_path / "population.png").exists()
+    assert len(figure.axes[0].collections) == 2